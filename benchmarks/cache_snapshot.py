@@ -0,0 +1,85 @@
+"""
+Cache Hit Copy Benchmark
+========================
+
+Measures what one `CacheManager.get_or_fetch` hit costs on an L1-sized frame:
+the old `deepcopy` of the cached frame versus the copy-on-write snapshot handed
+out now. Reports latency per hit and the memory allocated per hit.
+
+Run from the repository root:
+    python -m benchmarks.cache_snapshot
+"""
+
+import asyncio
+import time
+import tracemalloc
+from copy import deepcopy
+
+import numpy as np
+import pandas as pd
+
+from cache import CacheManager
+from mappings import DEPS_MAPPING
+
+SIZES = [10_000, 100_000, 500_000]
+HITS = 50
+
+def make_l1_frame(n, seed=0):
+    """Frame with the columns and dtypes of l1_get_rawdata_cleaned"""
+    rng = np.random.default_rng(seed)
+    deps = rng.choice(np.array(list(DEPS_MAPPING.values())), size=n)
+    score = rng.integers(0, 40, size=n).astype(float)
+    return pd.DataFrame({
+        'rollNo': [f'SA{i:05d}A' for i in range(n)],
+        'candidateName': [f'Candidate {i // 3}' for i in range(n)],
+        'hallName': rng.choice(np.array(['Pune', 'Mumbai', 'Delhi']), size=n),
+        'courseName': deps,
+        'TotalCandidateScore': score,
+        'MaxPossibleScore': np.full(n, 40.0),
+        'ScorePercentage': score / 40 * 100,
+        'dep_prefix': deps,
+        'Employee Code': [f'GE00{i // 3}' for i in range(n)],
+        'batch_suffix': rng.choice(np.array(['Attempt 1', 'Attempt 2', 'Attempt 3']), size=n),
+    })
+
+async def measure(get):
+    """Average seconds and allocated bytes per awaited call of get()"""
+    start = time.perf_counter()
+    for _ in range(HITS):
+        await get()
+    seconds = (time.perf_counter() - start) / HITS
+
+    tracemalloc.start()
+    await get()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+async def main():
+    print(f"{'rows':>8} {'deepcopy ms/hit':>16} {'deepcopy MB/hit':>16} {'snapshot ms/hit':>16} {'snapshot MB/hit':>16}")
+    for n in SIZES:
+        frame = make_l1_frame(n)
+
+        async def l1_frame():
+            return frame
+
+        cache = CacheManager()
+        await cache.get_or_fetch(l1_frame)
+
+        async def deepcopy_hit():
+            return deepcopy(frame)
+
+        async def snapshot_hit():
+            return await cache.get_or_fetch(l1_frame)
+
+        deep_s, deep_b = await measure(deepcopy_hit)
+        snap_s, snap_b = await measure(snapshot_hit)
+        print(f"{n:>8} {deep_s * 1000:>16.2f} {deep_b / 2**20:>16.2f} {snap_s * 1000:>16.3f} {snap_b / 2**20:>16.3f}")
+
+        # A write through a snapshot must never reach the cached frame
+        snapshot = await cache.get_or_fetch(l1_frame)
+        snapshot.loc[:, 'TotalCandidateScore'] = -1
+        assert (frame['TotalCandidateScore'] >= 0).all()
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""
+Result Conversion Benchmark
+===========================
+
+Compares the two ways `PGSQLData.execute_query` can turn fetched records into a
+DataFrame on a dashboard-shaped result: the old one dict per row
+(`pd.DataFrame([dict(r) for r in rows])`) versus the columnar `records_to_frame`.
+Records are simulated (asyncpg Records cannot be constructed outside a query), with
+scores as Decimal like Postgres numeric columns.
+
+Run from the repository root:
+    python -m benchmarks.columnar_fetch
+"""
+
+import time
+import tracemalloc
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from data_retrieval import records_to_frame
+from mappings import DEPS_MAPPING
+
+SIZES = [10_000, 100_000, 500_000]
+REPEATS = 3
+COLUMNS = ['rollNo', 'candidateName', 'hallName', 'courseName', 'examDate',
+           'TotalCandidateScore', 'MaxPossibleScore', 'ScorePercentage',
+           'projectMasterId', 'candidateId']
+
+class FakeRecord(tuple):
+    """Tuple that also supports the mapping protocol dict() uses on asyncpg Records"""
+    index = {name: i for i, name in enumerate(COLUMNS)}
+
+    def keys(self):
+        return COLUMNS
+
+    def __getitem__(self, key):
+        return tuple.__getitem__(self, self.index[key] if isinstance(key, str) else key)
+
+def make_records(n, seed=0):
+    rng = np.random.default_rng(seed)
+    deps = rng.choice(np.array(list(DEPS_MAPPING)), size=n)
+    halls = rng.choice(np.array(['Pune', 'Mumbai', 'Delhi']), size=n)
+    scores = rng.integers(0, 40, size=n)
+    attempted = rng.random(n) > 0.1
+    rows = []
+    for i in range(n):
+        score = Decimal(int(scores[i])) if attempted[i] else None
+        rows.append(FakeRecord((
+            f'{deps[i]}{i // 3:05d}A', f'Candidate {i // 3}', str(halls[i]), f'{deps[i]} Course', None,
+            score, Decimal(40) if attempted[i] else None, score / 40 * 100 if attempted[i] else None,
+            i % 50, i // 3,
+        )))
+    return rows
+
+def measure(convert, rows):
+    """Best seconds over REPEATS and peak allocated bytes of convert(rows)"""
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        convert(rows)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    frame = convert(rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, frame
+
+def main():
+    print(f"{'rows':>8} {'dicts s':>9} {'dicts MB':>9} {'columnar s':>11} {'columnar MB':>12} {'speedup':>8}")
+    for n in SIZES:
+        rows = make_records(n)
+        dict_s, dict_b, by_dicts = measure(lambda rows: pd.DataFrame([dict(r) for r in rows]), rows)
+        col_s, col_b, columnar = measure(records_to_frame, rows)
+        print(f"{n:>8} {dict_s:>9.3f} {dict_b / 2**20:>9.1f} {col_s:>11.3f} {col_b / 2**20:>12.1f} {dict_s / col_s:>7.1f}x")
+
+        # Same frame, except that scores are now float64 instead of Decimal objects
+        assert list(columnar.columns) == list(by_dicts.columns)
+        assert (columnar.dtypes[['TotalCandidateScore', 'MaxPossibleScore', 'ScorePercentage']] == np.float64).all()
+        pd.testing.assert_frame_equal(columnar, by_dicts.astype(columnar.dtypes.to_dict()))
+
+if __name__ == '__main__':
+    main()
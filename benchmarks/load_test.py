@@ -0,0 +1,328 @@
+"""
+HTTP Load Test on Synthetic Data
+================================
+
+Replays a weighted mix of Grafana panel queries (/data) and report card downloads
+(/pdf_data) against the Quart app, with benchmarks/synthetic.py standing in for the
+database, and reports latency percentiles and throughput per concurrency level.
+
+Modes:
+- inprocess (default): requests go through Quart's test client on the app's own event
+  loop (no sockets), with the app's startup/shutdown hooks running as in production.
+- hypercorn: the app is served by Hypercorn in a child process on a local port and
+  driven over HTTP with httpx, so client work never runs on the server's loop.
+
+Each concurrency level runs a closed loop of virtual dashboards for --duration seconds,
+long enough to cross the background L1 refreshes and the L2 memo expiry. Every second
+the run also scrapes /metrics, so the per-second timeline shows the latency spikes next
+to the cache fetches and event-loop lag that cause them. The highest throughput whose
+p99 stays within --slo is reported as the sustainable RPS.
+
+Run from the repository root:
+    python -m benchmarks.load_test [--mode hypercorn] [--concurrency 1 8 32] [--duration 45]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+# The load test authenticates with its own key, never the configured datasource key
+LOAD_TEST_KEY = 'volt-load-test'
+CANDIDATES = 10_000
+CONCURRENCY = [1, 8, 32]
+DURATION_SECONDS = 45
+SLO_P99_SECONDS = 1.0
+PORT = 3099
+
+# (weight, route, function, parameter generator) - roughly what an open dashboard asks for
+QUERY_MIX = [
+    (10, '/data', 'l2_get_stats_main', lambda sample: {}),
+    (8, '/data', 'l2_get_citywise_barchart', lambda sample: {}),
+    (8, '/data', 'l2_pass_fail_pending_count', lambda sample: {}),
+    (6, '/data', 'l2_departmentwise_average_scores', lambda sample: {}),
+    (6, '/data', 'l2_status_wise_grid', lambda sample: {'attempts': 'Attempt 1|Final'}),
+    (4, '/data', 'l2_score_wise_grid', lambda sample: {'attempts': 'Attempt 1|Final Score', 'format': 'Percentage'}),
+    (6, '/data', 'l2_get_stats_city', lambda sample: {'city': sample('city')}),
+    (6, '/data', 'l2_get_dashboard_data_for_dep', lambda sample: {'chosen_dep': sample('department')}),
+    (4, '/data', 'l2_get_candidate_names', lambda sample: {'dep': sample('department')}),
+    (8, '/data', 'l2_get_trainee_score_matrix', lambda sample: {'user_id': sample('employee')}),
+    (4, '/data', 'l2_get_trainee_name_from_id', lambda sample: {'user_id': sample('employee')}),
+    (2, '/pdf_data', 'report_card_trainee', lambda sample: {'user_id': sample('employee')}),
+]
+
+class InProcessClient:
+    """Quart test client on the app's event loop"""
+
+    def __init__(self, app):
+        self.app = app
+        self.client = app.test_client()
+
+    async def get(self, path, query_string):
+        response = await self.client.get(path, query_string=query_string,
+                                         headers={'Authorization': f'Bearer {LOAD_TEST_KEY}'})
+        body = await response.get_data()
+        return response.status_code, body
+
+class HTTPClient:
+    """httpx client for a server on a local port"""
+
+    def __init__(self, base_url):
+        import httpx
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=None,
+                                        headers={'Authorization': f'Bearer {LOAD_TEST_KEY}'},
+                                        limits=httpx.Limits(max_connections=None))
+
+    async def get(self, path, query_string):
+        response = await self.client.get(path, params=query_string)
+        return response.status_code, response.content
+
+    async def close(self):
+        await self.client.aclose()
+
+def make_sampler(data, seed=0):
+    """sample(kind) -> a random city, department or employee code present in the synthetic data"""
+    from data_preprocessing.first_layer_fns import clean_rawdata
+
+    cleaned = clean_rawdata(data)
+    values = {
+        'city': sorted(cleaned['hallName'].dropna().unique()),
+        'department': sorted(cleaned['dep_prefix'].dropna().unique()),
+        'employee': cleaned['Employee Code'].drop_duplicates().tolist(),
+    }
+    rng = random.Random(seed)
+    return lambda kind: rng.choice(values[kind])
+
+def make_query(sample, rng):
+    """(route, fn, query string) of the next request in the mix"""
+    weights = [weight for weight, *_ in QUERY_MIX]
+    _, route, fn, params = rng.choices(QUERY_MIX, weights=weights)[0]
+    query_string = {'fn': fn, 'params': json.dumps(params(sample))}
+    if route == '/pdf_data':
+        query_string['format'] = 'binary'
+    return route, fn, query_string
+
+def parse_metrics(text):
+    """Cache fetches and event-loop lag out of a /metrics scrape"""
+    def value(name):
+        match = re.search(rf'^{name} (\S+)$', text, re.MULTILINE)
+        return float(match.group(1)) if match else 0.0
+    return {'cache_fetches': value('volt_cache_fetches_total'),
+            'loop_lag_seconds': value('volt_event_loop_lag_last_seconds')}
+
+async def run_level(client, sample, concurrency, duration_seconds, seed=0):
+    """
+    Closed loop of `concurrency` virtual dashboards for duration_seconds.
+
+    Returns:
+        (samples, probes) - samples are (start offset, fn, status, seconds) per request,
+        probes (offset, parsed /metrics) once a second
+    """
+    samples = []
+    probes = []
+    started = time.perf_counter()
+    deadline = started + duration_seconds
+
+    async def dashboard(index):
+        rng = random.Random(seed * 1000 + index)
+        while time.perf_counter() < deadline:
+            route, fn, query_string = make_query(sample, rng)
+            request_started = time.perf_counter()
+            try:
+                status, _ = await client.get(route, query_string)
+            except Exception:
+                status = 0  # Connection error
+            samples.append((request_started - started, fn, status, time.perf_counter() - request_started))
+
+    async def probe():
+        while time.perf_counter() < deadline:
+            offset = time.perf_counter() - started
+            status, body = await client.get('/metrics', {})
+            if status == 200:
+                probes.append((offset, parse_metrics(body.decode())))
+            await asyncio.sleep(max(0.0, 1.0 - (time.perf_counter() - started - offset)))
+
+    await asyncio.gather(probe(), *(dashboard(index) for index in range(concurrency)))
+    return samples, probes
+
+def percentiles(seconds):
+    if not len(seconds):
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None}
+    p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'max': float(np.max(seconds))}
+
+def summarize(samples, probes, duration_seconds):
+    """Overall and per-function latency, throughput and the per-second timeline of one level"""
+    ok = [s for s in samples if s[2] == 200]
+    latencies = np.array([s[3] for s in ok])
+    by_fn = {}
+    for _, fn, status, seconds in samples:
+        entry = by_fn.setdefault(fn, {'requests': 0, 'errors': 0, 'seconds': []})
+        entry['requests'] += 1
+        entry['errors'] += status != 200
+        if status == 200:
+            entry['seconds'].append(seconds)
+
+    timeline = []
+    previous_fetches = probes[0][1]['cache_fetches'] if probes else 0.0
+    probe_at = {int(offset): metrics for offset, metrics in probes}
+    for second in range(int(duration_seconds)):
+        in_second = np.array([s[3] for s in ok if second <= s[0] < second + 1])
+        metrics = probe_at.get(second, {})
+        fetches = metrics.get('cache_fetches', previous_fetches)
+        timeline.append({'second': second, 'requests': len(in_second), **percentiles(in_second),
+                         'cache_fetches': fetches - previous_fetches,
+                         'loop_lag_seconds': metrics.get('loop_lag_seconds')})
+        previous_fetches = fetches
+
+    return {
+        'requests': len(samples),
+        'errors': len(samples) - len(ok),
+        'rps': len(ok) / duration_seconds,
+        **percentiles(latencies),
+        'functions': {fn: {'requests': entry['requests'], 'errors': entry['errors'], **percentiles(np.array(entry['seconds']))}
+                      for fn, entry in sorted(by_fn.items())},
+        'timeline': timeline,
+    }
+
+def ms(seconds):
+    return '-' if seconds is None else f'{seconds * 1000:.1f}'
+
+def print_level(concurrency, summary):
+    print(f"\n=== {concurrency} concurrent dashboards: {summary['rps']:.1f} req/s, "
+          f"p50 {ms(summary['p50'])} ms, p99 {ms(summary['p99'])} ms, max {ms(summary['max'])} ms, "
+          f"{summary['errors']} errors")
+    print(f"{'function':<36} {'requests':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for fn, entry in summary['functions'].items():
+        print(f"{fn:<36} {entry['requests']:>8} {ms(entry['p50']):>8} {ms(entry['p99']):>8} {ms(entry['max']):>8}")
+
+    # Per-second timeline; spikes line up with cache fetches (L1 refresh, L2 expiry) and loop lag
+    print(f"{'second':>6} {'req':>5} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'fetches':>8} {'lag ms':>7}")
+    p99s = [row['p99'] for row in summary['timeline'] if row['p99'] is not None]
+    spike = 2 * float(np.median(p99s)) if p99s else None
+    for row in summary['timeline']:
+        marker = ' <- spike' if spike and row['p99'] is not None and row['p99'] > spike else ''
+        print(f"{row['second']:>6} {row['requests']:>5} {ms(row['p50']):>8} {ms(row['p99']):>8} {ms(row['max']):>8} "
+              f"{row['cache_fetches']:>8.0f} {ms(row['loop_lag_seconds']):>7}{marker}")
+
+async def warm_up(client, sample):
+    """One request of every kind, so the first level does not time the initial L1 build"""
+    for _, route, fn, params in QUERY_MIX:
+        query_string = {'fn': fn, 'params': json.dumps(params(sample))}
+        await client.get(route, query_string)
+
+async def run_levels(client, sample, levels, duration_seconds):
+    await warm_up(client, sample)
+    results = {}
+    for concurrency in levels:
+        samples, probes = await run_level(client, sample, concurrency, duration_seconds)
+        results[concurrency] = summarize(samples, probes, duration_seconds)
+        print_level(concurrency, results[concurrency])
+    return results
+
+async def run_inprocess(data, levels, duration_seconds):
+    from benchmarks.synthetic import install
+    install(data)
+    from flask_app import app
+
+    async with app.test_app() as test_app:
+        return await run_levels(InProcessClient(test_app), make_sampler(data), levels, duration_seconds)
+
+def serve_synthetic(candidates, port, stop):
+    """Child process: serve the app with Hypercorn on synthetic data until stop is set"""
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+    from benchmarks.synthetic import install, make_dashboard_data
+
+    install(make_dashboard_data(candidates))
+    from flask_app import app
+
+    config = Config()
+    config.bind = [f'127.0.0.1:{port}']
+    config.accesslog = None
+    asyncio.run(serve(app, config, shutdown_trigger=lambda: asyncio.to_thread(stop.wait)))
+
+async def wait_for_port(port, timeout_seconds=120):
+    deadline = time.monotonic() + timeout_seconds
+    while True:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+async def run_hypercorn(data, candidates, levels, duration_seconds, port):
+    context = multiprocessing.get_context('spawn')
+    stop = context.Event()
+    server = context.Process(target=serve_synthetic, args=(candidates, port, stop))
+    server.start()
+    client = None
+    try:
+        await wait_for_port(port)
+        client = HTTPClient(f'http://127.0.0.1:{port}')
+        return await run_levels(client, make_sampler(data), levels, duration_seconds)
+    finally:
+        if client is not None:
+            await client.close()
+        stop.set()
+        await asyncio.to_thread(server.join, 30)
+        if server.is_alive():
+            server.terminate()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mode', choices=['inprocess', 'hypercorn'], default='inprocess')
+    parser.add_argument('--candidates', type=int, default=CANDIDATES, help='Synthetic candidate count')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=CONCURRENCY, help='Concurrent dashboards per level')
+    parser.add_argument('--duration', type=int, default=DURATION_SECONDS, help='Seconds per concurrency level')
+    parser.add_argument('--slo', type=float, default=SLO_P99_SECONDS, help='p99 latency limit (seconds) for the sustainable RPS')
+    parser.add_argument('--port', type=int, default=PORT, help='Local port in hypercorn mode')
+    parser.add_argument('--output', help='Write the full report (including timelines) to this JSON file')
+    args = parser.parse_args()
+
+    # Set before the app is imported (also inherited by the hypercorn child). The run keeps
+    # its files in a scratch directory and never restores or overwrites the server's snapshots
+    os.environ['GF_DATASOURCE_KEY'] = LOAD_TEST_KEY
+    os.environ['DISK_SNAPSHOTS'] = '0'
+    scratch_directory = tempfile.mkdtemp(prefix='volt_load_')
+    os.environ['PDF_CACHE_DIR'] = os.path.join(scratch_directory, 'report_cards')
+    os.environ['SHARED_CACHE_DIR'] = os.path.join(scratch_directory, 'shared_cache')
+
+    from benchmarks.synthetic import make_dashboard_data
+    data = make_dashboard_data(args.candidates)
+    try:
+        if args.mode == 'hypercorn':
+            results = asyncio.run(run_hypercorn(data, args.candidates, args.concurrency, args.duration, args.port))
+        else:
+            results = asyncio.run(run_inprocess(data, args.concurrency, args.duration))
+    finally:
+        shutil.rmtree(scratch_directory, ignore_errors=True)
+
+    sustainable = [(summary['rps'], concurrency) for concurrency, summary in results.items()
+                   if summary['p99'] is not None and summary['p99'] <= args.slo and not summary['errors']]
+    print()
+    if sustainable:
+        rps, concurrency = max(sustainable)
+        print(f"Max sustainable throughput (p99 <= {args.slo * 1000:.0f} ms): {rps:.1f} req/s at {concurrency} dashboards")
+    else:
+        print(f"No level kept p99 within {args.slo * 1000:.0f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'mode': args.mode, 'candidates': args.candidates, 'duration_seconds': args.duration,
+                       'levels': {str(concurrency): summary for concurrency, summary in results.items()}}, f, indent=2)
+        print(f"Report written to {args.output}")
+
+if __name__ == '__main__':
+    main()
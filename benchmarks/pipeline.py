@@ -0,0 +1,274 @@
+"""
+Pipeline Benchmark on Synthetic Data
+====================================
+
+Times every L1 dataset function, every registered L2 function and `report_card_trainee`
+against synthetic dashboard data (see benchmarks/synthetic.py) at several candidate
+counts, without Postgres.
+
+- L1 functions are timed cold: a full fetch and rebuild on every repeat (the L1 inputs
+  they read from the cache stay cached, so each one is timed on its own work).
+- L2 functions are timed on a cache miss with the L1 datasets cached, which is what a
+  panel pays after each refresh.
+- report_card_trainee is timed with an empty PDF cache (rendered in render_pool) and
+  again as a PDF cache hit.
+- The incremental refresh is checked: after CHANGED_SCORES score changes the merged wide
+  matrix must equal a full rebuild (the run stops with an AssertionError otherwise).
+
+Results (best and mean of REPEATS, per function and size) go to a JSON file tagged with
+the current commit; pass an earlier file as --baseline to compare.
+
+Run from the repository root:
+    python -m benchmarks.pipeline [--sizes 1000 10000] [--output FILE] [--baseline FILE]
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import HALLS, install, make_dashboard_data
+from cache import cache_manager
+from data_preprocessing import first_layer_fns
+from data_preprocessing.main import *
+from pdf_cache import pdf_cache
+from registry import function_registry
+from render_pool import render_pool
+
+SIZES = [1_000, 10_000, 100_000]
+REPEATS = 3
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+# Flagged against the baseline when this much slower, and by at least this many seconds (ms timings are noisy)
+REGRESSION_RATIO = 1.2
+REGRESSION_MIN_SECONDS = 0.005
+# Exam rows given new scores by the incremental refresh check
+CHANGED_SCORES = 50
+
+L1_FUNCTIONS = [l1_get_rawdata_cleaned, l1_get_userid_name_mapping, l1_get_proper_dashboard_data_unprocessed,
+                l1_get_lookup_indexes, l1_get_score_tensor, l1_get_aggregate_cube]
+
+def l2_params(raw):
+    """Representative parameters of the registered functions that take any"""
+    trainee = raw.iloc[0]
+    department = raw['dep_prefix'].iloc[0]
+    return {
+        'l2_get_dashboard_data_citylevel': {'city': HALLS[0]},
+        'l2_get_stats_city': {'city': HALLS[0]},
+        'l2_get_coursewise_barchart': {'city': HALLS[0]},
+        'l2_score_wise_grid': {'attempts': 'Attempt 1|Final Score', 'format': 'Percentage'},
+        'l2_status_wise_grid': {'attempts': 'Attempt 1|Final'},
+        'l2_overall_score_distribution': {'dep': department},
+        'l2_get_dashboard_data_for_dep': {'chosen_dep': department},
+        'l2_get_candidate_names': {'dep': department},
+        'l2_get_trainee_score_matrix': {'user_id': trainee['Employee Code']},
+        'l2_get_trainee_name_from_id': {'user_id': trainee['Employee Code']},
+        'l2_get_trainee_id_from_name': {'candidate': trainee['candidateName']},
+        'report_card_trainee': {'user_id': trainee['Employee Code']},
+    }
+
+def reset_l1(func):
+    """Make the next call of an L1 function a full rebuild"""
+    state = first_layer_fns.incremental_state
+    if func is l1_get_rawdata_cleaned:
+        state['rawdata'] = None
+    state['changed_candidates'] = None
+
+def reset_l2():
+    """Drop every cached L2 result, keeping the L1 datasets"""
+    l1_names = {func.__name__ for func in L1_FUNCTIONS}
+    cache_manager.memo.clear()
+    for key in [key for key in list(cache_manager.cache.keys()) if key not in l1_names]:
+        cache_manager.cache.pop(key, None)
+
+def reset_pdf_cache(root):
+    """Point the PDF cache at a new empty directory under root"""
+    pdf_cache.directory = tempfile.mkdtemp(dir=root)
+    pdf_cache.entries = None
+
+async def measure(call, before=None):
+    """Best and mean seconds of REPEATS awaited calls, and the last result"""
+    timings = []
+    result = None
+    for _ in range(REPEATS):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        result = await call()
+        timings.append(time.perf_counter() - start)
+    return {'best_seconds': min(timings), 'mean_seconds': sum(timings) / len(timings)}, result
+
+def result_rows(result):
+    return len(result) if isinstance(result, (pd.DataFrame, pd.Series)) else None
+
+async def run_size(n, pdf_root):
+    """Timings of every function at n candidates: {function label: {best_seconds, mean_seconds, rows}}"""
+    data = make_dashboard_data(n)
+    install(data)
+    cache_manager.clear()
+    # Timings at large sizes outlast the default max age; nothing changes in between anyway
+    for func in L1_FUNCTIONS:
+        cache_manager.set_max_age(func, 24 * 3600)
+
+    timings = {}
+    for func in L1_FUNCTIONS:
+        timing, result = await measure(func, before=lambda: reset_l1(func))
+        # Cache the dataset (and its version) for the L1 functions and L2 functions that read it
+        cache_manager.invalidate(func)
+        await cache_manager.get_or_fetch(func)
+        timings[func.__name__] = {**timing, 'rows': result_rows(result)}
+
+    raw = await cache_manager.get_or_fetch(l1_get_rawdata_cleaned)
+    params = l2_params(raw)
+    for name, entry in function_registry.entries.items():
+        kwargs = params.get(name, {})
+        missing = [param for param in entry['required'] if param not in kwargs]
+        if missing:
+            raise ValueError(f"No benchmark parameters for {name}: {', '.join(missing)} (add them to l2_params)")
+
+        try:
+            if entry['kind'] == 'pdf':
+                timing, result = await measure(lambda: function_registry.call(entry, kwargs),
+                                               before=lambda: (reset_l2(), reset_pdf_cache(pdf_root)))
+                timings[name] = {**timing, 'rows': None, 'bytes': len(result)}
+                timing, _ = await measure(lambda: function_registry.call(entry, kwargs), before=reset_l2)
+                timings[f'{name} (pdf cache hit)'] = {**timing, 'rows': None, 'bytes': len(result)}
+            else:
+                timing, result = await measure(lambda: function_registry.call(entry, kwargs), before=reset_l2)
+                timings[name] = {**timing, 'rows': result_rows(result)}
+        except Exception as e:
+            # A failing function is recorded, the rest are still timed
+            timings[name] = {'error': f'{type(e).__name__}: {e}'}
+
+    return {'input_rows': len(data), 'functions': timings}
+
+async def check_incremental(n):
+    """
+    Change CHANGED_SCORES exam scores after a full build, refresh incrementally (turned on for
+    the check) and check the wide matrix against a full rebuild from the same rows.
+
+    Returns:
+        {'changed_rows', 'changed_candidates'} of the check
+
+    Raises:
+        AssertionError: The incrementally merged matrix differs from the full rebuild
+    """
+    data = make_dashboard_data(n)
+    client = install(data)
+    cache_manager.clear()
+    incremental_enabled = first_layer_fns.INCREMENTAL_REFRESH_ENABLED
+    first_layer_fns.INCREMENTAL_REFRESH_ENABLED = True
+    try:
+        return await _check_incremental(data, client, n)
+    finally:
+        first_layer_fns.INCREMENTAL_REFRESH_ENABLED = incremental_enabled
+
+async def _check_incremental(data, client, n):
+    await cache_manager.refresh(l1_get_rawdata_cleaned)
+    await cache_manager.refresh(l1_get_proper_dashboard_data_unprocessed)
+
+    rng = np.random.default_rng(n)
+    started = np.flatnonzero(data['MaxPossibleScore'].notna().to_numpy())
+    positions = rng.choice(started, size=min(CHANGED_SCORES, len(started)), replace=False)
+    client.change_scores(positions, np.floor(rng.random(len(positions)) * (data['MaxPossibleScore'].iloc[positions].to_numpy() + 1)))
+
+    await cache_manager.refresh(l1_get_rawdata_cleaned)
+    state = first_layer_fns.incremental_state
+    assert state['incremental_refreshes'] == 1, 'the raw data was not refreshed incrementally'
+    changed_candidates = len(state['changed_candidates'])
+    incremental = await cache_manager.refresh(l1_get_proper_dashboard_data_unprocessed)
+
+    reset_l1(l1_get_rawdata_cleaned)
+    await cache_manager.refresh(l1_get_rawdata_cleaned)
+    full = await cache_manager.refresh(l1_get_proper_dashboard_data_unprocessed)
+    pd.testing.assert_frame_equal(incremental, full)
+    return {'changed_rows': len(positions), 'changed_candidates': changed_candidates}
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline):
+    """Print the timing ratio against a baseline results file, per size and function"""
+    print(f"\nAgainst {baseline.get('commit')} ({baseline.get('created')}):")
+    for size, sized in results['sizes'].items():
+        previous = baseline.get('sizes', {}).get(size)
+        if previous is None:
+            continue
+        for name, timing in sized['functions'].items():
+            before = previous['functions'].get(name)
+            if 'error' in timing or not before or not before.get('best_seconds'):
+                continue
+            ratio = timing['best_seconds'] / before['best_seconds']
+            slower = timing['best_seconds'] - before['best_seconds']
+            flag = '🔺' if ratio > REGRESSION_RATIO and slower > REGRESSION_MIN_SECONDS else ''
+            print(f"{size:>8} {name:<50} {before['best_seconds']:>9.4f}s -> {timing['best_seconds']:>9.4f}s {ratio:>6.2f}x {flag}")
+
+async def run(sizes):
+    results = {
+        'benchmark': 'pipeline',
+        'commit': current_commit(),
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'render_workers': render_pool.max_workers,
+        'repeats': REPEATS,
+        'sizes': {},
+    }
+    pdf_directory = pdf_cache.directory
+    pdf_root = tempfile.mkdtemp(prefix='volt_bench_pdf_')
+    render_pool.start()
+    try:
+        for n in sizes:
+            sized = await run_size(n, pdf_root)
+            sized['incremental_check'] = await check_incremental(n)
+            results['sizes'][str(n)] = sized
+            print(f"\n{n} candidates ({sized['input_rows']} rows)")
+            print(f"{'function':<50} {'best s':>9} {'mean s':>9} {'rows':>8}")
+            for name, timing in sized['functions'].items():
+                if 'error' in timing:
+                    print(f"{name:<50} ❌ {timing['error']}")
+                    continue
+                rows = '' if timing['rows'] is None else timing['rows']
+                print(f"{name:<50} {timing['best_seconds']:>9.4f} {timing['mean_seconds']:>9.4f} {rows:>8}")
+            check = sized['incremental_check']
+            print(f"Incremental refresh of {check['changed_rows']} changed scores ({check['changed_candidates']} candidates) matches a full rebuild")
+    finally:
+        await render_pool.shutdown()
+        pdf_cache.directory, pdf_cache.entries = pdf_directory, None
+        shutil.rmtree(pdf_root, ignore_errors=True)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='Candidate counts')
+    parser.add_argument('--output', help='Results JSON file (default: benchmarks/results/pipeline-<commit>.json)')
+    parser.add_argument('--baseline', help='Earlier results JSON file to compare against')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.sizes))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"pipeline-{results['commit'] or 'nocommit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+if __name__ == '__main__':
+    main()
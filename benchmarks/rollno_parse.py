@@ -0,0 +1,54 @@
+"""
+Roll Number Parsing Micro-Benchmark
+===================================
+
+Compares the legacy per-row `apply(lambda ... re.sub(...))` parsing of `rollNo`
+against the vectorized `parse_roll_numbers` used by `l1_get_rawdata_cleaned`.
+
+Run from the repository root:
+    python -m benchmarks.rollno_parse
+"""
+
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_preprocessing.first_layer_fns import parse_roll_numbers
+from mappings import DEPS_MAPPING, dummy_rollno_prefixes
+
+SIZES = [10_000, 100_000, 1_000_000]
+
+def make_roll_numbers(n, seed=0):
+    """Random roll numbers shaped like production ones: <dep prefix><5 digits><A|B|C>"""
+    rng = np.random.default_rng(seed)
+    prefixes = np.array(list(DEPS_MAPPING) + dummy_rollno_prefixes)
+    prefix = rng.choice(prefixes, size=n)
+    number = pd.Series(rng.integers(1, 99_999, size=n)).astype(str).str.zfill(5)
+    suffix = rng.choice(np.array(['A', 'B', 'C']), size=n)
+    return pd.Series(prefix) + number + pd.Series(suffix)
+
+def legacy_parse(roll_no):
+    """Original three per-row passes from l1_get_rawdata_cleaned"""
+    dep_prefix = roll_no.apply(lambda x:re.sub(r'(?=\d).*$', '', x))
+    employee_code = roll_no.apply(lambda x: "GE00" + re.sub(r"\D+", "", x).lstrip('0') if re.sub(r"\D+", "", x) else "GE00")
+    batch_suffix = roll_no.apply(lambda x:re.sub(r'(?=\d).*$', '', x[::-1])[::-1])
+    return pd.DataFrame({'dep_prefix': dep_prefix, 'Employee Code': employee_code, 'batch_suffix': batch_suffix})
+
+def best_of(fn, arg, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(arg)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+if __name__ == '__main__':
+    print(f"{'rows':>10} {'legacy (s)':>12} {'vectorized (s)':>15} {'speedup':>8}")
+    for n in SIZES:
+        roll_no = make_roll_numbers(n)
+        legacy_time, legacy = best_of(legacy_parse, roll_no)
+        vector_time, vector = best_of(parse_roll_numbers, roll_no)
+        assert legacy.equals(vector), 'vectorized parse diverged from legacy parse'
+        print(f"{n:>10} {legacy_time:>12.3f} {vector_time:>15.3f} {legacy_time / vector_time:>7.1f}x")
@@ -0,0 +1,149 @@
+"""
+Synthetic Dashboard Data
+========================
+
+Deterministic stand-in for the production database, for benchmarks that run the real
+L1/L2 pipeline without Postgres.
+
+`make_dashboard_data` returns a frame shaped like the `retrieve_dashboard_data` result
+(same columns and dtypes as `PGSQLData.execute_query` produces): every candidate sits
+1-5 departments from `DEPS_MAPPING`, each in 1-3 attempts (rollNo suffixes A/B/C),
+with hall names, per-department max marks and NULL scores for exams not started. The
+dummy employees and dummy roll number prefixes the pipeline filters out are included.
+
+`FakePGSQLData` serves such a frame for the queries `l1_get_rawdata_cleaned` runs,
+including the incremental ones after `change_scores`; `install` makes the shared
+`pg_client` answer from one.
+"""
+
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from data_retrieval import COLUMN_DTYPES, PGSQLData
+from mappings import DEPS_MAPPING, dummy_data_employees, dummy_rollno_prefixes, rollno_suffix_mapping
+
+HALLS = ['Pune', 'Mumbai', 'Delhi', 'Nagpur', 'Bengaluru', 'Hyderabad']
+MAX_MARKS = [20.0, 25.0, 40.0]
+NOT_STARTED_RATE = 0.12  # Share of exams with NULL scores
+EXAM_DATE = datetime.date(2025, 1, 6)
+WATERMARK = pd.Timestamp('2025-01-31 18:00:00')
+
+def make_dashboard_data(n_candidates, seed=0):
+    """
+    Args:
+        n_candidates: Number of (real) candidates
+        seed: Random seed; the same arguments always give the same frame
+
+    Returns:
+        DataFrame with the retrieve_dashboard_data columns, one row per exam attempt
+    """
+    rng = np.random.default_rng(seed)
+    prefixes = np.array(list(DEPS_MAPPING))
+    suffixes = np.array(list(rollno_suffix_mapping))
+    max_marks = rng.choice(MAX_MARKS, size=len(prefixes))
+
+    # Candidate x department enrolment: 1-5 departments each, 1-3 attempts per department
+    departments_taken = rng.integers(1, 6, size=n_candidates)
+    order = np.argsort(rng.random((n_candidates, len(prefixes))), axis=1)
+    enrolled = order < departments_taken[:, None]
+    candidate, department = np.nonzero(enrolled)
+    attempts = rng.integers(1, len(suffixes) + 1, size=len(candidate))
+    candidate = np.repeat(candidate, attempts)
+    department = np.repeat(department, attempts)
+    attempt = np.arange(len(candidate)) - np.repeat(np.cumsum(attempts) - attempts, attempts)
+
+    width = max(5, len(str(n_candidates)))
+    hall = rng.integers(0, len(HALLS), size=n_candidates)
+    marks = max_marks[department]
+    started = rng.random(len(candidate)) >= NOT_STARTED_RATE
+    score = np.floor(rng.random(len(candidate)) * (marks + 1))
+    score = np.where(started, score, np.nan)
+
+    df = pd.DataFrame({
+        'rollNo': [f'{prefixes[d]}{c + 1:0{width}d}{suffixes[a]}' for c, d, a in zip(candidate, department, attempt)],
+        'candidateName': [f'Candidate {c + 1:0{width}d}' for c in candidate],
+        'hallName': np.array(HALLS, dtype=object)[hall[candidate]],
+        'courseName': [f'{DEPS_MAPPING[prefixes[d]]} {rollno_suffix_mapping[suffixes[a]]}' for d, a in zip(department, attempt)],
+        'examDate': [EXAM_DATE + datetime.timedelta(days=7 * int(a)) for a in attempt],
+        'TotalCandidateScore': score,
+        'MaxPossibleScore': np.where(started, marks, np.nan),
+        'ScorePercentage': score / marks * 100,
+        'projectMasterId': department * len(suffixes) + attempt + 1,
+        'candidateId': candidate + 1,
+    })
+
+    # Rows the pipeline must drop: dummy employees and dummy roll number prefixes
+    dummies = [(f'SA{n_candidates + 1 + i:0{width}d}A', name) for i, name in enumerate(dummy_data_employees)]
+    dummies += [(f'{prefix}{1:0{width}d}A', f'Dummy {prefix}') for prefix in dummy_rollno_prefixes]
+    dummy_rows = pd.DataFrame({
+        'rollNo': [roll_no for roll_no, _ in dummies],
+        'candidateName': [name for _, name in dummies],
+        'hallName': HALLS[0],
+        'courseName': 'Sales Attempt 1',
+        'examDate': EXAM_DATE,
+        'TotalCandidateScore': 1.0,
+        'MaxPossibleScore': 20.0,
+        'ScorePercentage': 5.0,
+        'projectMasterId': 0,
+        'candidateId': np.arange(len(dummies)) + n_candidates + 1,
+    })
+
+    df = pd.concat([df, dummy_rows], ignore_index=True)
+    return df.astype({name: dtype for name, dtype in COLUMN_DTYPES.items() if name in df})
+
+class FakePGSQLData(PGSQLData):
+    """PGSQLData answering the dashboard queries from a synthetic frame (unchanged between refreshes unless change_scores is called)"""
+
+    def __init__(self, data, watermark=WATERMARK):
+        super().__init__()
+        self.pool = object()  # Stops l1_get_rawdata_cleaned from creating a real pool
+        self.data = data
+        self.watermark = watermark
+        self.updated_at = np.full(len(data), watermark.to_datetime64())  # rawScore."updatedAt" of every row
+
+    def change_scores(self, positions, scores):
+        """
+        Give the rows at positions new scores, as a rawScore update after the current watermark.
+
+        Args:
+            positions: Row positions in data
+            scores: New TotalCandidateScore of each row (the percentage follows MaxPossibleScore)
+        """
+        self.watermark += pd.Timedelta(minutes=1)
+        columns = [self.data.columns.get_loc(name) for name in ('TotalCandidateScore', 'ScorePercentage')]
+        self.data.iloc[positions, columns[0]] = scores
+        self.data.iloc[positions, columns[1]] = scores / self.data['MaxPossibleScore'].iloc[positions].to_numpy() * 100
+        self.updated_at[positions] = self.watermark
+
+    async def execute_query(self, query, *args):
+        if '"watermark"' in query:
+            return pd.DataFrame({'watermark': [self.watermark]})
+        if '"updatedAt" >' in query:
+            # Incremental refresh: the score groups with a row updated after the given watermark
+            group_cols = ['projectMasterId', 'candidateId']
+            groups = self.data.loc[self.updated_at > args[0], group_cols].drop_duplicates()
+            if query.lstrip().startswith('select distinct'):
+                return groups.reset_index(drop=True)
+            changed = pd.MultiIndex.from_frame(self.data[group_cols]).isin(pd.MultiIndex.from_frame(groups))
+            return self.data[changed].reset_index(drop=True)
+        return self.data.copy()
+
+def install(data):
+    """
+    Serve data to the L1 functions instead of Postgres. The shared pg_client is patched in
+    place (flask_app holds it too, and would otherwise open a real pool on startup).
+
+    Returns:
+        The FakePGSQLData answering the queries
+    """
+    from data_preprocessing import first_layer_fns
+
+    client = FakePGSQLData(data)
+    first_layer_fns.pg_client.pool = client.pool
+    first_layer_fns.pg_client.execute_query = client.execute_query
+    for key in first_layer_fns.incremental_state:
+        first_layer_fns.incremental_state[key] = None
+    first_layer_fns.incremental_state['incremental_refreshes'] = 0
+    return client
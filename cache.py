@@ -6,72 +6,339 @@ Caching Layer for Database Queries
 Provides thread-safe caching with expiration for expensive database operations.
 Uses double-checked locking pattern to prevent cache stampede.
 Uses function name as cache key for automatic key management.
+
+Cached values are handed out as copy-on-write snapshots: pandas copy-on-write is
+enabled globally, so a shallow copy shares the cached data and any write through it
+copies only what is written. Callers may freely modify what they get back without
+touching the cached frame, and hits no longer pay for a deep copy.
+
+Parameterized (layer 2) functions are memoized on function name plus normalized
+arguments. Each memoized result remembers the versions of the cache entries it was
+computed from, so it is only served while that underlying L1 data is unchanged.
+
+Inside `with cache_manager.pinned():` every entry is read at most once: the first
+version seen is pinned for the rest of the block (and for tasks started in it), so a
+group of calls - e.g. one dashboard's panels - is answered from one consistent L1
+snapshot even if a background refresh lands halfway through.
 """
 
 import asyncio
+import contextlib
+import contextvars
+import functools
+import inspect
+import itertools
+import pandas as pd
 from expiringdict import ExpiringDict
-from copy import deepcopy
+
+# Snapshots below rely on copy-on-write semantics for every frame derived from a cached one
+pd.set_option('mode.copy_on_write', True)
+
+# Collects the cache keys (and their versions) read while computing an entry
+_dependency_recorder = contextvars.ContextVar('cache_dependency_recorder', default=None)
+# key -> (version, value) of every entry read inside a pinned() block
+_pinned_entries = contextvars.ContextVar('cache_pinned_entries', default=None)
+
+def _snapshot(value):
+    """Read-only handle on a cached value - a shallow, copy-on-write copy for pandas objects"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    return value
+
+def _freeze(value):
+    """Make argument values hashable so they can be part of a cache key"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
 
 class CacheManager:
-    def __init__(self, max_len=100, max_age_seconds=20):
+    def __init__(self, max_len=100, max_age_seconds=20, memo_max_len=1000):
         self.cache = ExpiringDict(max_len=max_len, max_age_seconds=max_age_seconds)
+        # Parameterized results live apart so per-user keys never evict the L1 datasets
+        self.memo = ExpiringDict(max_len=memo_max_len, max_age_seconds=max_age_seconds)
+        self.max_age_seconds = max_age_seconds
+        self.max_ages = {}  # function name -> max age overriding max_age_seconds (see set_max_age)
         self.cache_locks = {}  # Stores per-key locks
         self.global_lock = asyncio.Lock()  # Protects lock creation
+        self.versions = {}  # key -> version of the currently cached value
+        self.dependencies = {}  # key -> {dependency key: version it was computed from}
+        self._version_counter = itertools.count(1)
+        self._signatures = {}  # fetch_func -> inspect.Signature, resolved once per function
+        self.loaders = {}  # L1 function name -> async callable filling its entry instead (see set_loader)
+        self.cache_stats = {
+            'hits': 0,             # Served from the cache without waiting
+            'pinned_hits': 0,      # Served from a pinned() block
+            'misses': 0,           # Not servable on the fast path
+            'lock_waits': 0,       # Misses that found another coroutine fetching the same key
+            'hits_after_wait': 0,  # ... and were then served what it fetched
+            'fetches': 0,
+        }
+
+    def make_key(self, fetch_func, *args, **kwargs):
+        """
+        Build the cache key for a call.
+        Functions without parameters are keyed by name (as before); others by name plus
+        their bound arguments with defaults applied, so f(1), f(x=1) and f(1, y=None) share a key.
+        """
+        if fetch_func not in self._signatures:
+            self._signatures[fetch_func] = inspect.signature(fetch_func)
+        bound = self._signatures[fetch_func].bind(*args, **kwargs)
+        bound.apply_defaults()
+        if not bound.arguments:
+            return fetch_func.__name__
+        return (fetch_func.__name__,) + tuple((name, _freeze(value)) for name, value in bound.arguments.items())
+
+    def set_max_age(self, func_or_name, max_age_seconds):
+        """
+        Override how long entries of one function stay servable (e.g. the stale limit of a
+        dataset kept fresh by the background refresher).
+        """
+        name = func_or_name.__name__ if callable(func_or_name) else func_or_name
+        self.max_ages[name] = max_age_seconds
+        # The dicts expire on their own clock, so it must run at least as long as the longest override
+        for store in (self.cache, self.memo):
+            store.max_age = max(store.max_age, max_age_seconds)
+
+    def set_loader(self, func_or_name, loader):
+        """
+        Fill a parameterless function's entry from loader() instead of calling the function,
+        e.g. from a snapshot another process published. None restores the function itself.
+        """
+        name = func_or_name.__name__ if callable(func_or_name) else func_or_name
+        if loader is None:
+            self.loaders.pop(name, None)
+        else:
+            self.loaders[name] = loader
+
+    def _store(self, key):
+        return self.cache if isinstance(key, str) else self.memo
 
-    async def get_or_fetch(self, fetch_func):
+    def _max_age(self, key):
+        name = key if isinstance(key, str) else key[0]
+        return self.max_ages.get(name, self.max_age_seconds)
+
+    def _lookup(self, key):
+        """
+        (True, value) if key is cached, younger than its max age and every entry it was
+        computed from still holds the same version; (False, None) otherwise.
+        Inside pinned(), dependencies must match their pinned versions instead, and the
+        ones not pinned yet get pinned at the version this entry was computed from.
+        """
+        value, age = self._store(key).get(key, with_age=True)
+        if age is None or age >= self._max_age(key):
+            return False, None
+        pinned = _pinned_entries.get()
+        to_pin = {}
+        for dep_key, version in self.dependencies.get(key, {}).items():
+            if pinned is not None and dep_key in pinned:
+                if pinned[dep_key][0] != version:
+                    return False, None
+                continue
+            if self.versions.get(dep_key) != version:
+                return False, None
+            found, dep_value = self._lookup(dep_key)
+            if not found:
+                return False, None
+            to_pin[dep_key] = (version, dep_value)
+        if pinned is not None:
+            for dep_key, entry in to_pin.items():
+                pinned.setdefault(dep_key, entry)
+        return True, value
+
+    def _hit(self, key, value, version):
+        """Record the read (dependency recorder, pinned block) and hand out a snapshot"""
+        recorder = _dependency_recorder.get()
+        if recorder is not None:
+            recorder[key] = version
+        pinned = _pinned_entries.get()
+        if pinned is not None:
+            pinned.setdefault(key, (version, value))
+        return _snapshot(value)
+
+    def is_current(self, func_or_name):
+        """
+        Whether the running computation read the current version of a parameterless entry.
+        False when it was answered from an older version pinned by pinned(): a result
+        computed from it is not cached, so it must not update state kept for the next one.
+        """
+        key = func_or_name.__name__ if callable(func_or_name) else func_or_name
+        recorder = _dependency_recorder.get()
+        if recorder is not None and key in recorder:
+            return recorder[key] == self.versions.get(key)
+        pinned = _pinned_entries.get()
+        if pinned is not None and key in pinned:
+            return pinned[key][0] == self.versions.get(key)
+        return True
+
+    @contextlib.contextmanager
+    def pinned(self):
+        """
+        Answer every read in the block (and in tasks created inside it) from the first
+        version of each entry seen in the block. Nested blocks share the outer pin.
+        """
+        if _pinned_entries.get() is not None:
+            yield
+            return
+        token = _pinned_entries.set({})
+        try:
+            yield
+        finally:
+            _pinned_entries.reset(token)
+
+    async def _get_lock(self, key):
+        # ⚠️ GLOBAL LOCK - Protects per-key lock creation
+        async with self.global_lock:
+            # Get or create the per-key lock safely
+            if key not in self.cache_locks:
+                self.cache_locks[key] = asyncio.Lock()
+            return self.cache_locks[key]
+
+    async def _fetch_and_store(self, key, fetch_func, args, kwargs):
+        """
+        Run fetch_func (caller holds the per-key lock), cache its result under a new version.
+        Returns (data, version); version is None when the result was not cached.
+        """
+        loader = self.loaders.get(key) if isinstance(key, str) else None
+        recorder = {}
+        token = _dependency_recorder.set(recorder)
+        try:
+            data = await (loader() if loader is not None else fetch_func(*args, **kwargs))
+        finally:
+            _dependency_recorder.reset(token)
+
+        # Computed inside pinned() from inputs that have since been refreshed: only good
+        # for this pinned block, so it is not cached for everyone else
+        if any(self.versions.get(dep_key) != version for dep_key, version in recorder.items()):
+            return data, None
+
+        # The cached object itself, from the same inputs (e.g. an incremental refresh that found
+        # nothing new): it keeps its version, so entries computed from it stay valid
+        if key in self.versions and self._store(key).get(key) is data and self.dependencies.get(key) == recorder:
+            version = self.versions[key]
+        else:
+            version = next(self._version_counter)
+        self._store(key)[key] = data
+        self.versions[key] = version
+        self.dependencies[key] = recorder
+        self._prune()
+        return data, version
+
+    async def get_or_fetch(self, fetch_func, *args, **kwargs):
         """
         Retrieve data from cache or fetch using provided async function.
-        Uses function name as the cache key.
+        Uses function name (plus normalized arguments, if any) as the cache key.
+        Identical concurrent calls share one in-flight fetch through the per-key lock.
         
         Args:
             fetch_func: Async callable that fetches data if cache miss.
+            *args, **kwargs: Arguments passed through to fetch_func.
             
         Returns:
             Cached or freshly fetched data
         """
-        # Use function name as cache key
-        key = fetch_func.__name__
+        key = self.make_key(fetch_func, *args, **kwargs)
+
+        # 📌 PINNED - Already read in this pinned() block
+        pinned = _pinned_entries.get()
+        if pinned is not None and key in pinned:
+            self.cache_stats['pinned_hits'] += 1
+            version, data = pinned[key]
+            return self._hit(key, data, version)
         
         # ✅ FIRST CHECK (No Lock) - Fast path for cache hits
-        if key in self.cache:
+        found, data = self._lookup(key)
+        if found:
             # print(f"✅ Cache hit for {key} - returning cached data")
-            return deepcopy(self.cache[key])
+            self.cache_stats['hits'] += 1
+            return self._hit(key, data, self.versions.get(key))
         
-        # ⚠️ GLOBAL LOCK - Protects per-key lock creation
-        async with self.global_lock:
-            # print(f"🔒 Acquired global lock for {key}")
-            
-            # Get or create the per-key lock safely
-            if key not in self.cache_locks:
-                self.cache_locks[key] = asyncio.Lock()
-                # print(f"🔑 Created new lock for key: {key}")
-            # else:
-                # print(f"🔑 Reusing existing lock for key: {key}")
-
-            lock = self.cache_locks[key]
-            # print(f"🔓 Released global lock for {key}")
+        self.cache_stats['misses'] += 1
+        lock = await self._get_lock(key)
+        waited = lock.locked()
+        if waited:
+            self.cache_stats['lock_waits'] += 1
         
         # ⚠️ PER-KEY LOCK - Only ONE coroutine per key can enter
         async with lock:
             # print(f"🔒 Acquired per-key lock for {key}")
             
             # ✅ DOUBLE-CHECK - Second cache check after acquiring lock
-            if key in self.cache:
+            if pinned is not None and key in pinned:
+                version, data = pinned[key]
+                return self._hit(key, data, version)
+            found, data = self._lookup(key)
+            if found:
                 # print(f"✅ Cache hit after lock (another coroutine cached it)")
-                return deepcopy(self.cache[key])
+                if waited:
+                    self.cache_stats['hits_after_wait'] += 1
+                return self._hit(key, data, self.versions.get(key))
             
             # 🔥 FETCH DATA - Only the FIRST coroutine reaches here
-            data = await fetch_func()
+            self.cache_stats['fetches'] += 1
+            data, version = await self._fetch_and_store(key, fetch_func, args, kwargs)
             # print(f'🔥 DATA FETCHED for {key}')
-            
-            # 💾 CACHE IT
+            return self._hit(key, data, version)
+
+    async def refresh(self, fetch_func, *args, **kwargs):
+        """
+        Re-fetch an entry and replace it, whether or not it is still cached.
+        Readers keep getting the previous value on the lock-free fast path until the new one
+        is stored; only cold callers (nothing servable cached) wait on the per-key lock.
+        An entry computed from other cache entries that all still hold the versions it was
+        computed from is not re-fetched (it would come out the same); its max age restarts.
+
+        Returns:
+            The new value
+        """
+        key = self.make_key(fetch_func, *args, **kwargs)
+        lock = await self._get_lock(key)
+        async with lock:
+            store = self._store(key)
+            value, age = store.get(key, with_age=True)
+            dependencies = self.dependencies.get(key)
+            if (age is not None and dependencies and key not in self.loaders
+                    and all(self.versions.get(dep_key) == version for dep_key, version in dependencies.items())):
+                store[key] = value
+                return value
+            data, _ = await self._fetch_and_store(key, fetch_func, args, kwargs)
+            return data
+
+    async def seed(self, fetch_func, data):
+        """
+        Cache data as a parameterless function's current value (under a new version) without
+        calling it, e.g. a snapshot restored from disk.
+        """
+        key = self.make_key(fetch_func)
+        lock = await self._get_lock(key)
+        async with lock:
             self.cache[key] = data
-            # print(f"💾 Cached data for {key}")
-            return deepcopy(self.cache[key])
+            self.versions[key] = next(self._version_counter)
+            self.dependencies[key] = {}
+
+    def memoize(self, func):
+        """Decorator that serves an async function through get_or_fetch, keyed on its arguments"""
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await self.get_or_fetch(func, *args, **kwargs)
+        return wrapper
+
+    def _prune(self):
+        """Drop bookkeeping (versions, dependencies, idle locks) of entries that expired or were evicted"""
+        if len(self.versions) <= 2 * (self.cache.max_len + self.memo.max_len):
+            return
+        for key in list(self.versions):
+            if not self._lookup(key)[0]:
+                self.versions.pop(key, None)
+                self.dependencies.pop(key, None)
+                lock = self.cache_locks.get(key)
+                if lock is not None and not lock.locked():
+                    del self.cache_locks[key]
 
     def invalidate(self, func_or_name):
         """
-        Remove specific key from cache.
+        Remove specific key from cache, including every memoized argument variant.
         
         Args:
             func_or_name: Function object or string name of function to invalidate
@@ -81,11 +348,40 @@ class CacheManager:
         if key in self.cache:
             del self.cache[key]
             # print(f"🗑️ Invalidated cache for {key}")
+        for memo_key in [k for k in self.memo.keys() if k[0] == key]:
+            self.memo.pop(memo_key, None)
+
+    def entry_sizes(self):
+        """
+        Shallow memory use in bytes of the cached L1 entries (by key) and of all memoized
+        results together. Object columns count their pointers only, which keeps this cheap
+        enough to run on every /metrics scrape.
+        """
+        def size(value):
+            if isinstance(value, pd.DataFrame):
+                return int(value.memory_usage(index=True, deep=False).sum())
+            if isinstance(value, pd.Series):
+                return int(value.memory_usage(index=True, deep=False))
+            if isinstance(value, (bytes, bytearray)):
+                return len(value)
+            return 0
+
+        entries = {key: size(value) for key, value in list(self.cache.items())}
+        memo_bytes = sum(size(value) for value in list(self.memo.values()))
+        return entries, memo_bytes
+
+    def stats(self):
+        """Hit/miss/stampede-wait counters and entry counts"""
+        return {'entries': len(self.cache), 'memo_entries': len(self.memo),
+                'locks': len(self.cache_locks), **self.cache_stats}
 
     def clear(self):
         """Clear entire cache."""
         self.cache.clear()
+        self.memo.clear()
         self.cache_locks.clear()
+        self.versions.clear()
+        self.dependencies.clear()
         # print("🗑️ Cache cleared")
 
 
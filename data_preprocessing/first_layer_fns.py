@@ -1,171 +1,529 @@
+import os
 import re
+import asyncpg
 import numpy as np
 
-from pgsql_async_client import get_pool
+from pgsql_async_client import init_pool
 from data_retrieval import *
 from mappings import *
 from queries import pgsql_queries
 import asyncio
 # from data_preprocessing.helper_fns import query_builder
 from cache import cache_manager
+from metrics import metrics
 
 pg_client = PGSQLData()
 
+# Regular roll numbers: <non-digit prefix><leading zeros><digits><non-digit suffix>, e.g. 'SA00123A'
+ROLLNO_PATTERN = r'^(?P<prefix>\D*)(?P<zeros>0*)(?P<digits>\d*)(?P<suffix>\D*)$'
+# Anything else (digits split by other characters): the body runs from the first to the last digit
+IRREGULAR_ROLLNO_PATTERN = r'^(?P<prefix>\D*)(?P<body>\d.*\d)(?P<suffix>\D*)$'
+
+def parse_roll_numbers(roll_no):
+    """
+    Split roll numbers (e.g. 'SA00123A') into department prefix, employee code and batch suffix
+    with a single vectorized regex pass.
+
+    Args:
+        roll_no: Series of roll number strings
+
+    Returns:
+        DataFrame (same index) with raw 'dep_prefix', 'Employee Code' and 'batch_suffix' columns
+    """
+    parts = roll_no.str.extract(ROLLNO_PATTERN)
+
+    irregular = parts['prefix'].isna() & roll_no.notna()
+    if irregular.any():
+        irregular_parts = roll_no[irregular].str.extract(IRREGULAR_ROLLNO_PATTERN)
+        irregular_parts['digits'] = irregular_parts['body'].str.replace(r'\D+', '', regex=True).str.lstrip('0')
+        parts.loc[irregular, ['prefix', 'digits', 'suffix']] = irregular_parts[['prefix', 'digits', 'suffix']]
+
+    # Roll numbers without any digit keep the whole string as both prefix and suffix
+    no_digits = parts['zeros'].eq('') & parts['digits'].eq('') & ~irregular
+    suffix = parts['suffix'].where(~no_digits, parts['prefix'])
+
+    return pd.DataFrame({'dep_prefix': parts['prefix'],
+                         'Employee Code': 'GE00' + parts['digits'],
+                         'batch_suffix': suffix}, index=roll_no.index)
+
+def clean_rawdata(df):
+    """Drop dummy rows and derive department, employee code and attempt from rollNo"""
+    roll_parts = parse_roll_numbers(df['rollNo'])
+    keep = ~df['candidateName'].isin(dummy_data_employees) & ~roll_parts['dep_prefix'].isin(dummy_rollno_prefixes)
+    df = df[keep].copy()
+    roll_parts = roll_parts[keep]
+
+    df['dep_prefix'] = roll_parts['dep_prefix'].map(DEPS_MAPPING)
+    df['Employee Code'] = roll_parts['Employee Code']
+    df['batch_suffix'] = roll_parts['batch_suffix'].map(rollno_suffix_mapping)
+    return df
+
+# Incremental refresh (INCREMENTAL_REFRESH=1): after a full fetch, refreshes only re-read the
+# (projectMasterId, candidateId) score groups whose rawScore rows changed since the watermark.
+# Changes outside rawScore (candidate, hall, projectMaster or examConfig edits) are picked up by a
+# full fetch every FULL_REFRESH_EVERY refreshes. Needs rawScore."updatedAt" and an index on it (see
+# queries.py); off by default, and turned off for the process if the database lacks the column.
+INCREMENTAL_REFRESH_ENABLED = os.getenv('INCREMENTAL_REFRESH', '0') == '1'
+FULL_REFRESH_EVERY = 20
+incremental_state = {
+    'rawdata': None,              # Last cleaned raw frame (the object cached for l1_get_rawdata_cleaned)
+    'watermark': None,            # max(rawScore."updatedAt") that 'rawdata' covers
+    'incremental_refreshes': 0,   # Incremental refreshes since the last full fetch
+    'changed_candidates': None,   # Candidates changed since 'matrix' was built (None = rebuild everything)
+    'matrix': None,               # Last l1_get_proper_dashboard_data_unprocessed result
+    'departments': None,
+    'max_marks': None,
+}
+
+async def merge_changed_score_groups(state, watermark):
+    """Cleaned raw rows of the last refresh with the score groups changed since its watermark re-read"""
+    previous = state['rawdata']
+    changed_groups, changed_rows = await asyncio.gather(
+        pg_client.execute_query(pgsql_queries['retrieve_changed_score_groups'], state['watermark']),
+        pg_client.execute_query(pgsql_queries['retrieve_dashboard_data_for_changed_groups'], state['watermark']),
+    )
+    state['incremental_refreshes'] += 1
+    if changed_groups.empty:
+        state['watermark'] = watermark
+        return previous
+
+    # Replace every row of a changed score group; groups that were deleted have no new row
+    group_cols = ['projectMasterId','candidateId']
+    replaced = pd.MultiIndex.from_frame(previous[group_cols]).isin(pd.MultiIndex.from_frame(changed_groups[group_cols]))
+    changed_rows = clean_rawdata(changed_rows) if not changed_rows.empty else previous.iloc[:0]
+    df = pd.concat([previous[~replaced], changed_rows], ignore_index=True)
+
+    changed_candidates = set(previous.loc[replaced, 'candidateName']) | set(changed_rows['candidateName'])
+    if state['changed_candidates'] is not None:
+        state['changed_candidates'] |= changed_candidates
+    state.update(rawdata=df, watermark=watermark)
+    return df
+
+@metrics.timed('l1_transform')
 async def l1_get_rawdata_cleaned():
-    pool = await get_pool()
-    pg_client.pool = pool
+    global INCREMENTAL_REFRESH_ENABLED
+    # Pool is owned by the app (before_serving); scripts outside the app create it lazily
+    if pg_client.pool is None:
+        pg_client.pool = await init_pool()
+    state = incremental_state
+
+    watermark = None
+    if INCREMENTAL_REFRESH_ENABLED:
+        try:
+            # Read the new watermark first: rows updated while we fetch are simply re-read next time
+            watermark = await pg_client.execute_query(pgsql_queries['retrieve_rawscore_watermark'])
+            watermark = watermark['watermark'].iloc[0] if len(watermark) else None
+            if state['rawdata'] is not None and state['watermark'] is not None and state['incremental_refreshes'] < FULL_REFRESH_EVERY:
+                return await merge_changed_score_groups(state, watermark)
+        except asyncpg.PostgresError as e:
+            if isinstance(e, asyncpg.UndefinedColumnError):
+                INCREMENTAL_REFRESH_ENABLED = False
+            print(f"⚠️ Incremental refresh failed, fetching all rows instead: {e}")
+            watermark = None
+
     query = pgsql_queries['retrieve_dashboard_data']
     df = await asyncio.gather(pg_client.execute_query(query))
     df = df[0]
     df = pd.DataFrame(df)
+    df = clean_rawdata(df)
 
-    df = df.query('`candidateName` != @dummy_data_employees').copy()
-
-    df['dep_prefix'] = df['rollNo'].apply(lambda x:re.sub(r'(?=\d).*$', '', x))
-    df = df.query('dep_prefix != @dummy_rollno_prefixes').copy()
-    df['dep_prefix'] = df['dep_prefix'].map(DEPS_MAPPING)
-    
-
-    # df['Employee Code'] = df['rollNo'].apply(lambda x:"GE00"+re.sub(r"\D+", "", x))
-    df['Employee Code'] = df['rollNo'].apply(lambda x: "GE00" + re.sub(r"\D+", "", x).lstrip('0') if re.sub(r"\D+", "", x) else "GE00")
-
-    df['batch_suffix'] = df['rollNo'].apply(lambda x:re.sub(r'(?=\d).*$', '', x[::-1])[::-1])
-    df['batch_suffix'] = df['batch_suffix'].map(rollno_suffix_mapping)
+    state.update(rawdata=df, watermark=watermark, incremental_refreshes=0, changed_candidates=None)
     return df
 
+@metrics.timed('l1_transform')
 async def l1_get_userid_name_mapping():
     df = await cache_manager.get_or_fetch(l1_get_rawdata_cleaned)
     return df[['candidateName','Employee Code']].drop_duplicates().reset_index(drop=True)
 
+STATUS_LABELS = np.array(['Pending', 'Not Attempted', 'Pass', 'Fail'], dtype=object)
+
+def pass_threshold(dep, attempt='Final'):
+    """Pass mark of one department's attempt (or 'Final' score) from pass_thresholds"""
+    threshold = pass_thresholds.get(dep, DEFAULT_PASS_THRESHOLD)
+    if isinstance(threshold, dict):
+        return threshold.get(attempt, DEFAULT_PASS_THRESHOLD)
+    return threshold
+
+def pass_fail_status(score_percent, threshold=DEFAULT_PASS_THRESHOLD):
+    """
+    Status of every score percentage in one pass over the column: 'Pending' (no score),
+    'Not Attempted' (0), 'Pass' (at least threshold) or 'Fail'.
+
+    Args:
+        score_percent: Series of score percentages (NaN/None when not scored)
+        threshold: Pass mark
+
+    Returns:
+        Series of status strings, same index
+    """
+    values = pd.to_numeric(score_percent, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    codes = np.select([np.isnan(values), values == 0, values >= threshold], [0, 1, 2], default=3)
+    return pd.Series(STATUS_LABELS[codes], index=score_percent.index, name=score_percent.name)
+
+def department_columns(dep):
+    """Ordered attempt, max marks and final score columns of one department in the wide matrix"""
+    columns = []
+    for attempt in rollno_suffix_mapping.values():
+        columns += [f'{dep} {attempt}', f'{dep} {attempt} %']
+    return columns + [f'{dep} Max Marks', f'{dep} Final Score', f'{dep} Final Score %']
+
+def department_status_columns(dep):
+    """Ordered attempt and final status columns of one department in the wide matrix"""
+    return [f'{dep} {attempt} Status' for attempt in rollno_suffix_mapping.values()] + [f'{dep} Final Status']
+
+def none_for_missing(df):
+    """Empty cells of the text (object) columns as None; numeric columns keep NaN and stay numeric"""
+    text = df.columns[df.dtypes == object]
+    if len(text):
+        df[text] = df[text].where(df[text].notna(), None)
+    return df
+
+def department_max_marks(df):
+    """
+    Max marks of every department: its first non-empty MaxPossibleScore, as a Series sorted
+    by department. Neither depends on row order, which incremental refreshes change.
+    """
+    return df.groupby('dep_prefix', sort=True)['MaxPossibleScore'].first()
+
+def build_wide_matrix(df, departments, max_marks=None):
+    """
+    Build the candidate x department x attempt matrix from cleaned raw rows.
+
+    Args:
+        df: Output of l1_get_rawdata_cleaned (or a subset of its rows)
+        departments: Department names to lay out, in display order
+        max_marks: Optional Series of max marks indexed by department; derived from df when omitted
+
+    Returns:
+        DataFrame with one row per candidate: identity columns, then per department the attempt
+        scores/percentages, max marks and final score, then statuses and pass/fail/pending totals.
+        Score columns are float64 (NaN when empty); empty text cells are None
+    """
+    if max_marks is None:
+        max_marks = department_max_marks(df)
+
+    # One groupby for both pivots - first non-null value per candidate and department/attempt
+    course_key = (df['dep_prefix'].astype(str) + '_' + df['batch_suffix'].astype(str)).rename('course_key')
+    pivoted = df.groupby([df['candidateName'], course_key])[['TotalCandidateScore','ScorePercentage']].first().unstack('course_key')
+    dep_score_cols = {dep: [col.replace('_',' ') for col in pivoted['TotalCandidateScore'].columns if col.startswith(f'{dep}_')] for dep in departments}
+    score_cols = pivoted['TotalCandidateScore'].rename(columns=lambda col: col.replace('_',' '))
+    percent_cols = pivoted['ScorePercentage'].rename(columns=lambda col: col.replace('_',' ') + ' %')
+
+    base = df.groupby('candidateName')[['Employee Code','hallName']].first()
+
+    layout = []
+    status_layout = []
+    columns = {}
+    for dep in departments:
+        final_score = score_cols[dep_score_cols[dep]].max(axis=1)
+        dep_max_marks = max_marks.get(dep)
+
+        for attempt in rollno_suffix_mapping.values():
+            score_col, percent_col = f'{dep} {attempt}', f'{dep} {attempt} %'
+            columns[score_col] = score_cols[score_col] if score_col in score_cols.columns else np.nan
+            columns[percent_col] = percent_cols[percent_col] if percent_col in percent_cols.columns else np.nan
+            if percent_col in percent_cols.columns:
+                columns[f'{dep} {attempt} Status'] = pass_fail_status(percent_cols[percent_col], pass_threshold(dep, attempt))
+            else:
+                columns[f'{dep} {attempt} Status'] = 'Pending'
+
+        columns[f'{dep} Max Marks'] = dep_max_marks
+        columns[f'{dep} Final Score'] = final_score
+        columns[f'{dep} Final Score %'] = final_score/dep_max_marks * 100
+        columns[f'{dep} Final Status'] = pass_fail_status(columns[f'{dep} Final Score %'], pass_threshold(dep))
+
+        layout += department_columns(dep)
+        status_layout += department_status_columns(dep)
+
+    # Pivot columns outside the known layout (e.g. unmapped prefixes/suffixes) keep their place after it
+    for col in list(score_cols.columns) + list(percent_cols.columns):
+        if col not in columns:
+            columns[col] = score_cols[col] if col in score_cols.columns else percent_cols[col]
+            layout.append(col)
+
+    # Built in one piece: adding hundreds of columns one by one fragments the frame
+    wide = pd.DataFrame(columns, index=base.index)[layout + status_layout]
+    final_status = wide[[f'{dep} Final Status' for dep in departments]]
+    totals = pd.DataFrame({
+        'Total Pass Departments': (final_status == 'Pass').sum(axis=1),
+        'Total Fail Departments': (final_status == 'Fail').sum(axis=1),
+        'Total Pending Departments': (final_status == 'Pending').sum(axis=1),
+    })
+    df = pd.concat([base, wide, totals], axis=1).reset_index()
+
+    return none_for_missing(df)
+
+def update_wide_matrix(matrix, df, candidates, departments, max_marks):
+    """
+    Re-derive only the given candidates' rows of a wide matrix from the current raw rows.
+
+    Returns:
+        Updated matrix (matrix itself when no candidate changed), or None when the rebuilt rows
+        no longer fit the matrix layout
+    """
+    if not candidates:
+        return matrix
+    kept = matrix[~matrix['candidateName'].isin(candidates)]
+    changed_raw = df[df['candidateName'].isin(candidates)]
+    if changed_raw.empty:
+        return kept.reset_index(drop=True)
+
+    rows = build_wide_matrix(changed_raw, departments, max_marks)
+    if not set(rows.columns) <= set(matrix.columns):
+        return None
+    rows = none_for_missing(rows.reindex(columns=matrix.columns).astype(matrix.dtypes.to_dict()))
+
+    return pd.concat([kept, rows]).sort_values('candidateName', kind='stable').reset_index(drop=True)
+
+@metrics.timed('l1_transform')
 async def l1_get_proper_dashboard_data_unprocessed():
     df = await cache_manager.get_or_fetch(l1_get_rawdata_cleaned)
+    state = incremental_state
 
     #Only allow those departments to show who have at least one submitted exam.
-    deps_mapping = {key:DEPS_MAPPING[key] for key in DEPS_MAPPING if DEPS_MAPPING[key] in df['dep_prefix'].unique()}
-
-    dep_wise_max_marks = df[['MaxPossibleScore','dep_prefix']].drop_duplicates().copy()
-    df['courseName_cleaned'] = df["dep_prefix"].astype(str) + "_" + df["batch_suffix"].astype(str)
-    df['courseName_cleaned_percent'] = df['courseName_cleaned'] + " %"
-    
-    score_cols = df.pivot(columns='courseName_cleaned', values='TotalCandidateScore').copy()
-    percent_cols = df.pivot(columns='courseName_cleaned_percent', values='ScorePercentage').copy()
-    df = df[[col for col in list(df.columns) if col not in ['dep_prefix','batch_suffix','courseName_cleaned','courseName','rollNo','examDate','TotalCandidateScore','ScorePercentage','courseName_cleaned_percent']]].copy()
-
-    df = pd.concat([df,score_cols,percent_cols],axis=1).copy()
-
-    df = df.groupby('candidateName').agg('first').reset_index()
-
-    
-    for dep in deps_mapping.values():
-        df[f'{dep} Max Marks'] = dep_wise_max_marks.query("dep_prefix == @dep").MaxPossibleScore.iloc[0]
-    for dep in deps_mapping.values():
-        df[f'{dep} Final Score'] = df[[col for col in df.columns if col.startswith(f'{dep}_') and '%' not in col]].max(axis=1).reset_index(drop=True)
-
-    for dep in deps_mapping.values():
-        df[f'{dep} Final Score %'] = df[f'{dep} Final Score']/df[f'{dep} Max Marks'] * 100
-
-    def pass_fail_fn(score_percent):
-        if np.isnan(score_percent):
-            return 'Pending'
-        if score_percent == 0:
-            return 'Not Attempted'
-        if score_percent>=75.0:
-            return 'Pass'
-        else:
-            return 'Fail'
-    
-    for dep in deps_mapping.values():
-        cols = [f'{dep}_Attempt 1 %',f'{dep}_Attempt 2 %',f'{dep}_Attempt 3 %',f'{dep} Final Score %']
-        status_cols = [f'{dep} Attempt 1 Status',f'{dep} Attempt 2 Status',f'{dep} Attempt 3 Status',f'{dep} Final Status']
-        for col,status_col in zip(cols,status_cols):
-            if col in df.columns:
-                df[status_col] = df[col].map(pass_fail_fn)
-            else:
-                df[col] = None
-                df[col.replace('%','').strip()] = None
-                df[status_col] = 'Pending'
-        
-
-    new_order = ['candidateName','Employee Code','hallName']
-
-    # Add department columns in order
-    columns = df.columns.tolist()
-    for dep in deps_mapping.values():
-        # Collect all columns for this department
-        dept_cols = {
-            'attempts': [],
-            'max_marks': None,
-            'final_score': None,
-            'final_score_pct': None,
-            'status' : None
-        }
-
-        for col in columns:
-            # Match attempt patterns
-            match = re.match(rf'^{dep}_Attempt (\d+)$', col)
-            if match:
-                attempt_num = int(match.group(1))
-                dept_cols['attempts'].append((attempt_num, col, None))
-
-            match = re.match(rf'^{dep}_Attempt (\d+) %$', col)
-            if match:
-                attempt_num = int(match.group(1))
-                # Find the corresponding attempt entry and update it
-                for i, (num, att_col, pct_col) in enumerate(dept_cols['attempts']):
-                    if num == attempt_num:
-                        dept_cols['attempts'][i] = (num, att_col, col)
-                        break
-                else:
-                    dept_cols['attempts'].append((attempt_num, None, col))
-
-            # Match Max Marks, Final Score, and Final Score %
-            if col == f'{dep} Max Marks':
-                dept_cols['max_marks'] = col
-            if col == f'{dep} Final Score':
-                dept_cols['final_score'] = col
-            if col == f'{dep} Final Score %':
-                dept_cols['final_score_pct'] = col
-            if col == f'{dep} Status':
-                dept_cols['status'] = col
-
-        # Sort attempts by attempt number
-        dept_cols['attempts'].sort(key=lambda x: x[0])
-
-        # Add attempts in order
-        for attempt_num, att_col, pct_col in dept_cols['attempts']:
-            if att_col:
-                new_order.append(att_col)
-            if pct_col:
-                new_order.append(pct_col)
-
-        # Add Max Marks, Final Score, Final Score %
-        if dept_cols['max_marks']:
-            new_order.append(dept_cols['max_marks'])
-        if dept_cols['final_score']:
-            new_order.append(dept_cols['final_score'])
-        if dept_cols['final_score_pct']:
-            new_order.append(dept_cols['final_score_pct'])
-        if dept_cols['status']:
-            new_order.append(dept_cols['status'])
-
-    # Add all remaining columns
-    for col in columns:
-        if col not in new_order:
-            new_order.append(col)
-    df = df[new_order].copy()
-
-    indiv_pass_fail_status = df[[item for item in new_order if 'Final Status' in item]].fillna('None')
-    indiv_pass_fail_status = indiv_pass_fail_status.replace('None',None)
-
-    indiv_pass_fail_status['Total Pending Departments'] = indiv_pass_fail_status.apply(lambda row: row.map({'Pending':True}).sum(),axis=1)
-    indiv_pass_fail_status['Total Fail Departments'] = indiv_pass_fail_status.apply(lambda row: row.map({'Fail':True}).sum(),axis=1)
-    indiv_pass_fail_status['Total Pass Departments'] = indiv_pass_fail_status.apply(lambda row: row.map({'Pass':True}).sum(),axis=1)
-
-    df = pd.concat([df,indiv_pass_fail_status[['Total Pass Departments','Total Fail Departments','Total Pending Departments']]],axis=1)
-
-    df = df.fillna('None')
-    df = df.replace('None',None)
-    df.drop('MaxPossibleScore',axis=1,inplace=True)
-    df.columns = [item.replace('_',' ') for item in df.columns.to_list()]
-
-    return df
\ No newline at end of file
+    present_deps = set(df['dep_prefix'].unique())
+    departments = [dep for dep in DEPS_MAPPING.values() if dep in present_deps]
+    max_marks = department_max_marks(df)
+
+    if not cache_manager.is_current(l1_get_rawdata_cleaned):
+        # Rows of an older refresh pinned by a batch: the result is only used by that batch,
+        # so it is built in full and the incremental state stays with the current rows
+        return build_wide_matrix(df, departments, max_marks)
+
+    matrix = None
+    # After incremental raw refreshes only the changed candidates' rows are rebuilt,
+    # as long as the department layout and max marks are unchanged
+    if (state['changed_candidates'] is not None and state['matrix'] is not None
+            and departments == state['departments'] and max_marks.equals(state['max_marks'])):
+        matrix = update_wide_matrix(state['matrix'], df, state['changed_candidates'], departments, max_marks)
+    if matrix is None:
+        matrix = build_wide_matrix(df, departments, max_marks)
+
+    state.update(matrix=matrix, departments=departments, max_marks=max_marks, changed_candidates=set())
+    return matrix
+
+# Columns of each L1 frame that request paths look single values up in
+LOOKUP_COLUMNS = {
+    'rawdata': ['candidateName', 'Employee Code', 'dep_prefix'],
+    'mapping': ['candidateName', 'Employee Code'],
+    'matrix': ['candidateName', 'Employee Code'],
+}
+
+def build_lookup_index(values):
+    """
+    Hash index of one column: every distinct value -> the positions of its rows.
+    Positions are stored grouped by value in one array (value i owns
+    positions[offsets[i]:offsets[i + 1]], ascending), so a snapshot stores the index as a few
+    arrays however many values there are. Nulls are left out.
+
+    Args:
+        values: Column (Series) to index
+
+    Returns:
+        {'keys': {value: i}, 'offsets': int64 array, 'positions': int64 array}
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    present = codes >= 0
+    positions = np.flatnonzero(present)
+    order = np.argsort(codes[present], kind='stable')
+    counts = np.bincount(codes[present], minlength=len(uniques))
+    offsets = np.zeros(len(uniques) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return {'keys': {key: i for i, key in enumerate(uniques.tolist())},
+            'offsets': offsets,
+            'positions': positions[order].astype(np.int64)}
+
+def lookup_positions(df, frame_index, column, key):
+    """
+    Positions (ascending) of the rows of df where df[column] == key, through an index of
+    l1_get_lookup_indexes instead of scanning the column.
+    Falls back to the scan when the index does not match df: a worker following shared
+    snapshots can briefly hold a frame and an index loaded from different refreshes.
+
+    Args:
+        df: L1 frame the index was built from
+        frame_index: That frame's entry of l1_get_lookup_indexes()
+        column: Indexed column
+        key: Value to look up
+    """
+    index = frame_index[column]
+    if frame_index['rows'] == len(df):
+        i = index['keys'].get(key)
+        if i is None:
+            return index['positions'][:0]
+        positions = index['positions'][index['offsets'][i]:index['offsets'][i + 1]]
+        if (df[column].iloc[positions] == key).all():
+            return positions
+    return np.flatnonzero((df[column] == key).to_numpy())
+
+def lookup_rows(df, frame_index, column, key):
+    """Rows of df where df[column] == key, in frame order (see lookup_positions)"""
+    return df.iloc[lookup_positions(df, frame_index, column, key)]
+
+def build_department_index(raw, matrix):
+    """
+    Department -> positions of the wide matrix rows of candidates with at least one raw row in
+    it, in the layout of build_lookup_index plus the candidate name of every position
+    ('candidates'), which lookup_department_positions checks the matrix against.
+
+    Args:
+        raw: Output of l1_get_rawdata_cleaned
+        matrix: Wide matrix built from raw (one row per candidate)
+    """
+    pairs = raw[['dep_prefix', 'candidateName']].dropna().drop_duplicates()
+    rows = pd.Index(matrix['candidateName']).get_indexer(pairs['candidateName'])
+    codes, uniques = pd.factorize(pairs['dep_prefix'][rows >= 0])
+    rows = rows[rows >= 0]
+    order = np.lexsort((rows, codes))
+    offsets = np.zeros(len(uniques) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=len(uniques)), out=offsets[1:])
+    positions = rows[order].astype(np.int64)
+    return {'keys': {key: i for i, key in enumerate(uniques.tolist())},
+            'offsets': offsets,
+            'positions': positions,
+            'candidates': matrix['candidateName'].to_numpy()[positions]}
+
+def lookup_department_positions(matrix, raw, indexes, dep):
+    """
+    Positions (ascending) of the wide matrix rows of candidates with at least one raw row in
+    department dep, through indexes['matrix']['dep_prefix'] instead of scanning the matrix.
+    Falls back to matching the candidate names of the department's raw rows when the index
+    does not match matrix (see lookup_positions).
+
+    Args:
+        matrix: Output of l1_get_proper_dashboard_data_unprocessed
+        raw: Output of l1_get_rawdata_cleaned
+        indexes: Output of l1_get_lookup_indexes
+        dep: Department name
+    """
+    index = indexes['matrix']['dep_prefix']
+    if indexes['matrix']['rows'] == len(matrix):
+        i = index['keys'].get(dep)
+        if i is None:
+            return index['positions'][:0]
+        start, end = index['offsets'][i], index['offsets'][i + 1]
+        positions = index['positions'][start:end]
+        if (matrix['candidateName'].to_numpy()[positions] == index['candidates'][start:end]).all():
+            return positions
+    dep_rows = lookup_rows(raw[['dep_prefix','candidateName']], indexes['rawdata'], 'dep_prefix', dep)
+    return np.flatnonzero(matrix['candidateName'].isin(dep_rows['candidateName']).to_numpy())
+
+@metrics.timed('l1_transform')
+async def l1_get_lookup_indexes():
+    """
+    Lookup indexes of the other L1 frames, rebuilt with them on every refresh:
+    {'rawdata' | 'mapping' | 'matrix': {'rows': frame length, <column>: build_lookup_index(column)}},
+    plus the department index of the matrix rows: indexes['matrix']['dep_prefix']
+    """
+    frames = {
+        'rawdata': await cache_manager.get_or_fetch(l1_get_rawdata_cleaned),
+        'mapping': await cache_manager.get_or_fetch(l1_get_userid_name_mapping),
+        'matrix': await cache_manager.get_or_fetch(l1_get_proper_dashboard_data_unprocessed),
+    }
+    indexes = {}
+    for name, df in frames.items():
+        indexes[name] = {'rows': len(df)}
+        for column in LOOKUP_COLUMNS[name]:
+            indexes[name][column] = build_lookup_index(df[column])
+    indexes['matrix']['dep_prefix'] = build_department_index(frames['rawdata'], frames['matrix'])
+    return indexes
+
+# Metric axis of the score tensor: report card matrix column -> wide matrix column after the department name
+SCORE_TENSOR_METRICS = {
+    'Attempt 1': 'Attempt 1',
+    'Attempt 1 %': 'Attempt 1 %',
+    'Attempt 2': 'Attempt 2',
+    'Attempt 2 %': 'Attempt 2 %',
+    'Attempt 3': 'Attempt 3',
+    'Attempt 3 %': 'Attempt 3 %',
+    'Final Score': 'Final Score',
+    'Final Score %': 'Final Score %',
+}
+
+@metrics.timed('l1_transform')
+async def l1_get_score_tensor():
+    """
+    Every trainee's report card matrix, precomputed from the wide matrix on every refresh.
+    Axis 0 follows the rows of l1_get_proper_dashboard_data_unprocessed; departments
+    without a column in the matrix are left out (8 bytes per candidate, department and metric).
+
+    Returns:
+        {'rows': matrix length, 'departments': [departments on axis 1],
+         'scores': float64 array (rows, departments, SCORE_TENSOR_METRICS), NaN when empty,
+         'status': int8 array (rows, departments) of STATUS_LABELS codes, -1 when empty}
+    """
+    matrix = await cache_manager.get_or_fetch(l1_get_proper_dashboard_data_unprocessed)
+    departments = [dep for dep in DEPS_MAPPING.values() if f'{dep} Final Status' in matrix.columns]
+
+    scores = np.full((len(matrix), len(departments), len(SCORE_TENSOR_METRICS)), np.nan)
+    status = np.full((len(matrix), len(departments)), -1, dtype=np.int8)
+    for d, dep in enumerate(departments):
+        for m, suffix in enumerate(SCORE_TENSOR_METRICS.values()):
+            column = f'{dep} {suffix}'
+            if column in matrix.columns:
+                scores[:, d, m] = pd.to_numeric(matrix[column], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        status[:, d] = pd.Categorical(matrix[f'{dep} Final Status'], categories=STATUS_LABELS).codes
+
+    return {'rows': len(matrix), 'departments': departments, 'scores': scores, 'status': status}
+
+def score_tensor_matrix(tensor, position):
+    """
+    Report card matrix of one trainee from the score tensor: the trainee_score_matrix layout
+    (one row per department in DEPS_MAPPING, object columns with None for empty cells).
+
+    Args:
+        tensor: l1_get_score_tensor() result
+        position: Trainee's row in the wide matrix, or None for an empty matrix
+    """
+    departments = list(DEPS_MAPPING.values())
+    scores = np.full((len(departments), len(SCORE_TENSOR_METRICS)), np.nan)
+    status = np.full(len(departments), -1, dtype=np.int8)
+    if position is not None:
+        rows = [departments.index(dep) for dep in tensor['departments']]
+        scores[rows] = tensor['scores'][position]
+        status[rows] = tensor['status'][position]
+
+    result = {'Department': departments}
+    for m, column in enumerate(SCORE_TENSOR_METRICS):
+        result[column] = [None if np.isnan(value) else value for value in scores[:, m].tolist()]
+    result['Status'] = [STATUS_LABELS[code] if code >= 0 else None for code in status.tolist()]
+    return pd.DataFrame(result, dtype=object)
+
+@metrics.timed('l1_transform')
+async def l1_get_aggregate_cube():
+    """
+    Aggregates behind the summary panels, rebuilt on every refresh (a few kilobytes):
+
+    - 'status': one row per hall x department x final status of the wide matrix, with the
+      number of candidates and the sum/count of their final scores; summary panels roll it
+      up over halls. Departments keep the matrix's order in 'departments'.
+    - Distinct counts and first-row counts do not roll up, so they are kept at the level
+      the panels read them: 'totals' (distinct departments, candidates and halls),
+      'halls' (per hall: distinct departments and candidates), 'hall_candidates' (candidates
+      counted by the hall of their first row) and 'hall_courses' (per hall and course:
+      candidates counted by their first row in that hall).
+    """
+    df = await cache_manager.get_or_fetch(l1_get_rawdata_cleaned)
+    matrix = await cache_manager.get_or_fetch(l1_get_proper_dashboard_data_unprocessed)
+
+    departments = [col[:-len(' Final Status')] for col in matrix.columns if col.endswith('Final Status')]
+    status = []
+    for dep in departments:
+        scores = pd.to_numeric(matrix[f'{dep} Final Score'], errors='coerce') if f'{dep} Final Score' in matrix.columns else pd.Series(np.nan, index=matrix.index)
+        groups = pd.DataFrame({'hallName': matrix['hallName'], 'status': matrix[f'{dep} Final Status'], 'score': scores})
+        grouped = groups.groupby(['hallName', 'status'], dropna=False)['score'].agg(['size', 'sum', 'count'])
+        grouped.columns = ['candidates', 'final_score_sum', 'final_score_count']
+        status.append(grouped.reset_index().assign(department=dep))
+    status = pd.concat(status, ignore_index=True) if status else pd.DataFrame(
+        columns=['hallName', 'status', 'candidates', 'final_score_sum', 'final_score_count', 'department'])
+
+    halls = df.groupby('hallName').agg(departments=('dep_prefix', 'nunique'), candidates=('candidateName', 'nunique'))
+    return {
+        'departments': departments,
+        'status': status,
+        'totals': {'departments': df['dep_prefix'].nunique(), 'candidates': df['candidateName'].nunique(),
+                   'halls': df['hallName'].nunique()},
+        'halls': halls,
+        'hall_candidates': df.drop_duplicates('candidateName').groupby('hallName').agg({'Employee Code':'count'}).reset_index(),
+        'hall_courses': df.drop_duplicates(['hallName','candidateName']).groupby(['hallName','courseName']).agg({'Employee Code':'count'}),
+    }
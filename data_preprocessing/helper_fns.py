@@ -1,7 +1,18 @@
 import functools
+import json
+import zipfile
+from datetime import date
+from decimal import Decimal
 from mappings import *
+import numpy as np
 import pandas as pd
 from jinja2 import Template
+from metrics import metrics
+
+try:
+    import orjson
+except ImportError:  # Optional: columnar responses fall back to the stdlib encoder
+    orjson = None
 
 def query_builder(template_string, **kwargs):
     """
@@ -25,27 +36,29 @@ def query_builder(template_string, **kwargs):
 
 #Pre-post processing wrapper for 2nd layer fns
 def pre_post_process(func):
-    """Decorator that adds pre and post processing around an async function"""
+    """Decorator that adds pre and post processing around an async function (timed as the l2_transform stage)"""
     
     @functools.wraps(func)
     async def wrapper(*args, **kwargs):
-        # ========== PRE-PROCESS STEPS ==========
-        #None yet
-        
-        # ========== EXECUTE MAIN FUNCTION ==========
-        try:
-            result = await func(*args, **kwargs)
-        except Exception as e:
-            print(f"❌ ERROR in {func.__name__}: {e}")
-            raise
-        
-        # ========== POST-PROCESS STEPS ==========
-        result.rename(dashboard_data_col_mapping,axis=1,inplace=True)
-        
-        return result
+        with metrics.stage('l2_transform', func.__name__):
+            # ========== PRE-PROCESS STEPS ==========
+            #None yet
+            
+            # ========== EXECUTE MAIN FUNCTION ==========
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                print(f"❌ ERROR in {func.__name__}: {e}")
+                raise
+            
+            # ========== POST-PROCESS STEPS ==========
+            result = result.rename(dashboard_data_col_mapping,axis=1)
+            
+            return result
     
     return wrapper
 
+@metrics.timed('serialize', own_name=False)
 def dataframe_to_json(df):
     """Convert pandas DataFrame to JSON format suitable for Grafana"""
     # Convert DataFrame to records (list of dictionaries)
@@ -56,11 +69,126 @@ def dataframe_to_json(df):
     for col in df_copy.select_dtypes(include=['datetime64']).columns:
         df_copy[col] = df_copy[col].dt.strftime('%Y-%m-%d')
     
-    # Convert any NaN values to None (which becomes null in JSON)
-    df_copy = df_copy.where(pd.notnull(df_copy), None)
+    # Convert any NaN values to None (which becomes null in JSON); numeric columns
+    # would keep NaN, so the cells are made objects first
+    df_copy = df_copy.astype(object).where(pd.notnull(df_copy), None)
     
     return df_copy.to_dict('records')
 
+def _json_default(value):
+    """Encode the non-JSON scalars that turn up in object columns"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _column_values(series):
+    """Grafana field type and JSON-ready values of one column, with NaN/NaT/NA as None"""
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        # Grafana time fields are epoch milliseconds (UTC for tz-aware columns), whatever the column's unit
+        values = series.dt.as_unit('ms').array.asi8.astype(object)
+        values[series.isna().to_numpy()] = None
+        return 'time', values.tolist()
+
+    kind = series.dtype.kind if isinstance(series.dtype, np.dtype) else None
+    if kind == 'b':
+        return 'boolean', series.to_numpy()
+    if kind in ('i', 'u'):
+        return 'number', np.ascontiguousarray(series.to_numpy())
+    if kind == 'f':
+        values = series.to_numpy()
+        if orjson is not None:
+            return 'number', np.ascontiguousarray(values)  # orjson writes NaN and inf as null
+        nulls = ~np.isfinite(values)
+        values = values.astype(object)
+        values[nulls] = None
+        return 'number', values.tolist()
+
+    # object and extension dtypes
+    values = series.to_numpy(dtype=object, na_value=None).tolist()
+    inferred = pd.api.types.infer_dtype(series, skipna=True)
+    if inferred in ('integer', 'floating', 'decimal', 'mixed-integer-float'):
+        return 'number', values
+    if inferred == 'boolean':
+        return 'boolean', values
+    return 'string', values
+
+@metrics.timed('serialize', own_name=False)
+def dataframe_to_columnar_frame(df):
+    """
+    A DataFrame as a Grafana data frame: field names once, one value array per column.
+    Columns are taken straight from their arrays (no copy of the frame, no per-row dicts).
+
+    Args:
+        df: DataFrame to encode
+
+    Returns:
+        {"schema": {"fields": [{"name", "type"}]}, "data": {"values": [[...], ...]}}, ready for encode_json
+    """
+    fields = []
+    values = []
+    for name, series in df.items():
+        field_type, column = _column_values(series)
+        fields.append({'name': str(name), 'type': field_type})
+        values.append(column if orjson is not None or not isinstance(column, np.ndarray) else column.tolist())
+
+    return {'schema': {'fields': fields}, 'data': {'values': values}}
+
+def encode_json(obj):
+    """JSON bytes of obj (may hold numpy arrays from dataframe_to_columnar_frame); uses orjson when installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=_json_default, separators=(',', ':')).encode('utf-8')
+
+def dataframe_to_columnar_json(df):
+    """Encode a DataFrame as Grafana data frame JSON bytes (see dataframe_to_columnar_frame)"""
+    return encode_json(dataframe_to_columnar_frame(df))
+
+class _ZipChunks:
+    """Write-only, unseekable file object for zipfile; stream_zip drains it after every entry"""
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+async def stream_zip(entries):
+    """
+    Stream a ZIP archive while its entries are produced. Only the entry being written is
+    held in memory; the archive itself never is.
+
+    Args:
+        entries: Async iterable of (file name, bytes)
+
+    Yields:
+        Chunks of the ZIP file
+    """
+    chunks = _ZipChunks()
+    # PDFs are already compressed, so entries are stored as-is
+    with zipfile.ZipFile(chunks, 'w', compression=zipfile.ZIP_STORED) as archive:
+        async for file_name, content in entries:
+            archive.writestr(file_name, content)
+            yield chunks.drain()
+    yield chunks.drain()  # Central directory
+
+async def iter_chunks(data, chunk_size=64 * 1024):
+    """Stream a bytes object in chunks without copying it whole (e.g. a rendered PDF)"""
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield bytes(view[start:start + chunk_size])
+
 def transform_to_matrix(df):
     """
     Transform the variable-value DataFrame into a matrix format
@@ -73,54 +201,25 @@ def transform_to_matrix(df):
     """
     # Extract department names
     departments = DEPS_MAPPING.values()
-    
-    # Initialize result dictionary
-    result = {
-        'Department': [],
-        'Attempt 1':[],
-        'Attempt 1 %': [],
-        'Attempt 2':[],
-        'Attempt 2 %': [],
-        'Attempt 3':[],
-        'Attempt 3 %': [],
-        'Final Score': [],
-        'Final Score %': [],
-        'Status': []
-    }
-    
-    # Process each department
-    for dept in departments:
-        result['Department'].append(dept)
-        
-        # Get Attempt 1 %
-        attempt1 = df[df['variable'] == f'{dept} Attempt 1']['value'].values
-        attempt1_per = df[df['variable'] == f'{dept} Attempt 1 %']['value'].values
-
-        result['Attempt 1'].append(attempt1[0] if len(attempt1) > 0 else None)
-        result['Attempt 1 %'].append(attempt1_per[0] if len(attempt1_per) > 0 else None)
 
-        # Get Attempt 2 %
-        attempt2 = df[df['variable'] == f'{dept} Attempt 2']['value'].values
-        attempt2_per = df[df['variable'] == f'{dept} Attempt 2 %']['value'].values
+    # First value of every variable, looked up per cell instead of filtering the frame per cell
+    first_values = df.drop_duplicates('variable').set_index('variable')['value']
 
-        result['Attempt 2'].append(attempt2[0] if len(attempt2) > 0 else None)
-        result['Attempt 2 %'].append(attempt2_per[0] if len(attempt2_per) > 0 else None)
-
-        # Get Attempt 3 %
-        attempt3 = df[df['variable'] == f'{dept} Attempt 3']['value'].values
-        attempt3_per = df[df['variable'] == f'{dept} Attempt 3 %']['value'].values
+    # Matrix column -> variable suffix after the department name
+    matrix_columns = {
+        'Attempt 1': 'Attempt 1',
+        'Attempt 1 %': 'Attempt 1 %',
+        'Attempt 2': 'Attempt 2',
+        'Attempt 2 %': 'Attempt 2 %',
+        'Attempt 3': 'Attempt 3',
+        'Attempt 3 %': 'Attempt 3 %',
+        'Final Score': 'Final Score',
+        'Final Score %': 'Final Score %',
+        'Status': 'Final Status',
+    }
 
-        result['Attempt 3'].append(attempt3[0] if len(attempt3) > 0 else None)
-        result['Attempt 3 %'].append(attempt3_per[0] if len(attempt3_per) > 0 else None)
-        
-        # Get Final Score %
-        final = df[df['variable'] == f'{dept} Final Score']['value'].values
-        final_per = df[df['variable'] == f'{dept} Final Score %']['value'].values
-        result['Final Score'].append(final[0] if len(final) > 0 else None)
-        result['Final Score %'].append(final_per[0] if len(final_per) > 0 else None)
-        
-        # Get Final Status
-        status = df[df['variable'] == f'{dept} Final Status']['value'].values
-        result['Status'].append(status[0] if len(status) > 0 else None)
+    result = {'Department': list(departments)}
+    for column, suffix in matrix_columns.items():
+        result[column] = [first_values.get(f'{dept} {suffix}') for dept in departments]
     
     return pd.DataFrame(result)
\ No newline at end of file
@@ -0,0 +1,279 @@
+"""
+Report Card Rendering
+=====================
+
+ReportLab rendering of the trainee report card, kept free of the cache/database layers
+so it can run in a render_pool worker process. The coroutine side (report_card_trainee in
+second_layer_fns.py) resolves the trainee and turns their score matrix into a compact
+table with score_matrix_table; render_report_card turns that table into PDF bytes.
+"""
+
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from reportlab.lib.pagesizes import letter, landscape
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.enums import TA_CENTER, TA_LEFT
+
+def score_matrix_table(df):
+    """
+    Format a trainee score matrix (l2_get_trainee_score_matrix) for the report card table.
+    Nulls become 'NA' and percentage columns whole numbers; other values are kept as they are.
+
+    Args:
+        df: Trainee score matrix, one row per department
+
+    Returns:
+        (header, rows) - column names and a list of row lists, plain picklable Python values
+    """
+    header = df.columns.tolist()
+    columns = []
+    for name, col in df.items():
+        values = col.to_numpy(dtype=object, copy=True)
+        nulls = col.isna().to_numpy()
+        if '%' in str(name):
+            # Numbers and numeric strings ('75', '75%') round to whole numbers, anything else is NA
+            as_number = pd.to_numeric(col.astype(str).str.strip().str.replace('%', '', regex=False), errors='coerce')
+            valid = (as_number.notna() & ~col.isna()).to_numpy()
+            values[:] = 'NA'
+            values[valid] = as_number[valid].round().astype('int64').tolist()
+        else:
+            values[nulls] = 'NA'
+        columns.append(values)
+
+    rows = np.column_stack(columns).tolist() if columns and len(df) else []
+    return header, rows
+
+def render_report_card(header, rows, employee_id=None, candidate=None):
+    """
+    Render the report card PDF in memory (CPU bound - runs in a render_pool worker)
+
+    Args:
+        header, rows: Table from score_matrix_table
+        employee_id: Employee code shown on the card
+        candidate: Candidate name shown on the card
+
+    Returns: bytes object containing the PDF
+    """
+    # Create a BytesIO buffer
+    buffer = BytesIO()
+
+    # Create the PDF document with LANDSCAPE orientation and reduced margins
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=landscape(letter),
+        rightMargin=30,
+        leftMargin=30,
+        topMargin=40,
+        bottomMargin=40
+    )
+
+    # Container for PDF elements
+    elements = []
+    styles = getSampleStyleSheet()
+
+    # Create custom styles
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        textColor=colors.HexColor('#1f78c1'),
+        spaceAfter=20,
+        alignment=TA_CENTER,
+        fontName='Helvetica-Bold'
+    )
+
+    subtitle_style = ParagraphStyle(
+        'CustomSubtitle',
+        parent=styles['Heading2'],
+        fontSize=14,
+        textColor=colors.HexColor('#155a8a'),
+        spaceAfter=15,
+        alignment=TA_LEFT,
+        fontName='Helvetica-Bold'
+    )
+
+    info_style = ParagraphStyle(
+        'InfoStyle',
+        parent=styles['Normal'],
+        fontSize=11,
+        textColor=colors.black,
+        spaceAfter=10,
+        alignment=TA_LEFT
+    )
+
+    # Add header/title
+    elements.append(Paragraph("VOLT Trainee: Assessment Report Card (Batch-1)", title_style))
+    elements.append(Spacer(1, 10))
+
+    # Add employee information
+    if employee_id:
+        elements.append(Paragraph(f"<b>Employee ID:</b> {employee_id}", info_style))
+    if candidate and candidate != 'All':
+        elements.append(Paragraph(f"<b>Candidate Name:</b> {candidate}", info_style))
+
+    elements.append(Spacer(1, 15))
+    elements.append(Paragraph("Departments Performance Summary", subtitle_style))
+    elements.append(Spacer(1, 10))
+
+    table_data = [header] + rows
+
+    # Column widths
+    available_width = 10 * inch
+    num_cols = len(header)
+    dept_col_width = 1.5 * inch
+    remaining_width = available_width - dept_col_width
+    other_col_width = remaining_width / (num_cols - 1) if num_cols > 1 else remaining_width
+    col_widths = [dept_col_width] + [other_col_width] * (num_cols - 1)
+
+    table = Table(table_data, colWidths=col_widths, repeatRows=1)
+
+    # Lighter alternating rows to harmonize with column-group tints
+    row_white = colors.white
+    row_grey = colors.Color(0.96, 0.96, 0.96)
+
+    table_style = TableStyle([
+        # Header styling
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f78c1')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 9),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+        ('TOPPADDING', (0, 0), (-1, 0), 10),
+
+        # Base body styling
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
+        ('ALIGN', (0, 1), (0, -1), 'LEFT'),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 10),
+        ('TOPPADDING', (0, 1), (-1, -1), 6),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
+
+        # Grid styling
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('LINEBELOW', (0, 0), (-1, 0), 2, colors.HexColor('#155a8a')),
+
+        # Department-wise alternating row shading
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [row_white, row_grey]),
+    ])
+
+    # Column-group shading for Attempt pairs and Final pair
+    column_white = colors.white
+    column_grey = colors.Color(0.86, 0.86, 0.86)
+
+    col_index = {name: i for i, name in enumerate(header)}
+    a1, a1p = col_index.get("Attempt 1"), col_index.get("Attempt 1 %")
+    a2, a2p = col_index.get("Attempt 2"), col_index.get("Attempt 2 %")
+    a3, a3p = col_index.get("Attempt 3"), col_index.get("Attempt 3 %")
+    fs, fsp = col_index.get("Final Score"), col_index.get("Final Score %")
+
+    first_data_row = 1
+    last_row = len(table_data) - 1
+
+    def shade_pair(c1, c2, color):
+        if c1 is not None and c2 is not None and last_row >= first_data_row:
+            l, r = min(c1, c2), max(c1, c2)
+            table_style.add('BACKGROUND', (l, first_data_row), (r, last_row), color)
+
+    shade_pair(a1, a1p, column_grey)
+    shade_pair(a2, a2p, column_white)
+    shade_pair(a3, a3p, column_grey)
+    shade_pair(fs, fsp, column_white)
+
+    # Emphasize attempt and final headers
+    for c in [a1, a1p, a2, a2p, a3, a3p, fs, fsp]:
+        if c is not None:
+            table_style.add('FONTNAME', (c, 0), (c, 0), 'Helvetica-Bold')
+
+    # Bold the Final Score and Final Score % values in the body as well
+    if fs is not None:
+        table_style.add('FONTNAME', (fs, first_data_row), (fs, last_row), 'Helvetica-Bold')
+    if fsp is not None:
+        table_style.add('FONTNAME', (fsp, first_data_row), (fsp, last_row), 'Helvetica-Bold')
+
+    # Conditional formatting: red text when thresholds are not met
+    def mark_if_below(col_idx, predicate):
+        if col_idx is None:
+            return
+        for row_idx in range(1, len(table_data)):
+            val = table_data[row_idx][col_idx]
+            try:
+                num = None
+                if isinstance(val, (int, float)):
+                    num = float(val)
+                elif isinstance(val, str):
+                    s = val.strip().replace('%', '')
+                    num = float(s) if s not in ('', '-') else None
+                if num is not None and predicate(num):
+                    table_style.add('TEXTCOLOR', (col_idx, row_idx), (col_idx, row_idx), colors.red)
+            except Exception:
+                pass
+
+    below_15 = lambda x: x < 15 and x != 0
+    below_75pct = lambda x: x < 75 and x != 0
+
+    for idx in [a1, a2, a3, fs]:
+        mark_if_below(idx, below_15)
+    for idx in [a1p, a2p, a3p, fsp]:
+        mark_if_below(idx, below_75pct)
+
+    # Existing conditional coloring for overall Status column
+    status_col_idx = len(header) - 1
+    for row_idx in range(1, len(table_data)):
+        status_value = table_data[row_idx][status_col_idx]
+        if status_value == 'Pass':
+            table_style.add('TEXTCOLOR', (status_col_idx, row_idx), (status_col_idx, row_idx), colors.green)
+            table_style.add('FONTNAME', (status_col_idx, row_idx), (status_col_idx, row_idx), 'Helvetica-Bold')
+        elif status_value == 'Fail':
+            table_style.add('TEXTCOLOR', (status_col_idx, row_idx), (status_col_idx, row_idx), colors.red)
+            table_style.add('FONTNAME', (status_col_idx, row_idx), (status_col_idx, row_idx), 'Helvetica-Bold')
+        elif status_value == 'Pending':
+            table_style.add('TEXTCOLOR', (status_col_idx, row_idx), (status_col_idx, row_idx), colors.orange)
+            table_style.add('FONTNAME', (status_col_idx, row_idx), (status_col_idx, row_idx), 'Helvetica-Bold')
+
+    table.setStyle(table_style)
+    elements.append(table)
+
+    # Summary
+    elements.append(Spacer(1, 25))
+    elements.append(Paragraph("Summary", subtitle_style))
+    elements.append(Spacer(1, 10))
+
+    statuses = [row[col_index['Status']] for row in rows] if 'Status' in col_index else []
+    passed_count = statuses.count('Pass')
+    pending_count = statuses.count('Pending')
+    total_departments = len(rows)
+
+    summary_text = f"""
+    <b>Total Departments:</b> {total_departments}<br/>
+    <b>Passed:</b> {passed_count}<br/>
+    <b>Pending:</b> {pending_count}
+    """
+    elements.append(Paragraph(summary_text, info_style))
+
+    # Footer
+    elements.append(Spacer(1, 25))
+    footer_text = "This report is auto-generated and contains confidential information."
+    footer_style = ParagraphStyle(
+        'Footer',
+        parent=styles['Normal'],
+        fontSize=8,
+        textColor=colors.grey,
+        alignment=TA_CENTER,
+        italic=True
+    )
+    elements.append(Paragraph(footer_text, footer_style))
+
+    # Build the PDF
+    doc.build(elements)
+
+    # Return bytes
+    pdf_bytes = buffer.getvalue()
+    buffer.close()
+    return pdf_bytes
@@ -1,71 +1,74 @@
-from copy import deepcopy
-
+import json
+import time
+from collections import deque
 from urllib.parse import unquote
-from reportlab.lib.pagesizes import letter, landscape
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-
-from io import BytesIO
 
 from data_preprocessing.first_layer_fns import *
 from data_preprocessing.helper_fns import *
+from data_preprocessing.report_cards import score_matrix_table, render_report_card
 from cache import cache_manager
+from registry import function_registry
+from render_pool import render_pool
+from pdf_cache import pdf_cache
+from metrics import metrics
 
 
 
+@function_registry.register()
 @pre_post_process
 async def l2_get_proper_dashboard_data():
     data = await cache_manager.get_or_fetch(l1_get_proper_dashboard_data_unprocessed)
     return data
 
+@function_registry.register(params={'city': str})
 @pre_post_process
 async def l2_get_dashboard_data_citylevel(city):
     dashboard_data = await cache_manager.get_or_fetch(l1_get_proper_dashboard_data_unprocessed)
     dashboard_data = dashboard_data[0]
-    dashboard_data.query('City == @city',inplace=True)
+    dashboard_data = dashboard_data.query('City == @city')
     return dashboard_data
 
+@function_registry.register()
 @pre_post_process
 async def l2_get_stats_main():
-    dashboard_df = await cache_manager.get_or_fetch(l1_get_rawdata_cleaned)
-    stats_df = pd.DataFrame({'Total Departments': dashboard_df['dep_prefix'].nunique(),
-                  'Total Candidates':dashboard_df['candidateName'].nunique(),
-                  'Total Core Schools': dashboard_df['hallName'].nunique()},index=range(0,1))
+    cube = await cache_manager.get_or_fetch(l1_get_aggregate_cube)
+    totals = cube['totals']
+    stats_df = pd.DataFrame({'Total Departments': totals['departments'],
+                  'Total Candidates': totals['candidates'],
+                  'Total Core Schools': totals['halls']},index=range(0,1))
 
     return stats_df
 
+@function_registry.register()
 @pre_post_process
 async def l2_get_citywise_barchart():
-    dashboard_df = await cache_manager.get_or_fetch(l1_get_rawdata_cleaned)
-    bar_df = dashboard_df.drop_duplicates('candidateName').groupby('hallName').agg({'Employee Code':'count'}).reset_index()
-    return bar_df
-
-@pre_post_process
-async def l2_get_citywise_barchart():
-    dashboard_df = await cache_manager.get_or_fetch(l1_get_rawdata_cleaned)
-    bar_df = dashboard_df.drop_duplicates('candidateName').groupby('hallName').agg({'Employee Code':'count'}).reset_index()
-    return bar_df
+    cube = await cache_manager.get_or_fetch(l1_get_aggregate_cube)
+    return cube['hall_candidates']
 
+@function_registry.register(params={'city': str})
 @pre_post_process
 async def l2_get_stats_city(city):
-    dashboard_df = await cache_manager.get_or_fetch(l1_get_rawdata_cleaned)
-    dashboard_df.query('hallName == @city',inplace=True)
-    stats_df = pd.DataFrame({'Total Departments': dashboard_df['dep_prefix'].nunique(),
-                  'Total candidates':dashboard_df['candidateName'].nunique(),
-                  'Total Cities': dashboard_df['hallName'].nunique()},index=range(0,1))
+    cube = await cache_manager.get_or_fetch(l1_get_aggregate_cube)
+    found = city in cube['halls'].index
+    hall = cube['halls'].loc[city] if found else {'departments': 0, 'candidates': 0}
+    stats_df = pd.DataFrame({'Total Departments': hall['departments'],
+                  'Total candidates': hall['candidates'],
+                  'Total Cities': int(found)},index=range(0,1))
     return stats_df
     
+@function_registry.register(params={'city': str})
 @pre_post_process
 async def l2_get_coursewise_barchart(city):
-    dashboard_df = await cache_manager.get_or_fetch(l1_get_rawdata_cleaned)
-    dashboard_df.query('hallName == @city',inplace=True)
-    bar_df = dashboard_df.drop_duplicates('candidateName').groupby('courseName').agg({'Employee Code':'count'}).reset_index()
+    cube = await cache_manager.get_or_fetch(l1_get_aggregate_cube)
+    courses = cube['hall_courses']
+    if city in courses.index.get_level_values('hallName'):
+        bar_df = courses.xs(city, level='hallName').reset_index()
+    else:
+        bar_df = courses.iloc[:0].droplevel('hallName').reset_index()
 
     return bar_df
 
+@function_registry.register(params={'attempts': str, 'format': ('Percentage', 'Scores')}, grid='#Employee Name')
 @pre_post_process
 async def l2_score_wise_grid(attempts,format):
     attempts = attempts.split("|")
@@ -91,6 +94,7 @@ async def l2_score_wise_grid(attempts,format):
     df = df.rename({'candidateName':'#Employee Name'},axis=1).copy()
     return df
 
+@function_registry.register(params={'attempts': str}, grid='#Employee Name')
 @pre_post_process
 async def l2_status_wise_grid(attempts):
     attempts = attempts.split("|")
@@ -112,6 +116,7 @@ async def l2_status_wise_grid(attempts):
     df = df.rename({'candidateName':'#Employee Name'},axis=1).copy()
     return df
 
+@function_registry.register(params={'dep': str})
 @pre_post_process
 async def l2_overall_score_distribution(dep):
     df = await cache_manager.get_or_fetch(l1_get_proper_dashboard_data_unprocessed)
@@ -120,6 +125,7 @@ async def l2_overall_score_distribution(dep):
     df.columns = ["Score"]
     return df
 
+@function_registry.register()
 @pre_post_process
 async def l2_get_available_cities():
     df = await cache_manager.get_or_fetch(l1_get_proper_dashboard_data_unprocessed)
@@ -127,50 +133,45 @@ async def l2_get_available_cities():
     df = df[['City']].drop_duplicates()
     return df
 
+@function_registry.register()
 @pre_post_process
 async def l2_departmentwise_average_scores():
-    df = await cache_manager.get_or_fetch(l1_get_proper_dashboard_data_unprocessed)
-    
+    cube = await cache_manager.get_or_fetch(l1_get_aggregate_cube)
 
-    df = df[[col for col in df.columns if col.endswith('Final Score')]].mean().reset_index().copy()
-    df.columns = ['Department','Average Final Score']
-    df['Department'] = df['Department'].str.replace(' Final Score','')
+    totals = cube['status'].groupby('department')[['final_score_sum','final_score_count']].sum().reindex(cube['departments'])
+    df = pd.DataFrame({'Department': cube['departments'],
+                       'Average Final Score': (totals['final_score_sum'] / totals['final_score_count']).to_numpy()})
     return df
 
+@function_registry.register()
 @pre_post_process
 async def l2_retrieve_departments():
     df = await cache_manager.get_or_fetch(l1_get_rawdata_cleaned)
     return pd.DataFrame(df['dep_prefix'].unique(),columns=['Departments']).sort_values('Departments')
 
+@function_registry.register()
 @pre_post_process
 async def l2_pass_fail_pending_count():
-    df = await cache_manager.get_or_fetch(l1_get_proper_dashboard_data_unprocessed)
-    
-    stat_pass = df[[col for col in df.columns if col.endswith('Final Status')]]=='Pass'
-    stat_fail = df[[col for col in df.columns if col.endswith('Final Status')]]=='Fail'
-    stat_pending = df[[col for col in df.columns if col.endswith('Final Status')]] == 'Pending'
-    stat_absent  =  df[[col for col in df.columns if col.endswith('Final Status')]]=='Not Attempted'
-    pass_count = stat_pass.sum()
-    fail_count = stat_fail.sum()
-    pending_count = stat_pending.sum()
-    absent_count = stat_absent.sum()
-    df = pd.concat([pass_count,fail_count,pending_count,absent_count],keys=['Pass','Fail','Pending','Not Attempted'],axis=1)
-    df.index = df.index.str.replace(' Final Status','')
+    cube = await cache_manager.get_or_fetch(l1_get_aggregate_cube)
+
+    counts = cube['status'].groupby(['department','status'])['candidates'].sum().unstack('status')
+    df = counts.reindex(index=cube['departments'], columns=['Pass','Fail','Pending','Not Attempted']).fillna(0).astype('int64')
+    df.columns.name = None
     df.reset_index(inplace=True, names = ['Department'])
     return df
 
+@function_registry.register(params={'chosen_dep': str, 'candidate': str, 'user_id': str}, grid='Employee Name')
 @pre_post_process
 async def l2_get_dashboard_data_for_dep(chosen_dep,candidate=None,user_id=None):
-    global DEPS_MAPPING
-    dep_map = deepcopy(DEPS_MAPPING)
     employee_id = None
 
     df = await cache_manager.get_or_fetch(l1_get_rawdata_cleaned)
-    dep_wise_max_marks = df[['MaxPossibleScore','dep_prefix']].drop_duplicates().copy()
+    matrix = await cache_manager.get_or_fetch(l1_get_proper_dashboard_data_unprocessed)
+    indexes = await cache_manager.get_or_fetch(l1_get_lookup_indexes)
 
     if candidate and candidate != 'All':
             candidate = unquote(candidate)
-            employee_ids_for_employee = df.query('candidateName == @candidate')
+            employee_ids_for_employee = lookup_rows(df, indexes['rawdata'], 'candidateName', candidate)
 
             if len(employee_ids_for_employee)>0:
                 employee_id = employee_ids_for_employee.iloc[0]['Employee Code']
@@ -178,158 +179,51 @@ async def l2_get_dashboard_data_for_dep(chosen_dep,candidate=None,user_id=None):
     elif user_id:
         employee_id = user_id
 
-    if chosen_dep:
-        chosen_dep = unquote(chosen_dep)
-        if chosen_dep != 'All':
-            df.query("dep_prefix == @chosen_dep",inplace=True)
-            dep_map = {key:dep_map[key] for key in dep_map if dep_map[key] == chosen_dep}
-
+    positions = None
     if employee_id:
-        df.query('`Employee Code` == @employee_id',inplace=True)
-
-    df['courseName_cleaned'] = df["dep_prefix"].astype(str) + "_" + df["batch_suffix"].astype(str)
-    df['courseName_cleaned_percent'] = df['courseName_cleaned'] + " %"
-    
-    score_cols = df.pivot(columns='courseName_cleaned', values='TotalCandidateScore').copy()
-    percent_cols = df.pivot(columns='courseName_cleaned_percent', values='ScorePercentage').copy()
-    df = df[[col for col in list(df.columns) if col not in ['dep_prefix','batch_suffix','courseName_cleaned','courseName','rollNo','examDate','TotalCandidateScore','ScorePercentage','courseName_cleaned_percent']]].copy()
-
-    df = pd.concat([df,score_cols,percent_cols],axis=1).copy()
-
-    df = df.groupby('candidateName').agg('first').reset_index()
+        positions = lookup_positions(matrix, indexes['matrix'], 'Employee Code', employee_id)
+    columns = [col for col in matrix.columns if not col.startswith('Total ')]
+    layout_columns = {col for dep in DEPS_MAPPING.values() for col in department_columns(dep) + department_status_columns(dep)}
 
-    for dep in dep_map.values():
-        df[f'{dep} Max Marks'] = dep_wise_max_marks.query("dep_prefix == @dep").MaxPossibleScore.iloc[0]
-    for dep in dep_map.values():
-        df[f'{dep} Final Score'] = df[[col for col in df.columns if col.startswith(f'{dep}_') and '%' not in col]].max(axis=1).reset_index(drop=True)
-
-    for dep in dep_map.values():
-        df[f'{dep} Final Score %'] = df[f'{dep} Final Score']/df[f'{dep} Max Marks'] * 100
-
-    def pass_fail_fn(score_percent):
-        if np.isnan(score_percent):
-            return 'Pending'
-        if score_percent == 0:
-            return 'Not Attempted'
-        if score_percent>=75.0:
-            return 'Pass'
+    if chosen_dep:
+        chosen_dep = unquote(chosen_dep)
+        if chosen_dep == 'All':
+            columns = matrix.columns.tolist()
         else:
-            return 'Fail'
-    
-    for dep in dep_map.values():
-        cols = [f'{dep}_Attempt 1 %',f'{dep}_Attempt 2 %',f'{dep}_Attempt 3 %',f'{dep} Final Score %']
-        status_cols = [f'{dep} Attempt 1 Status',f'{dep} Attempt 2 Status',f'{dep} Attempt 3 Status',f'{dep} Final Status']
-        for col,status_col in zip(cols,status_cols):
-            if col in df.columns:
-                df[status_col] = df[col].map(pass_fail_fn)
-            else:
-                df[col] = None
-                df[col.replace('%','').strip()] = None
-                df[status_col] = 'Pending'
-        
-
-    new_order = ['candidateName','Employee Code','hallName']
-
-    # Add department columns in order
-    columns = df.columns.tolist()
-    for dep in dep_map.values():
-        # Collect all columns for this department
-        dept_cols = {
-            'attempts': [],
-            'max_marks': None,
-            'final_score': None,
-            'final_score_pct': None,
-            'status' : None
-        }
-
-        for col in columns:
-            # Match attempt patterns
-            match = re.match(rf'^{dep}_Attempt (\d+)$', col)
-            if match:
-                attempt_num = int(match.group(1))
-                dept_cols['attempts'].append((attempt_num, col, None))
-
-            match = re.match(rf'^{dep}_Attempt (\d+) %$', col)
-            if match:
-                attempt_num = int(match.group(1))
-                # Find the corresponding attempt entry and update it
-                for i, (num, att_col, pct_col) in enumerate(dept_cols['attempts']):
-                    if num == attempt_num:
-                        dept_cols['attempts'][i] = (num, att_col, col)
-                        break
-                else:
-                    dept_cols['attempts'].append((attempt_num, None, col))
-
-            # Match Max Marks, Final Score, and Final Score %
-            if col == f'{dep} Max Marks':
-                dept_cols['max_marks'] = col
-            if col == f'{dep} Final Score':
-                dept_cols['final_score'] = col
-            if col == f'{dep} Final Score %':
-                dept_cols['final_score_pct'] = col
-            if col == f'{dep} Status':
-                dept_cols['status'] = col
-
-        # Sort attempts by attempt number
-        dept_cols['attempts'].sort(key=lambda x: x[0])
-
-        # Add attempts in order
-        for attempt_num, att_col, pct_col in dept_cols['attempts']:
-            if att_col:
-                new_order.append(att_col)
-            if pct_col:
-                new_order.append(pct_col)
-
-        # Add Max Marks, Final Score, Final Score %
-        if dept_cols['max_marks']:
-            new_order.append(dept_cols['max_marks'])
-        if dept_cols['final_score']:
-            new_order.append(dept_cols['final_score'])
-        if dept_cols['final_score_pct']:
-            new_order.append(dept_cols['final_score_pct'])
-        if dept_cols['status']:
-            new_order.append(dept_cols['status'])
-
-    # Add all remaining columns
-    for col in columns:
-        if col not in new_order:
-            new_order.append(col)
-    df = df[new_order].copy()
-
-    if chosen_dep == 'All':
-        indiv_pass_fail_status = df[[item for item in new_order if 'Final Status' in item]].fillna('None')
-        indiv_pass_fail_status = indiv_pass_fail_status.replace('None',None)
-
-        indiv_pass_fail_status['Total Pending Departments'] = indiv_pass_fail_status.apply(lambda row: row.map({'Pending':True}).sum(),axis=1)
-        indiv_pass_fail_status['Total Fail Departments'] = indiv_pass_fail_status.apply(lambda row: row.map({'Fail':True}).sum(),axis=1)
-        indiv_pass_fail_status['Total Pass Departments'] = indiv_pass_fail_status.apply(lambda row: row.map({'Pass':True}).sum(),axis=1)
-
-        df = pd.concat([df,indiv_pass_fail_status[['Total Pass Departments','Total Fail Departments','Total Pending Departments']]],axis=1)
-
-    df = df.fillna('None')
-    df = df.replace('None',None)
-    df.drop('MaxPossibleScore',axis=1,inplace=True)
-    df.columns = [item.replace('_',' ') for item in df.columns.to_list()]
+            # Only candidates with at least one exam row in the chosen department
+            dep_positions = lookup_department_positions(matrix, df, indexes, chosen_dep)
+            positions = dep_positions if positions is None else np.intersect1d(positions, dep_positions)
+            own_columns = set(department_columns(chosen_dep) + department_status_columns(chosen_dep))
+            columns = ['candidateName','Employee Code','hallName'] + [col for col in matrix.columns if col in own_columns or (col.startswith(f'{chosen_dep} ') and col not in layout_columns)]
 
-    return df
+    df = (matrix if positions is None else matrix.iloc[positions])[columns].reset_index(drop=True)
+
+    # Columns from unmapped roll number prefixes/suffixes only show when the selected rows have them
+    unmapped_empty = [col for col in columns[3:] if col not in layout_columns and not col.startswith('Total ') and df[col].isna().all()]
+    return df.drop(columns=unmapped_empty)
 
+@function_registry.register(params={'dep': str})
 @pre_post_process
 async def l2_get_candidate_names(dep):
     df = await cache_manager.get_or_fetch(l1_get_rawdata_cleaned)
 
     if dep != 'All':
-        df.query('dep_prefix == @dep',inplace=True)
+        indexes = await cache_manager.get_or_fetch(l1_get_lookup_indexes)
+        df = lookup_rows(df[['dep_prefix','candidateName']], indexes['rawdata'], 'dep_prefix', dep)
     
     return df[['candidateName']].drop_duplicates().sort_values('candidateName')
 
+@function_registry.register(cacheable=False)
 @pre_post_process
 async def l2_dummy_fn():
     df = pd.DataFrame(['hi'],columns=['greeting'])
     return df
 
+@function_registry.register(params={'candidate': str, 'user_id': str}, kind='pdf', cacheable=False, cpu_heavy=True)
 async def report_card_trainee(candidate=None, user_id=None):
     """
     Generate a PDF report card in memory
+    The ReportLab build runs in a render_pool worker so the event loop keeps serving panels.
     Returns: bytes object containing the PDF
     """
 
@@ -337,7 +231,8 @@ async def report_card_trainee(candidate=None, user_id=None):
     if not user_id:
         candidate = unquote(candidate)
         df_mapping = await cache_manager.get_or_fetch(l1_get_userid_name_mapping)
-        employee_ids_for_employee = df_mapping.query('candidateName == @candidate')
+        indexes = await cache_manager.get_or_fetch(l1_get_lookup_indexes)
+        employee_ids_for_employee = lookup_rows(df_mapping, indexes['mapping'], 'candidateName', candidate)
         if len(employee_ids_for_employee) > 0:
             employee_id = employee_ids_for_employee.iloc[0]['Employee Code']
         else:
@@ -348,268 +243,126 @@ async def report_card_trainee(candidate=None, user_id=None):
     # Get the trainee score matrix
     df = await l2_get_trainee_score_matrix(user_id=employee_id)
 
+    # Only the formatted table crosses the process boundary
+    header, rows = report_card_table(df)
+    return await render_report_card_cached(header, rows, employee_id, candidate)
+
+async def render_report_card_cached(header, rows, employee_id, candidate):
+    """Rendered card from the on-disk PDF cache, or rendered in render_pool and stored there"""
+    key = pdf_cache.make_key(employee_id, header, rows, candidate)
+    pdf_bytes = await pdf_cache.get(key)
+    if pdf_bytes is None:
+        with metrics.stage('pdf_build'):
+            pdf_bytes = await render_pool.run(render_report_card, header, rows, employee_id, candidate)
+        await pdf_cache.put(key, pdf_bytes)
+    return pdf_bytes
+
+def report_card_table(df):
+    """Trainee score matrix -> (header, rows) table for render_report_card"""
     num_cols = df.select_dtypes(include=[np.number]).columns
     num_cols_no_pct = [c for c in num_cols if '%' not in c]
     df[num_cols_no_pct] = df[num_cols_no_pct].astype('float') 
+    return score_matrix_table(df)
 
-    # Create a BytesIO buffer
-    buffer = BytesIO()
-
-    # Create the PDF document with LANDSCAPE orientation and reduced margins
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=landscape(letter),
-        rightMargin=30,
-        leftMargin=30,
-        topMargin=40,
-        bottomMargin=40
-    )
-
-    # Container for PDF elements
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Create custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#1f78c1'),
-        spaceAfter=20,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
-
-    subtitle_style = ParagraphStyle(
-        'CustomSubtitle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#155a8a'),
-        spaceAfter=15,
-        alignment=TA_LEFT,
-        fontName='Helvetica-Bold'
-    )
-
-    info_style = ParagraphStyle(
-        'InfoStyle',
-        parent=styles['Normal'],
-        fontSize=11,
-        textColor=colors.black,
-        spaceAfter=10,
-        alignment=TA_LEFT
-    )
-
-    # Add header/title
-    elements.append(Paragraph("VOLT Trainee: Assessment Report Card (Batch-1)", title_style))
-    elements.append(Spacer(1, 10))
-
-    # Add employee information
-    if employee_id:
-        elements.append(Paragraph(f"<b>Employee ID:</b> {employee_id}", info_style))
-    if candidate and candidate != 'All':
-        elements.append(Paragraph(f"<b>Candidate Name:</b> {candidate}", info_style))
-
-    elements.append(Spacer(1, 15))
-    elements.append(Paragraph("Departments Performance Summary", subtitle_style))
-    elements.append(Spacer(1, 10))
-
-    # Prepare table data - format ONLY percentage columns as integers
-    header = df.columns.tolist()
-    
-    # Identify percentage columns by header names
-    pct_col_indices = {i for i, name in enumerate(header) if '%' in str(name)}
-
-    table_data = [header]
-    for _, row in df.iterrows():
-        formatted_row = []
-        for i, val in enumerate(row):
-            # Check if value is null/NaN first
-            if pd.isna(val):
-                formatted_row.append('NA')
-            # Only format percentage columns as whole numbers
-            elif i in pct_col_indices:
-                try:
-                    if isinstance(val, (int, float, np.integer, np.floating)):
-                        formatted_row.append(int(round(float(val))))
-                    elif isinstance(val, str):
-                        s = val.strip().replace('%', '')
-                        if s in ('', '-'):
-                            formatted_row.append('NA')
-                        else:
-                            formatted_row.append(int(round(float(s))))
-                    else:
-                        formatted_row.append(val)
-                except (ValueError, TypeError):
-                    formatted_row.append('NA')
-            else:
-                # Leave non-percentage columns as-is (but convert NaN to NA if missed)
-                formatted_row.append(val)
-        table_data.append(formatted_row)
-        
-    # Column widths
-    available_width = 10 * inch
-    num_cols = len(header)
-    dept_col_width = 1.5 * inch
-    remaining_width = available_width - dept_col_width
-    other_col_width = remaining_width / (num_cols - 1) if num_cols > 1 else remaining_width
-    col_widths = [dept_col_width] + [other_col_width] * (num_cols - 1)
-
-    table = Table(table_data, colWidths=col_widths, repeatRows=1)
-
-    # Lighter alternating rows to harmonize with column-group tints
-    row_white = colors.white
-    row_grey = colors.Color(0.96, 0.96, 0.96)
-
-    table_style = TableStyle([
-        # Header styling
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f78c1')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-        ('TOPPADDING', (0, 0), (-1, 0), 10),
-
-        # Base body styling
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
-        ('ALIGN', (0, 1), (0, -1), 'LEFT'),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 10),
-        ('TOPPADDING', (0, 1), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-
-        # Grid styling
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('LINEBELOW', (0, 0), (-1, 0), 2, colors.HexColor('#155a8a')),
-
-        # Department-wise alternating row shading
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [row_white, row_grey]),
-    ])
-
-    # Column-group shading for Attempt pairs and Final pair
-    column_white = colors.white
-    column_grey = colors.Color(0.86, 0.86, 0.86)
-
-    col_index = {name: i for i, name in enumerate(header)}
-    a1, a1p = col_index.get("Attempt 1"), col_index.get("Attempt 1 %")
-    a2, a2p = col_index.get("Attempt 2"), col_index.get("Attempt 2 %")
-    a3, a3p = col_index.get("Attempt 3"), col_index.get("Attempt 3 %")
-    fs, fsp = col_index.get("Final Score"), col_index.get("Final Score %")
-
-    first_data_row = 1
-    last_row = len(table_data) - 1
-
-    def shade_pair(c1, c2, color):
-        if c1 is not None and c2 is not None and last_row >= first_data_row:
-            l, r = min(c1, c2), max(c1, c2)
-            table_style.add('BACKGROUND', (l, first_data_row), (r, last_row), color)
-
-    shade_pair(a1, a1p, column_grey)
-    shade_pair(a2, a2p, column_white)
-    shade_pair(a3, a3p, column_grey)
-    shade_pair(fs, fsp, column_white)
-
-    # Emphasize attempt and final headers
-    for c in [a1, a1p, a2, a2p, a3, a3p, fs, fsp]:
-        if c is not None:
-            table_style.add('FONTNAME', (c, 0), (c, 0), 'Helvetica-Bold')
-
-    # Bold the Final Score and Final Score % values in the body as well
-    if fs is not None:
-        table_style.add('FONTNAME', (fs, first_data_row), (fs, last_row), 'Helvetica-Bold')
-    if fsp is not None:
-        table_style.add('FONTNAME', (fsp, first_data_row), (fsp, last_row), 'Helvetica-Bold')
-
-    # Conditional formatting: red text when thresholds are not met
-    def mark_if_below(col_idx, predicate):
-        if col_idx is None:
-            return
-        for row_idx in range(1, len(table_data)):
-            val = table_data[row_idx][col_idx]
-            try:
-                num = None
-                if isinstance(val, (int, float)):
-                    num = float(val)
-                elif isinstance(val, str):
-                    s = val.strip().replace('%', '')
-                    num = float(s) if s not in ('', '-') else None
-                if num is not None and predicate(num):
-                    table_style.add('TEXTCOLOR', (col_idx, row_idx), (col_idx, row_idx), colors.red)
-            except Exception:
-                pass
-
-    below_15 = lambda x: x < 15 and x != 0
-    below_75pct = lambda x: x < 75 and x != 0
-
-    for idx in [a1, a2, a3, fs]:
-        mark_if_below(idx, below_15)
-    for idx in [a1p, a2p, a3p, fsp]:
-        mark_if_below(idx, below_75pct)
-
-    # Existing conditional coloring for overall Status column
-    status_col_idx = len(header) - 1
-    for row_idx in range(1, len(table_data)):
-        status_value = table_data[row_idx][status_col_idx]
-        if status_value == 'Pass':
-            table_style.add('TEXTCOLOR', (status_col_idx, row_idx), (status_col_idx, row_idx), colors.green)
-            table_style.add('FONTNAME', (status_col_idx, row_idx), (status_col_idx, row_idx), 'Helvetica-Bold')
-        elif status_value == 'Fail':
-            table_style.add('TEXTCOLOR', (status_col_idx, row_idx), (status_col_idx, row_idx), colors.red)
-            table_style.add('FONTNAME', (status_col_idx, row_idx), (status_col_idx, row_idx), 'Helvetica-Bold')
-        elif status_value == 'Pending':
-            table_style.add('TEXTCOLOR', (status_col_idx, row_idx), (status_col_idx, row_idx), colors.orange)
-            table_style.add('FONTNAME', (status_col_idx, row_idx), (status_col_idx, row_idx), 'Helvetica-Bold')
-
-    table.setStyle(table_style)
-    elements.append(table)
-
-    # Summary
-    elements.append(Spacer(1, 25))
-    elements.append(Paragraph("Summary", subtitle_style))
-    elements.append(Spacer(1, 10))
-
-    passed_count = (df['Status'] == 'Pass').sum()
-    pending_count = (df['Status'] == 'Pending').sum()
-    total_departments = len(df)
-
-    summary_text = f"""
-    <b>Total Departments:</b> {total_departments}<br/>
-    <b>Passed:</b> {passed_count}<br/>
-    <b>Pending:</b> {pending_count}
+async def report_cards_bulk(chosen_dep='All', user_id=None, window=None):
     """
-    elements.append(Paragraph(summary_text, info_style))
-
-    # Footer
-    elements.append(Spacer(1, 25))
-    footer_text = "This report is auto-generated and contains confidential information."
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=colors.grey,
-        alignment=TA_CENTER,
-        italic=True
-    )
-    elements.append(Paragraph(footer_text, footer_style))
-
-    # Build the PDF
-    doc.build(elements)
-
-    # Return bytes
-    pdf_bytes = buffer.getvalue()
-    buffer.close()
-    return pdf_bytes
-
+    Render report cards for every trainee, or every trainee with exams in one department,
+    from one snapshot of the dashboard matrix.
+
+    Args:
+        chosen_dep: Department name or 'All'
+        user_id: Only this employee's card (trainee users)
+        window: Renders kept in flight at once (default: twice the render pool's concurrency);
+                bounds how many finished PDFs can be waiting in memory
+
+    Yields:
+        (file name, pdf bytes) in trainee order, then ('summary.json', bytes) with
+        counts, failures and throughput
+    """
+    raw = await cache_manager.get_or_fetch(l1_get_rawdata_cleaned)
+    matrix = await cache_manager.get_or_fetch(l1_get_proper_dashboard_data_unprocessed)
+    indexes = await cache_manager.get_or_fetch(l1_get_lookup_indexes)
+    tensor = await cache_manager.get_or_fetch(l1_get_score_tensor)
+    # The matrix has a RangeIndex, so the labels of the selected rows are their tensor positions
+    use_tensor = tensor['rows'] == len(matrix)
+
+    chosen_dep = unquote(chosen_dep)
+    positions = None
+    if user_id:
+        positions = lookup_positions(matrix, indexes['matrix'], 'Employee Code', user_id)
+    if chosen_dep != 'All':
+        dep_positions = lookup_department_positions(matrix, raw, indexes, chosen_dep)
+        positions = dep_positions if positions is None else np.intersect1d(positions, dep_positions)
+    if positions is not None:
+        matrix = matrix.iloc[positions]
+
+    window = window or 2 * render_pool.max_concurrency
+    start = time.monotonic()
+    rendered = 0
+    failed = []
+    pending = deque()
+
+    async def finished(file_name, render):
+        nonlocal rendered
+        try:
+            pdf_bytes = await render
+        except Exception as e:
+            print(f"❌ ERROR rendering {file_name}: {e}")
+            failed.append(file_name)
+            return None
+        rendered += 1
+        return pdf_bytes
+
+    try:
+        for employee_id, rows in matrix.groupby('Employee Code', sort=False):
+            candidate = rows['candidateName'].iloc[0]
+            df = score_tensor_matrix(tensor, rows.index[0]) if use_tensor else trainee_score_matrix(rows)
+            df = df.rename(dashboard_data_col_mapping, axis=1)
+            header, table_rows = report_card_table(df)
+            file_name = f"{employee_id}_{re.sub(r'[^A-Za-z0-9]+', '_', str(candidate)).strip('_')}.pdf"
+            render = asyncio.ensure_future(render_report_card_cached(header, table_rows, employee_id, candidate))
+            pending.append((file_name, render))
+
+            if len(pending) >= window:
+                file_name, render = pending.popleft()
+                pdf_bytes = await finished(file_name, render)
+                if pdf_bytes is not None:
+                    yield file_name, pdf_bytes
+
+        while pending:
+            file_name, render = pending.popleft()
+            pdf_bytes = await finished(file_name, render)
+            if pdf_bytes is not None:
+                yield file_name, pdf_bytes
+    finally:
+        # Client went away mid-stream: drop the renders nobody will read
+        for _, render in pending:
+            render.cancel()
+
+    seconds = time.monotonic() - start
+    summary = {
+        'department': chosen_dep,
+        'rendered': rendered,
+        'failed': failed,
+        'seconds': round(seconds, 3),
+        'pdfs_per_second': round(rendered / seconds, 2) if seconds else None,
+        'render_workers': render_pool.max_workers,
+    }
+    print(f"📄 Bulk report cards ({chosen_dep}): {rendered} PDFs in {seconds:.1f}s, {summary['pdfs_per_second']} PDFs/s")
+    yield 'summary.json', json.dumps(summary, indent=2).encode('utf-8')
+
+@function_registry.register(params={'candidate': str, 'user_id': str})
 @pre_post_process
 async def l2_get_trainee_score_matrix(candidate=None,user_id=None):
     employee_id = None
 
     df = await cache_manager.get_or_fetch(l1_get_proper_dashboard_data_unprocessed)
+    indexes = await cache_manager.get_or_fetch(l1_get_lookup_indexes)
+    tensor = await cache_manager.get_or_fetch(l1_get_score_tensor)
 
     if candidate and candidate != 'All':
             candidate = unquote(candidate)
-            employee_ids_for_employee = df.query('candidateName == @candidate')
+            employee_ids_for_employee = lookup_rows(df, indexes['matrix'], 'candidateName', candidate)
 
             if len(employee_ids_for_employee)>0:
                 employee_id = employee_ids_for_employee.iloc[0]['Employee Code']
@@ -617,9 +370,19 @@ async def l2_get_trainee_score_matrix(candidate=None,user_id=None):
     elif user_id:
         employee_id = user_id
 
+    # The trainee's first matrix row (the first trainee's without an employee id)
     if employee_id:
-        df.query('`Employee Code` == @employee_id',inplace=True)
+        positions = lookup_positions(df, indexes['matrix'], 'Employee Code', employee_id)[:1]
+    else:
+        positions = np.arange(min(len(df), 1))
+
+    if tensor['rows'] != len(df):
+        # Tensor from another refresh than the matrix (see lookup_positions): derive from the row
+        return trainee_score_matrix(df.iloc[positions])
+    return score_tensor_matrix(tensor, positions[0] if len(positions) else None)
 
+def trainee_score_matrix(df):
+    """Department x (attempts, final, status) matrix of the first trainee row in df"""
     dfm = df.melt()
     dfm = transform_to_matrix(dfm)
     dfm.fillna('None',inplace=True)
@@ -627,16 +390,21 @@ async def l2_get_trainee_score_matrix(candidate=None,user_id=None):
     return dfm
 
 
+@function_registry.register(params={'user_id': str})
 async def l2_get_trainee_name_from_id(user_id):
     user_id = user_id.upper()
     df = await cache_manager.get_or_fetch(l1_get_userid_name_mapping)
-    return df.query('`Employee Code` == @user_id')[['candidateName']][:1]
+    indexes = await cache_manager.get_or_fetch(l1_get_lookup_indexes)
+    return lookup_rows(df, indexes['mapping'], 'Employee Code', user_id)[['candidateName']][:1]
 
+@function_registry.register(params={'candidate': str})
 async def l2_get_trainee_id_from_name(candidate):
     candidate = unquote(candidate)
     df = await cache_manager.get_or_fetch(l1_get_userid_name_mapping)
-    return df.query('`candidateName` == @candidate')[['Employee Code']][:1]
+    indexes = await cache_manager.get_or_fetch(l1_get_lookup_indexes)
+    return lookup_rows(df, indexes['mapping'], 'candidateName', candidate)[['Employee Code']][:1]
 
+@function_registry.register()
 async def l2_get_all_trainee_names():
     df = await cache_manager.get_or_fetch(l1_get_userid_name_mapping)
     return df[['candidateName']]
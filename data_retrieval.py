@@ -5,28 +5,88 @@ PostgreSQL Async Client
 
 Handles database connections and query execution.
 Separated from caching concerns for better modularity.
+
+Results are built column by column straight from the asyncpg records (no per-row
+dicts), with explicit dtypes for the columns we know: scores come back from Postgres
+as numeric/Decimal and are stored as float64, text columns stay object.
 """
 
+import numpy as np
 import pandas as pd
 
+from pgsql_async_client import acquire_connection
+from queries import lazily_prepared_queries
+from metrics import metrics
+
+# Explicit dtypes for known result columns; anything else is inferred by pandas
+COLUMN_DTYPES = {
+    'rollNo': object,
+    'candidateName': object,
+    'hallName': object,
+    'courseName': object,
+    'TotalCandidateScore': np.float64,
+    'MaxPossibleScore': np.float64,
+    'ScorePercentage': np.float64,
+}
+
+def records_to_frame(rows, columns=None, dtypes=COLUMN_DTYPES):
+    """
+    Build a DataFrame from asyncpg records one column at a time.
+
+    Args:
+        rows: List of asyncpg Records (or any tuples in column order)
+        columns: Column names; taken from the first record when not given
+        dtypes: Column name -> dtype for columns that should not be inferred
+
+    Returns:
+        DataFrame with one column per result column
+    """
+    if columns is None:
+        columns = list(rows[0].keys()) if rows else []
+
+    data = {}
+    values = zip(*rows) if rows else ([] for _ in columns)
+    for name, column in zip(columns, values):
+        dtype = dtypes.get(name)
+        if dtype is np.float64:
+            # NULL -> NaN; Decimal and int convert through float()
+            data[name] = np.fromiter((np.nan if v is None else v for v in column), np.float64, len(rows))
+        elif dtype is object:
+            data[name] = np.empty(len(rows), dtype=object)
+            data[name][:] = column
+        else:
+            data[name] = pd.Series(column, dtype=dtype)
+    return pd.DataFrame(data, columns=list(data))
+
 class PGSQLData:
     def __init__(self):
         self.pool = None
 
-    async def execute_query(self, query):
+    @metrics.timed('l1_fetch', own_name=False)
+    async def execute_query(self, query, *args):
         """
-        Execute a query and return results as list of dicts.
-        
+        Execute a query and return the results as a DataFrame.
+        Uses the connection's prepared statement when the query was prepared on pool init
+        (queries in lazily_prepared_queries are prepared on their first run on a connection).
+
         Args:
             query: SQL query string
-            
+            *args: Query arguments for $n placeholders
+
         Returns:
-            List of dictionaries representing rows
+            DataFrame with one column per result column (see COLUMN_DTYPES)
         """
-        async with self.pool.acquire() as conn:
-            rows = await conn.fetch(query)
-            data = [dict(r) for r in rows]
-        return pd.DataFrame(data)
+        async with acquire_connection(self.pool) as conn:
+            statement = conn.prepared_statements.get(query)
+            if statement is None and query in lazily_prepared_queries:
+                statement = conn.prepared_statements[query] = await conn.prepare(query)
+            if statement is not None:
+                rows = await statement.fetch(*args)
+                columns = [attribute.name for attribute in statement.get_attributes()]
+            else:
+                rows = await conn.fetch(query, *args)
+                columns = None
+        return records_to_frame(rows, columns)
 
 if __name__ == '__main__':
     print('Done!')
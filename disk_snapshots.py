@@ -0,0 +1,113 @@
+# disk_snapshots.py
+"""
+L1 Snapshots on Disk for Warm Restarts
+======================================
+
+After a deploy or restart the first dashboard requests used to wait for the full
+`retrieve_dashboard_data` query plus the L1 transforms. Every refreshed L1 dataset is
+now also written to local disk, in the Arrow IPC snapshot format of the shared tier
+(shared_cache.write_snapshot), and on startup the refresher seeds its datasets from
+those snapshots: their files are memory-mapped (numeric columns are not even read until
+used) and served at once as stale data while the first refresh runs in the background.
+The directory is private to the server's user, as for the shared tier
+(shared_cache.ensure_private_directory): a snapshot found there is served as real data.
+
+Snapshots older than MAX_SNAPSHOT_AGE_SECONDS are ignored, so a server that was down
+for long does not show yesterday's scores; a dataset without a usable snapshot makes
+startup fall back to the blocking warm-up. Restored data is then served for no longer
+than its stale limit (see refresher.py) if the refreshes fail.
+
+With several workers only the leader refreshes, so only it writes and restores; the
+followers get the restored datasets through the shared tier.
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+from refresher import refresh_scheduler
+from shared_cache import ensure_private_directory, read_snapshot, read_snapshot_header, write_snapshot
+
+DISK_SNAPSHOTS_ENABLED = os.getenv('DISK_SNAPSHOTS', '1') == '1'
+DISK_SNAPSHOT_DIR = os.getenv('DISK_SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), f'volt_snapshots-{os.geteuid()}'))
+MAX_SNAPSHOT_AGE_SECONDS = int(os.getenv('DISK_SNAPSHOT_MAX_AGE_SECONDS', str(24 * 3600)))
+
+class DiskSnapshotStore:
+    def __init__(self, refresh_scheduler, directory=DISK_SNAPSHOT_DIR, max_age_seconds=MAX_SNAPSHOT_AGE_SECONDS):
+        self.refresh_scheduler = refresh_scheduler
+        self.directory = directory
+        self.max_age_seconds = max_age_seconds
+        self.written = {}  # dataset name -> last written value (an unchanged object is not rewritten)
+        self.store_stats = {
+            'written': 0,
+            'write_seconds_total': 0.0,
+            'write_errors': 0,
+            'restored': 0,
+            'restore_seconds_total': 0.0,
+            'snapshot_bytes': {},
+        }
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def enable(self):
+        """Write every refreshed dataset to disk and restore from those files on the next start"""
+        self.refresh_scheduler.add_listener(self._save)
+        self.refresh_scheduler.restore_source = self._restore
+
+    def disable(self):
+        self.refresh_scheduler.remove_listener(self._save)
+        if self.refresh_scheduler.restore_source == self._restore:
+            self.refresh_scheduler.restore_source = None
+
+    async def _save(self, fetch_func, data):
+        """Refresh listener: write a new version of the dataset's snapshot"""
+        name = fetch_func.__name__
+        if self.written.get(name) is data:
+            return
+        start = time.monotonic()
+        try:
+            await asyncio.to_thread(ensure_private_directory, self.directory)
+            size = await asyncio.to_thread(write_snapshot, self._path(name), data)
+        except OSError as e:
+            # A full or read-only disk must not stop the refresher; the next refresh retries
+            self.store_stats['write_errors'] += 1
+            print(f"❌ ERROR writing the snapshot of {name} to {self.directory}: {e}")
+            return
+        self.written[name] = data
+        self.store_stats['written'] += 1
+        self.store_stats['write_seconds_total'] += time.monotonic() - start
+        self.store_stats['snapshot_bytes'][name] = size
+
+    async def _restore(self, fetch_func):
+        """Restore source of the refresher: (data, saved_at) of a recent enough snapshot, or None"""
+        name = fetch_func.__name__
+        path = self._path(name)
+        try:
+            await asyncio.to_thread(ensure_private_directory, self.directory)
+            saved_at = await asyncio.to_thread(read_snapshot_header, path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Ignoring the unreadable snapshot {path}: {e}")
+            return None
+        if time.time() - saved_at > self.max_age_seconds:
+            return None
+
+        start = time.monotonic()
+        data, info = await asyncio.to_thread(read_snapshot, path)
+        # Already on disk: the first refresh only rewrites it if it returns a new object
+        self.written[name] = data
+        self.store_stats['restored'] += 1
+        self.store_stats['restore_seconds_total'] += time.monotonic() - start
+        self.store_stats['snapshot_bytes'][name] = info['bytes']
+        print(f"💾 Restored {name} from a snapshot saved {time.time() - saved_at:.0f}s ago")
+        return data, saved_at
+
+    def stats(self):
+        return {'enabled': DISK_SNAPSHOTS_ENABLED, 'directory': self.directory, **self.store_stats}
+
+
+# Global disk snapshot store instance
+disk_snapshots = DiskSnapshotStore(refresh_scheduler)
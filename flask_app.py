@@ -1,17 +1,47 @@
-from quart import Quart, request, jsonify, send_file,make_response
+from quart import Quart, request, jsonify, send_file,make_response, Response
 from quart_cors import cors
 from data_preprocessing.main import *
 import ast
-import inspect
+import asyncio
+import json
 import os
 from cache import cache_manager
+from pgsql_async_client import init_pool, close_pool, get_pool_stats
+from refresher import refresh_scheduler
+from shared_cache import shared_cache, SHARED_CACHE_ENABLED
+from disk_snapshots import disk_snapshots, DISK_SNAPSHOTS_ENABLED
+from render_pool import render_pool
+from pdf_cache import pdf_cache
+from registry import function_registry, ParamError
+from grid import parse_grid, apply_grid
+from metrics import metrics, loop_lag_monitor, render_samples
 import base64
 import secrets 
 
 app = Quart(__name__)
-app = cors(app, expose_headers=['Content-Disposition'])  # Enable CORS for Grafana requests
+app = cors(app, expose_headers=['Content-Disposition', 'X-Total-Count'])  # Enable CORS for Grafana requests
+
+# Upper bound on the queries answered by one /batch request
+MAX_BATCH_QUERIES = 50
+
+# L1 datasets rebuilt in the background: (fetch function, refresh interval seconds, stale limit seconds)
+# Dependents come after l1_get_rawdata_cleaned so they are rebuilt from the fresh raw data
+l1_refresh_schedule = [
+    (l1_get_rawdata_cleaned, 15, 120),
+    (l1_get_userid_name_mapping, 15, 120),
+    (l1_get_proper_dashboard_data_unprocessed, 15, 120),
+    (l1_get_lookup_indexes, 15, 120),
+    (l1_get_score_tensor, 15, 120),
+    (l1_get_aggregate_cube, 15, 120),
+]
 
 def check_authorization():
+    """
+    Check the request's bearer token against GF_DATASOURCE_KEY.
+
+    Returns:
+        True when authorized, otherwise the (error response, status) the route must return
+    """
     # Check Authorization header
     auth_header = request.headers.get('Authorization')
     
@@ -23,94 +53,300 @@ def check_authorization():
     
     # Extract token (remove "Bearer " prefix)
     provided_token = auth_header[7:]
+    expected_token = os.getenv('GF_DATASOURCE_KEY')
     
-    # Use constant-time comparison to prevent timing attacks
-    if secrets.compare_digest(provided_token, os.getenv('GF_DATASOURCE_KEY')):
+    # Use constant-time comparison to prevent timing attacks; no configured key authorizes nobody
+    if expected_token and secrets.compare_digest(provided_token.encode('utf-8'), expected_token.encode('utf-8')):
         return True
     else:
-        return False
+        return jsonify({"error": "Unauthorized - Invalid token"}), 403
+
+@app.before_serving
+async def startup():
+    """
+    Create the app-lifetime PostgreSQL pool, the PDF render workers and start the background L1 refresher and event-loop lag monitor.
+    With the shared snapshot tier (several workers) only the leading worker refreshes; the others load its snapshots.
+    With disk snapshots the L1 datasets are restored from the previous run and refreshed in the background.
+    """
+    # With the shared snapshot tier only the leading worker talks to Postgres (opening the pool on its first fetch)
+    if pg_client.pool is None and not SHARED_CACHE_ENABLED:
+        pg_client.pool = await init_pool()
+    render_pool.start()
+    loop_lag_monitor.start()
+
+    for fetch_func, interval_seconds, stale_after_seconds in l1_refresh_schedule:
+        refresh_scheduler.register(fetch_func, interval_seconds, stale_after_seconds)
+    if DISK_SNAPSHOTS_ENABLED:
+        disk_snapshots.enable()
+    if SHARED_CACHE_ENABLED:
+        await shared_cache.start()
+    else:
+        await refresh_scheduler.start()
+
+@app.after_serving
+async def shutdown():
+    """Stop the refresher, snapshot tier, lag monitor and render workers and close the PostgreSQL pool when the server stops"""
+    await refresh_scheduler.stop()
+    await shared_cache.stop()
+    await loop_lag_monitor.stop()
+    await render_pool.shutdown()
+    await close_pool()
+    pg_client.pool = None
+
+@app.route('/stats', methods=['GET'])
+async def stats():
+    """
+    Endpoint to return runtime stats (pool utilization, acquire wait times, L1 refresh status, PDF render queue and cache)
+    Usage: http://localhost:3003/stats
+    """
+    authorized = check_authorization()
+    if authorized is not True:
+        return authorized
+
+    return jsonify({"db_pool": get_pool_stats(), "refresher": refresh_scheduler.stats(), "render_pool": render_pool.stats(), "pdf_cache": pdf_cache.stats(), "cache": cache_manager.stats(), "shared_cache": shared_cache.stats(), "disk_snapshots": disk_snapshots.stats()})
+
+@app.route('/metrics', methods=['GET'])
+async def prometheus_metrics():
+    """
+    Endpoint to return Prometheus metrics (text exposition format): per-function request latency,
+    per-stage timings (see metrics.py), cache counters and entry sizes, pool utilization and event-loop lag
+    Usage: http://localhost:3003/metrics  (scrape with the datasource key as bearer token)
+    """
+    authorized = check_authorization()
+    if authorized is not True:
+        return authorized
+
+    cache_stats = cache_manager.stats()
+    entry_bytes, memo_bytes = cache_manager.entry_sizes()
+    db_pool = get_pool_stats()
+    renders = render_pool.stats()
+    pdfs = pdf_cache.stats()
+
+    lines = metrics.render() + loop_lag_monitor.render()
+    lines += render_samples('volt_cache_requests_total', 'Cache lookups by outcome', 'counter',
+                            [({'result': result}, cache_stats[result])
+                             for result in ('hits', 'pinned_hits', 'misses', 'hits_after_wait')])
+    lines += render_samples('volt_cache_lock_waits_total', 'Misses that waited for another coroutine fetching the same key (stampedes avoided)', 'counter',
+                            [({}, cache_stats['lock_waits'])])
+    lines += render_samples('volt_cache_fetches_total', 'Fetches run on cache misses', 'counter',
+                            [({}, cache_stats['fetches'])])
+    lines += render_samples('volt_cache_entries', 'Cached entries', 'gauge',
+                            [({'store': 'l1'}, cache_stats['entries']), ({'store': 'memo'}, cache_stats['memo_entries'])])
+    lines += render_samples('volt_cache_entry_bytes', 'Shallow memory use of cached entries', 'gauge',
+                            [({'key': key}, size) for key, size in entry_bytes.items()] + [({'key': 'memo'}, memo_bytes)])
+    lines += render_samples('volt_db_pool_connections', 'PostgreSQL pool connections', 'gauge',
+                            [({'state': state}, db_pool[state]) for state in ('size', 'in_use', 'idle', 'max_size')])
+    lines += render_samples('volt_db_pool_acquire_wait_seconds_avg', 'Average wait to acquire a connection', 'gauge',
+                            [({}, db_pool['acquire_wait_avg_seconds'])])
+    lines += render_samples('volt_render_pool_jobs', 'PDF render jobs waiting for and holding a worker', 'gauge',
+                            [({'state': 'queued'}, renders['queued']), ({'state': 'running'}, renders['running'])])
+    lines += render_samples('volt_render_pool_jobs_total', 'Finished PDF render jobs', 'counter',
+                            [({'result': 'completed'}, renders['completed']), ({'result': 'failed'}, renders['failed'])])
+    lines += render_samples('volt_pdf_cache_requests_total', 'On-disk report card cache lookups', 'counter',
+                            [({'result': 'hits'}, pdfs['hits']), ({'result': 'misses'}, pdfs['misses'])])
+    lines += render_samples('volt_pdf_cache_bytes', 'Size of the on-disk report card cache', 'gauge',
+                            [({}, pdfs['bytes'])])
+
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
     
+def parse_params():
+    """
+    The request's 'params' argument as a dict. JSON, or the Python-literal dict
+    (single quotes) that older panels send.
+    """
+    raw = request.args.get('params')
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(raw)
+    except (ValueError, SyntaxError):
+        raise ParamError("params must be a JSON object")
+
 @app.route('/data', methods=['GET'])
 async def get_data():
     """
-    Endpoint to return DataFrame data for both sync and async functions
+    Endpoint to return DataFrame data of a registered function (see registry.py)
     Usage: http://localhost:3003/data?fn=exam_wise_top_scorers
+    Add format=columnar for a Grafana data frame (field names once, one value array per column)
+    Grid functions also take limit, offset, sort, order, search and columns (see grid.py); the
+    number of rows matching the search is returned in the X-Total-Count header
     """
-    if check_authorization() == False:
-        return jsonify({"error": "Unauthorized - Invalid token"}), 403
+    authorized = check_authorization()
+    if authorized is not True:
+        return authorized
     
     fn_name = request.args.get('fn')
-    if 'params' in request.args:
-        params = ast.literal_eval(request.args.get('params'))
-    else:
-        params = {}
-        
-    # Check if function exists
-    if fn_name in globals() and callable(globals()[fn_name]):
-        try:
-            func = globals()[fn_name]
-
-            if 'user_id' in request.headers:
-                params['user_id'] = request.headers.get('user_id').upper()
-                
-            # Check if function is async
-            if inspect.iscoroutinefunction(func):
-                # It's an async function - await it
-                df = await func(**params)
-            else:
-                # It's a sync function - call normally
-                df = func(**params)
+    entry = function_registry.get(fn_name, kind='data')
+    if entry is None:
+        return jsonify({"error": f"Function '{fn_name}' not found."}), 400
+
+    try:
+        params = function_registry.bind(entry, parse_params(), request.headers.get('user_id'))
+        grid = parse_grid(entry, request.args)
+    except ParamError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        with metrics.request(fn_name):
+            df = await function_registry.call(entry, params)
+            headers = {}
+            if grid is not None:
+                df, total = apply_grid(df, grid)
+                headers['X-Total-Count'] = str(total)
+
+            if request.args.get('format') == 'columnar':
+                return Response(dataframe_to_columnar_json(df), mimetype='application/json', headers=headers)
 
             json_data = dataframe_to_json(df)
-            return json_data
-        except Exception as e:
-            return jsonify({"error": str(e)})
-    else:
-        return jsonify({"error": f"Function '{fn_name}' not found."}), 400
+        if headers:
+            return jsonify(json_data), 200, headers
+        return json_data
+    except ParamError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)})
 
 @app.route('/pdf_data')
 async def pdf_data():
     """
-    Endpoint to return PDF data for both sync and async functions
+    Endpoint to return PDF data of a registered PDF function (see registry.py)
     Usage: http://localhost:3003/pdf_data?fn=report_card_trainee
+    Add format=binary to get the PDF itself (application/pdf, Content-Disposition) instead of base64 in JSON
     """
 
-    if check_authorization() == False:
-        return jsonify({"error": "Unauthorized - Invalid token"}), 403
+    authorized = check_authorization()
+    if authorized is not True:
+        return authorized
     
     fn_name = request.args.get('fn')
-    if 'params' in request.args:
-        params = ast.literal_eval(request.args.get('params'))
-    else:
-        params = {}
+    entry = function_registry.get(fn_name, kind='pdf')
+    if entry is None:
+        return jsonify({"error": f"Function '{fn_name}' not found."}), 400
+
+    try:
+        params = function_registry.bind(entry, parse_params(), request.headers.get('user_id'))
+    except ParamError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        with metrics.request(fn_name):
+            pdf_bytes = await function_registry.call(entry, params)
+
+        if request.args.get('format') == 'binary':
+            response = Response(iter_chunks(pdf_bytes), mimetype='application/pdf')
+            response.headers['Content-Length'] = str(len(pdf_bytes))
+            response.headers['Content-Disposition'] = f'attachment; filename="{fn_name}.pdf"'
+            return response
+
+        # Encode the PDF bytes directly
+        encoded_pdf = base64.b64encode(pdf_bytes).decode('utf-8')
+
+        return jsonify({
+            "filename": f"{fn_name}.pdf",
+            "contentType": "application/pdf",
+            "blob": encoded_pdf
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/batch', methods=['POST'])
+async def batch():
+    """
+    Endpoint to answer several registered data functions (e.g. all panels of a dashboard) in one
+    round trip. All of them are evaluated against one pinned L1 snapshot, so they agree with each
+    other and share cached intermediate results.
+    Usage: POST http://localhost:3003/batch
+        {"queries": [{"refId": "stats", "fn": "l2_get_stats_main"},
+                     {"refId": "grid", "fn": "l2_status_wise_grid", "params": {"attempts": "Final"}, "limit": 50}],
+         "format": "columnar"}    (format is optional, as in /data)
+    Grid parameters (see grid.py) go next to "params", as they go next to it in /data.
+    Returns {"results": {refId: {"data": ...} or {"error": ..., "status": ...}}} in request order;
+    results of queries with grid parameters also hold "total", the rows matching the search
+    """
+    authorized = check_authorization()
+    if authorized is not True:
+        return authorized
 
-    # Check if function exists
-    if fn_name in globals() and callable(globals()[fn_name]):
+    body = await request.get_json(silent=True)
+    queries = body.get('queries') if isinstance(body, dict) else None
+    if not isinstance(queries, list) or not queries:
+        return jsonify({"error": "Body must be {\"queries\": [{\"refId\", \"fn\", \"params\"}, ...]}"}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({"error": f"At most {MAX_BATCH_QUERIES} queries per batch"}), 400
+    columnar = body.get('format') == 'columnar'
+    user_id = request.headers.get('user_id')
+
+    ref_ids = []
+    results = {}
+    calls = {}
+    for index, query in enumerate(queries):
+        query = query if isinstance(query, dict) else {}
+        ref_id = str(query.get('refId', query.get('fn', index)))
+        if ref_id in ref_ids:
+            return jsonify({"error": f"Duplicate refId '{ref_id}'"}), 400
+        ref_ids.append(ref_id)
+
+        fn_name = query.get('fn')
+        entry = function_registry.get(fn_name, kind='data')
+        if entry is None:
+            results[ref_id] = {"error": f"Function '{fn_name}' not found.", "status": 400}
+            continue
+        try:
+            calls[ref_id] = (entry, function_registry.bind(entry, query.get('params') or {}, user_id), parse_grid(entry, query))
+        except ParamError as e:
+            results[ref_id] = {"error": str(e), "status": 400}
+
+    async def run(entry, params, grid):
         try:
-            func = globals()[fn_name]
-
-            if 'user_id' in request.headers:
-                params['user_id'] = request.headers.get('user_id').upper()
-                
-            # Check if function is async
-            if inspect.iscoroutinefunction(func):
-                pdf_bytes = await func(**params)
-            else:
-                pdf_bytes = func(**params)
-
-            # Encode the PDF bytes directly
-            encoded_pdf = base64.b64encode(pdf_bytes).decode('utf-8')
-
-            return jsonify({
-                "filename": f"{fn_name}.pdf",
-                "contentType": "application/pdf",
-                "blob": encoded_pdf
-            })
+            with metrics.request(entry['name']):
+                df = await function_registry.call(entry, params)
+                total = None
+                if grid is not None:
+                    df, total = apply_grid(df, grid)
+                result = {"data": dataframe_to_columnar_frame(df) if columnar else dataframe_to_json(df)}
+                if total is not None:
+                    result["total"] = total
+                return result
+        except ParamError as e:
+            return {"error": str(e), "status": 400}
         except Exception as e:
-            return jsonify({"error": str(e)}), 500
-    else:
-        return jsonify({"error": f"Function '{fn_name}' not found."}), 400
-    
+            return {"error": str(e), "status": 500}
+
+    with cache_manager.pinned():
+        outputs = await asyncio.gather(*(run(entry, params, grid) for entry, params, grid in calls.values()))
+    results.update(zip(calls, outputs))
+
+    payload = {"results": {ref_id: results[ref_id] for ref_id in ref_ids}}
+    if columnar:
+        return Response(encode_json(payload), mimetype='application/json')
+    return jsonify(payload)
+
+@app.route('/pdf_bulk')
+async def pdf_bulk():
+    """
+    Endpoint to stream report cards of every trainee (or one department's trainees) as a ZIP,
+    rendered across the PDF worker processes. The archive ends with summary.json (counts, PDFs/sec).
+    Usage: http://localhost:3003/pdf_bulk?dep=All
+    """
+
+    authorized = check_authorization()
+    if authorized is not True:
+        return authorized
+
+    chosen_dep = request.args.get('dep', 'All')
+    user_id = request.headers.get('user_id')
+    if user_id:
+        user_id = user_id.upper()
+
+    response = Response(stream_zip(report_cards_bulk(chosen_dep, user_id=user_id)), mimetype='application/zip')
+    file_name = unquote(chosen_dep).replace('"', '')
+    response.headers['Content-Disposition'] = f'attachment; filename="report_cards_{file_name}.zip"'
+    response.timeout = None  # Rendering a whole batch can outlast the default response timeout
+    return response
 
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=3005, debug=False, workers= 1)
@@ -0,0 +1,119 @@
+# grid.py
+"""
+Server-Side Grid Parameters
+===========================
+
+Grid panels (candidate x score/status tables) used to receive every candidate and
+every column, megabytes of JSON for a 50-row page. Data functions registered with a
+grid search column (see registry.py) accept the standard grid parameters, applied to
+the function's (memoized, full) result before serialization:
+
+    limit, offset   page of rows (offset defaults to 0, limit to every remaining row)
+    sort, order     column to sort on, 'asc' (default) or 'desc'; empty cells sort last
+    search          case-insensitive substring of the entry's search column (candidate name)
+    columns         comma-separated columns to return, in that order
+
+The routes report the number of rows matching the search (before paging) for the pager:
+the X-Total-Count header on /data, "total" in each /batch result. Only the page is copied
+and serialized, so payload and serialization cost follow the page size, not the cohort.
+"""
+
+import numpy as np
+
+from registry import ParamError
+
+GRID_PARAMS = ('limit', 'offset', 'sort', 'order', 'search', 'columns')
+MAX_GRID_LIMIT = 10_000
+
+def _non_negative_int(name, value):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ParamError(f"Parameter '{name}' must be an integer")
+    if number < 0:
+        raise ParamError(f"Parameter '{name}' must not be negative")
+    return number
+
+def parse_grid(entry, source):
+    """
+    Grid parameters of one request.
+
+    Args:
+        entry: Registry entry of the called function
+        source: Mapping holding the request arguments (request.args, a /batch query)
+
+    Returns:
+        Dict of the grid parameters given, or None when there are none
+
+    Raises:
+        ParamError: Malformed values, or grid parameters for a function without a grid
+    """
+    given = {name: source.get(name) for name in GRID_PARAMS if source.get(name) not in (None, '')}
+    if not given:
+        return None
+    if entry['grid'] is None:
+        raise ParamError(f"{entry['name']} does not take grid parameters ({', '.join(given)})")
+
+    grid = {'search_column': entry['grid'], 'offset': 0, 'limit': None, 'sort': None, 'order': 'asc',
+            'search': None, 'columns': None}
+    if 'limit' in given:
+        grid['limit'] = _non_negative_int('limit', given['limit'])
+        if grid['limit'] > MAX_GRID_LIMIT:
+            raise ParamError(f"Parameter 'limit' must be at most {MAX_GRID_LIMIT}")
+    if 'offset' in given:
+        grid['offset'] = _non_negative_int('offset', given['offset'])
+    if 'order' in given:
+        grid['order'] = str(given['order']).lower()
+        if grid['order'] not in ('asc', 'desc'):
+            raise ParamError("Parameter 'order' must be one of asc, desc")
+    if 'sort' in given:
+        grid['sort'] = str(given['sort'])
+    if 'search' in given:
+        grid['search'] = str(given['search'])
+    if 'columns' in given:
+        columns = given['columns']
+        columns = columns.split(',') if isinstance(columns, str) else columns
+        if not isinstance(columns, list) or not all(isinstance(column, str) for column in columns):
+            raise ParamError("Parameter 'columns' must be a comma-separated list of column names")
+        grid['columns'] = [column.strip() for column in columns if column.strip()]
+    return grid
+
+def apply_grid(df, grid):
+    """
+    Search, sort, page and project a grid function's result.
+
+    Args:
+        df: Full result of the function (not modified)
+        grid: parse_grid result
+
+    Returns:
+        (page DataFrame, number of rows matching the search)
+
+    Raises:
+        ParamError: Unknown sort or projected columns
+    """
+    unknown = [column for column in (grid['columns'] or []) + [grid['sort']] if column is not None and column not in df.columns]
+    if unknown:
+        raise ParamError(f"Unknown column(s): {', '.join(unknown)}")
+
+    positions = np.arange(len(df))
+    if grid['search']:
+        names = df[grid['search_column']]
+        matches = names.str.contains(grid['search'], case=False, regex=False, na=False).to_numpy(dtype=bool)
+        positions = positions[matches]
+    total = len(positions)
+
+    if grid['sort'] is not None:
+        # Only the sort column is sorted; the frame itself is sliced once, for the page
+        keys = df[grid['sort']].iloc[positions].reset_index(drop=True)
+        try:
+            order = keys.sort_values(ascending=grid['order'] == 'asc', kind='stable', na_position='last').index
+        except TypeError:
+            raise ParamError(f"Column '{grid['sort']}' mixes values that cannot be sorted together")
+        positions = positions[order.to_numpy()]
+
+    stop = None if grid['limit'] is None else grid['offset'] + grid['limit']
+    page = df.iloc[positions[grid['offset']:stop]]
+    if grid['columns'] is not None:
+        page = page[grid['columns']]
+    return page.reset_index(drop=True), total
@@ -29,6 +29,13 @@ employee_status_mapping =   {
 dummy_data_employees = ["Prem Dummy","Prem","Shaileja Nema","Beki Sunil","Ankit Mehta","Vikas Ghete"]
 dummy_rollno_prefixes = ["OM","F","AM","MR","GS"]
 
+# Pass mark (score percentage) of every exam attempt and final score, unless overridden below
+DEFAULT_PASS_THRESHOLD = 75.0
+
+# Department name -> pass mark, or {attempt name | 'Final': pass mark} (attempts left out use the default)
+# e.g. {'Legal': 80.0, 'Sales': {'Attempt 1': 60.0, 'Final': 70.0}}
+pass_thresholds = {}
+
 rollno_suffix_mapping =  {
                             'A':'Attempt 1',
                             'B':'Attempt 2',
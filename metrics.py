@@ -0,0 +1,198 @@
+# metrics.py
+"""
+Request and Stage Metrics
+=========================
+
+In-process Prometheus metrics, rendered by the /metrics route in the text exposition
+format (no client library needed).
+
+- volt_request_seconds{fn}: latency of every registered function call made by a route
+  (its _count is the per-function request count)
+- volt_stage_seconds{stage, fn}: time spent in one processing stage. Stages nest (an L2
+  transform awaits L1 data, which awaits the L1 fetch), so each records its exclusive time:
+  its own duration minus that of the stages it awaited. Stages without an explicit fn
+  inherit it from the enclosing stage or request.
+
+    l1_fetch      PGSQLData.execute_query
+    l1_transform  L1 dataset functions (cleaning, wide matrix) minus their fetch
+    l2_transform  every L2 function wrapped by pre_post_process
+    serialize     dataframe_to_json / dataframe_to_columnar_frame
+    pdf_build     report card rendering in render_pool
+
+Gauges (cache, pools, event-loop lag) are not stored here; the route reads them from the
+components' stats() when scraped. Recording a sample is a few dict operations, cheap
+enough for every call.
+"""
+
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import functools
+import inspect
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Innermost open stage: {'fn': label, 'children': seconds spent in stages awaited from it}
+_current_stage = contextvars.ContextVar('metrics_current_stage', default=None)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.series = {}  # label values -> [per-bucket counts (last is +Inf), sum]
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for key, (counts, total) in sorted(self.series.items()):
+            labels = dict(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels({**labels, "le": _number(bound)})} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(labels)} {cumulative}')
+        return lines
+
+def render_samples(name, help_text, metric_type, samples):
+    """
+    Exposition lines of a gauge or counter read at scrape time.
+
+    Args:
+        name: Metric name
+        help_text: HELP line
+        metric_type: 'gauge' or 'counter'
+        samples: Iterable of (labels dict, value)
+    """
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+    for labels, value in samples:
+        lines.append(f'{name}{_labels(labels)} {_number(value)}')
+    return lines
+
+class Metrics:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.request_seconds = Histogram('volt_request_seconds',
+                                         'Latency of registered function calls made by the routes', ['fn'], buckets)
+        self.stage_seconds = Histogram('volt_stage_seconds',
+                                       'Exclusive time spent in each processing stage', ['stage', 'fn'], buckets)
+
+    @contextlib.contextmanager
+    def _frame(self, fn, on_exit):
+        parent = _current_stage.get()
+        frame = {'fn': fn if fn is not None else (parent['fn'] if parent else ''), 'children': 0.0}
+        token = _current_stage.set(frame)
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started_at
+            _current_stage.reset(token)
+            if parent is not None:
+                parent['children'] += elapsed
+            on_exit(frame, elapsed)
+
+    def stage(self, stage, fn=None):
+        """Context manager timing the block as one stage (exclusive of the stages it awaits)"""
+        def record(frame, elapsed):
+            # Concurrent children (gather) can add up to more than the parent's wall time
+            self.stage_seconds.observe(max(elapsed - frame['children'], 0.0), stage=stage, fn=frame['fn'])
+        return self._frame(fn, record)
+
+    def request(self, fn):
+        """Context manager timing one registered function call; stages inside it inherit fn"""
+        return self._frame(fn, lambda frame, elapsed: self.request_seconds.observe(elapsed, fn=fn))
+
+    def timed(self, stage, own_name=True):
+        """
+        Decorator timing every call of a function as a stage.
+
+        Args:
+            stage: Stage label
+            own_name: Label the samples with the function's name; False inherits the
+                      enclosing stage's fn (e.g. execute_query inside an L1 function)
+        """
+        def decorator(func):
+            fn = func.__name__ if own_name else None
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def wrapper(*args, **kwargs):
+                    with self.stage(stage, fn):
+                        return await func(*args, **kwargs)
+            else:
+                @functools.wraps(func)
+                def wrapper(*args, **kwargs):
+                    with self.stage(stage, fn):
+                        return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def render(self):
+        """Exposition lines of the histograms"""
+        return self.request_seconds.render() + self.stage_seconds.render()
+
+class LoopLagMonitor:
+    """Measures how late a periodic sleep wakes up - time the event loop spent blocked"""
+
+    def __init__(self, interval_seconds=0.5, buckets=LATENCY_BUCKETS):
+        self.interval_seconds = interval_seconds
+        self.lag_seconds = Histogram('volt_event_loop_lag_seconds',
+                                     'Event loop wake-up delay over the sampling interval', [], buckets)
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+        self.task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval_seconds
+            await asyncio.sleep(self.interval_seconds)
+            lag = max(loop.time() - expected, 0.0)
+            self.last_lag_seconds = lag
+            self.max_lag_seconds = max(self.max_lag_seconds, lag)
+            self.lag_seconds.observe(lag)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            task, self.task = self.task, None
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    def render(self):
+        return self.lag_seconds.render() + render_samples(
+            'volt_event_loop_lag_last_seconds', 'Most recent event loop lag sample', 'gauge',
+            [({}, self.last_lag_seconds)])
+
+
+# Global metrics instances
+metrics = Metrics()
+loop_lag_monitor = LoopLagMonitor()
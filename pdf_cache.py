@@ -0,0 +1,154 @@
+# pdf_cache.py
+"""
+On-Disk Cache for Rendered Report Cards
+=======================================
+
+Report cards are re-downloaded far more often than a trainee's scores change, and
+every download used to cost a full ReportLab build. Rendered PDFs are kept on local
+disk, content-addressed: the key is the employee id plus a hash of the trainee's
+formatted score-matrix rows (and of the name printed on the card). When L1 data changes
+a trainee's row the hash changes, so the stale card is simply never asked for again; it
+is deleted as soon as a card from the new rows is stored.
+
+The directory is capped in bytes; least recently used files are evicted first. Recency
+is kept in file mtimes, so the order survives restarts. A card found there is served as
+is, so the directory is per-user and checked to be private to this user
+(shared_cache.ensure_private_directory); if the check fails the cache is not used.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+from collections import OrderedDict
+
+from shared_cache import ensure_private_directory
+
+PDF_CACHE_DIR = os.getenv('PDF_CACHE_DIR', os.path.join(tempfile.gettempdir(), f'volt_report_cards-{os.geteuid()}'))
+PDF_CACHE_MAX_BYTES = int(os.getenv('PDF_CACHE_MAX_MB', '256')) * 2**20
+
+class PDFCache:
+    def __init__(self, directory=PDF_CACHE_DIR, max_bytes=PDF_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = None  # file name -> size, least recently used first (loaded lazily)
+        self.total_bytes = 0
+        self.cache_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    def make_key(self, employee_id, header, rows, candidate=None):
+        """
+        File name for one rendered card: '<employee id>-<hash of the score rows>-<hash of the name>.pdf'.
+        The name is hashed apart so the cards with and without the candidate name can coexist,
+        while a changed score row marks every older card of that trainee as stale.
+
+        Args:
+            employee_id: Employee code on the card
+            header, rows: Table from score_matrix_table
+            candidate: Candidate name on the card
+        """
+        scores = json.dumps([header, rows], default=str, separators=(',', ':'))
+        scores_digest = hashlib.sha256(scores.encode('utf-8')).hexdigest()[:32]
+        name_digest = hashlib.sha256(str(candidate).encode('utf-8')).hexdigest()[:8]
+        owner = re.sub(r'[^A-Za-z0-9_]+', '_', str(employee_id)) if employee_id else 'unknown'
+        return f'{owner}-{scores_digest}-{name_digest}.pdf'
+
+    def _scan(self):
+        """Files already on disk as (name, size), oldest mtime first"""
+        ensure_private_directory(self.directory)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.pdf') and entry.name.count('-') == 2:
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        return [(name, size) for _, name, size in sorted(files)]
+
+    async def _load(self):
+        """Build the LRU index from the directory on first use"""
+        files = await asyncio.to_thread(self._scan)
+        if self.entries is None:
+            self.entries = OrderedDict(files)
+            self.total_bytes = sum(self.entries.values())
+
+    def _read_file(self, key):
+        path = os.path.join(self.directory, key)
+        with open(path, 'rb') as f:
+            data = f.read()
+        os.utime(path)  # Persist recency for the next _load
+        return data
+
+    def _write_file(self, key, data):
+        # Write to a temp file and rename, so readers never see a partial PDF
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(self.directory, key))
+
+    def _remove_files(self, keys):
+        for key in keys:
+            try:
+                os.remove(os.path.join(self.directory, key))
+            except FileNotFoundError:
+                pass
+
+    async def get(self, key):
+        """Cached PDF bytes for key, or None"""
+        # File IO runs in a thread; the index is only touched on the event loop
+        data = None
+        try:
+            if self.entries is None:
+                await self._load()
+        except OSError as e:
+            # An unusable directory only costs us the cache; the card is rendered instead
+            print(f"⚠️ Not using the PDF cache in {self.directory}: {e}")
+            self.cache_stats['misses'] += 1
+            return None
+        if key in self.entries:
+            try:
+                data = await asyncio.to_thread(self._read_file, key)
+                self.entries.move_to_end(key)
+            except OSError:
+                self.total_bytes -= self.entries.pop(key, 0)
+        self.cache_stats['hits' if data is not None else 'misses'] += 1
+        return data
+
+    async def put(self, key, data):
+        """Store a rendered PDF, replacing older cards of the same trainee and evicting LRU files"""
+        try:
+            if self.entries is None:
+                await self._load()
+            await asyncio.to_thread(self._write_file, key, data)
+        except OSError as e:
+            # A full or read-only disk only costs us the cache
+            print(f"❌ ERROR storing {key} in the PDF cache: {e}")
+            return
+        self.cache_stats['stores'] += 1
+        self.total_bytes -= self.entries.pop(key, 0)
+        self.entries[key] = len(data)
+        self.total_bytes += len(data)
+
+        # Cards rendered from older score rows of this trainee can no longer be requested
+        owner, scores_digest, _ = key.split('-')
+        removed = [name for name in self.entries
+                   if name.split('-')[0] == owner and name.split('-')[1] != scores_digest]
+        for name in removed:
+            self.total_bytes -= self.entries.pop(name)
+
+        # Evict least recently used cards (never the one just stored)
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            name, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            removed.append(name)
+            self.cache_stats['evictions'] += 1
+
+        if removed:
+            await asyncio.to_thread(self._remove_files, removed)
+
+    def stats(self):
+        return {'directory': self.directory, 'max_bytes': self.max_bytes,
+                'entries': len(self.entries or ()), 'bytes': self.total_bytes, **self.cache_stats}
+
+
+# Global PDF cache instance
+pdf_cache = PDFCache()
@@ -1,20 +1,103 @@
 import os
+import time
 import asyncio
 import asyncpg
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
+from queries import pgsql_queries, lazily_prepared_queries
+
 load_dotenv()
 
+# App-lifetime pool, created once in Quart's before_serving hook and closed in after_serving
+pg_pool = None
+
+# Acquire wait time is measured around every pool.acquire() made through acquire_connection
+acquire_stats = {
+    'acquire_count': 0,
+    'acquire_wait_total_seconds': 0.0,
+    'acquire_wait_max_seconds': 0.0,
+}
+
+class PreparedConnection(asyncpg.Connection):
+    """Connection that keeps the statements from queries.pgsql_queries prepared for its lifetime"""
+    __slots__ = ('prepared_statements',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = {}
+
+async def prepare_statements(conn):
+    """
+    Pool init hook - prepares every static query once per connection.
+    Templated queries (Jinja placeholders) are skipped as they only become SQL once rendered,
+    and the incremental refresh queries (lazily_prepared_queries) are prepared on first use:
+    a failing statement here would fail every connection.
+    Statements are keyed by SQL text so callers keep passing plain query strings.
+    """
+    for query in pgsql_queries.values():
+        if '{{' in query or query in lazily_prepared_queries:
+            continue
+        conn.prepared_statements[query] = await conn.prepare(query)
+
 async def get_pool():
     pg_pool = await asyncpg.create_pool(
         dsn=os.getenv("PGSQL_CONNECTION_STRING"),
         min_size=1,
         max_size=10,
         timeout=10.0,
+        connection_class=PreparedConnection,
+        init=prepare_statements,
     )
 
     return pg_pool
 
+async def init_pool():
+    """Create the shared pool if it does not exist yet and return it"""
+    global pg_pool
+    if pg_pool is None:
+        pg_pool = await get_pool()
+    return pg_pool
+
+async def close_pool():
+    """Close the shared pool (if any)"""
+    global pg_pool
+    if pg_pool is not None:
+        await pg_pool.close()
+        pg_pool = None
+
+@asynccontextmanager
+async def acquire_connection(pool):
+    """pool.acquire() wrapper that records how long callers waited for a connection"""
+    start = time.perf_counter()
+    async with pool.acquire() as conn:
+        waited = time.perf_counter() - start
+        acquire_stats['acquire_count'] += 1
+        acquire_stats['acquire_wait_total_seconds'] += waited
+        acquire_stats['acquire_wait_max_seconds'] = max(acquire_stats['acquire_wait_max_seconds'], waited)
+        yield conn
+
+def get_pool_stats(pool=None):
+    """
+    Snapshot of pool utilization.
+
+    Returns:
+        Dict with pool size, in-use and idle connection counts and acquire wait times
+    """
+    pool = pool or pg_pool
+    count = acquire_stats['acquire_count']
+    stats = {
+        'initialized': pool is not None,
+        'min_size': pool.get_min_size() if pool else 0,
+        'max_size': pool.get_max_size() if pool else 0,
+        'size': pool.get_size() if pool else 0,
+        'idle': pool.get_idle_size() if pool else 0,
+        'acquire_wait_avg_seconds': acquire_stats['acquire_wait_total_seconds'] / count if count else 0.0,
+        **acquire_stats,
+    }
+    stats['in_use'] = stats['size'] - stats['idle']
+    return stats
+
 async def main():
     pool = await get_pool()
     try:
@@ -1,30 +1,29 @@
-pgsql_queries = \
-{
-
-"retrieve_dashboard_data":
-
+# Dashboard rows, one per (projectMasterId, candidateId) score group.
+# {score_group_filter} narrows the rawScore aggregation (empty for a full fetch).
+dashboard_data_query = \
 """
-select c2."rollNo", c2."candidateName", eh."hallName", c."courseName", 
-        pm."examDate", 
-        CASE 
+select c2."rollNo", c2."candidateName", eh."hallName", c."courseName",
+        pm."examDate",
+        CASE
           WHEN ec."candidateExamStartTime" is null THEN NULL
-          ELSE t."TotalCandidateScore"  
+          ELSE t."TotalCandidateScore"
         END as "TotalCandidateScore",
-        CASE 
+        CASE
           WHEN ec."candidateExamStartTime" is null THEN NULL
-          ELSE t."MaxPossibleScore"  
+          ELSE t."MaxPossibleScore"
         END as "MaxPossibleScore",
-        CASE 
+        CASE
           WHEN ec."candidateExamStartTime" is null THEN NULL
-          ELSE t."ScorePercentage"  
-        END as "ScorePercentage"
+          ELSE t."ScorePercentage"
+        END as "ScorePercentage",
+        t."projectMasterId", t."candidateId"
 from (
-    select rs."projectMasterId", rs."candidateId", 
-            sum(rs."score") as "TotalCandidateScore", 
-            sum(rs."totalScore") as "MaxPossibleScore", 
+    select rs."projectMasterId", rs."candidateId",
+            sum(rs."score") as "TotalCandidateScore",
+            sum(rs."totalScore") as "MaxPossibleScore",
             sum(rs."score")/sum(rs."totalScore") * 100 as "ScorePercentage"
     from "rawScore" rs
-    where rs."isDeleted" = false
+    where rs."isDeleted" = false{score_group_filter}
     group by rs."projectMasterId", rs."candidateId"
 ) as t
 left outer join "projectMaster" pm on pm.id = t."projectMasterId"
@@ -39,9 +38,51 @@ and c2."isDeleted" = false
 and c2."rPacksUploaded" = false
 and c."isDeleted" = false;
 """
+
+# Incremental refresh (data_preprocessing/first_layer_fns.py, INCREMENTAL_REFRESH=1) reads
+# rawScore."updatedAt", which must be set on every insert, update and soft delete. Without an
+# index on it each refresh scans rawScore three times (watermark, changed groups, their rows):
+#     create index concurrently if not exists "rawScore_updatedAt_idx" on "rawScore" ("updatedAt");
+
+# Score groups with any rawScore row (deleted or not) updated after the watermark $1
+changed_score_groups_filter = \
+"""
+    and (rs."projectMasterId", rs."candidateId") in (
+        select changed."projectMasterId", changed."candidateId"
+        from "rawScore" changed
+        where changed."updatedAt" > $1
+    )"""
+
+pgsql_queries = \
+{
+
+"retrieve_dashboard_data": dashboard_data_query.format(score_group_filter=""),
+
+"retrieve_dashboard_data_for_changed_groups": dashboard_data_query.format(score_group_filter=changed_score_groups_filter),
+
+"retrieve_changed_score_groups":
+
+"""
+select distinct rs."projectMasterId", rs."candidateId"
+from "rawScore" rs
+where rs."updatedAt" > $1;
+"""
+,
+
+"retrieve_rawscore_watermark":
+
+"""
+select max(rs."updatedAt") as "watermark"
+from "rawScore" rs;
+"""
 ,
 
 """retrieve_all_data""":
 
 """select * from public.'{{tn}}'"""
-}
\ No newline at end of file
+}
+
+# Prepared on first use rather than on pool init, so a schema without rawScore."updatedAt"
+# still gets working connections (see pgsql_async_client.prepare_statements)
+lazily_prepared_queries = {pgsql_queries[name] for name in (
+    'retrieve_dashboard_data_for_changed_groups', 'retrieve_changed_score_groups', 'retrieve_rawscore_watermark')}
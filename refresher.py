@@ -0,0 +1,163 @@
+# refresher.py
+"""
+Background Refresh of Layer 1 Datasets
+======================================
+
+Stale-while-revalidate for the expensive L1 datasets: registered fetch functions are
+rebuilt in a background task shortly before they go stale, while requests keep being
+served the previous snapshot from the cache. Request-path latency therefore never
+includes the database round trip once the app has warmed up.
+
+Each dataset has its own refresh interval and stale limit. The stale limit is how long
+a snapshot may still be served when refreshes keep failing; past it the cache entry
+expires and requests fall back to a blocking fetch.
+
+On startup the scheduler normally refreshes everything once before serving. With a
+restore source (see disk_snapshots.py) it first tries to seed every dataset from the
+last snapshot of the previous run instead; when all of them are restored the app
+serves those right away and the first refresh runs in the background.
+"""
+
+import asyncio
+import time
+
+from cache import cache_manager
+
+# Wait before retrying a failed refresh (capped by the dataset's own interval)
+RETRY_SECONDS = 5
+
+class RefreshScheduler:
+    def __init__(self, cache_manager):
+        self.cache_manager = cache_manager
+        self.jobs = []  # Refreshed in registration order, so register dependencies first
+        self.listeners = []  # async callbacks (fetch_func, data) run after every successful refresh
+        self.restore_source = None  # async callable (fetch_func) -> (data, saved_at epoch seconds) or None, see start()
+        self.task = None
+
+    def register(self, fetch_func, interval_seconds, stale_after_seconds):
+        """
+        Keep fetch_func's cache entry fresh in the background.
+
+        Args:
+            fetch_func: Zero-argument async L1 function cached through cache_manager
+            interval_seconds: How often to rebuild it
+            stale_after_seconds: How long the last good snapshot stays servable
+        """
+        self.cache_manager.set_max_age(fetch_func, stale_after_seconds)
+        self.jobs = [job for job in self.jobs if job['func'] is not fetch_func]
+        self.jobs.append({
+            'func': fetch_func,
+            'interval_seconds': interval_seconds,
+            'stale_after_seconds': stale_after_seconds,
+            'next_run': 0.0,
+            'last_success': None,
+            'last_duration_seconds': None,
+            'failures': 0,
+            'last_error': None,
+            'restored_age_seconds': None,
+        })
+
+    def add_listener(self, callback):
+        """Call `await callback(fetch_func, data)` with every freshly refreshed dataset"""
+        if callback not in self.listeners:
+            self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    async def _notify(self, fetch_func, data):
+        for callback in list(self.listeners):
+            try:
+                await callback(fetch_func, data)
+            except Exception as e:
+                print(f"❌ ERROR in refresh listener for {fetch_func.__name__}: {e}")
+
+    async def restore(self):
+        """
+        Seed every job's cache entry from restore_source, in registration order.
+
+        Returns:
+            True if every job was restored
+        """
+        if self.restore_source is None:
+            return False
+        restored = 0
+        for job in self.jobs:
+            try:
+                found = await self.restore_source(job['func'])
+            except Exception as e:
+                print(f"❌ ERROR restoring {job['func'].__name__}: {e}")
+                continue
+            if found is None:
+                continue
+            data, saved_at = found
+            await self.cache_manager.seed(job['func'], data)
+            job['restored_age_seconds'] = time.time() - saved_at
+            restored += 1
+            await self._notify(job['func'], data)
+        return restored == len(self.jobs)
+
+    async def refresh_due(self):
+        """Refresh every job whose next run time has passed, in registration order"""
+        for job in self.jobs:
+            if job['next_run'] > time.monotonic():
+                continue
+
+            start = time.monotonic()
+            try:
+                data = await self.cache_manager.refresh(job['func'])
+            except Exception as e:
+                print(f"❌ ERROR refreshing {job['func'].__name__}: {e}")
+                job['failures'] += 1
+                job['last_error'] = str(e)
+                job['next_run'] = time.monotonic() + min(RETRY_SECONDS, job['interval_seconds'])
+                continue
+
+            job['last_success'] = time.time()
+            job['last_duration_seconds'] = time.monotonic() - start
+            job['last_error'] = None
+            job['next_run'] = start + job['interval_seconds']
+
+            await self._notify(job['func'], data)
+
+    async def run(self):
+        while True:
+            await self.refresh_due()
+            next_run = min(job['next_run'] for job in self.jobs)
+            await asyncio.sleep(max(next_run - time.monotonic(), 0.1))
+
+    async def start(self, warm=True):
+        """
+        Start the background loop.
+
+        Args:
+            warm: Make sure every dataset is cached before returning, so the first requests hit
+                  the cache: restored from the last snapshots if all of them are available
+                  (refreshed right after, in the background), otherwise refreshed once
+        """
+        if not self.jobs or self.task is not None:
+            return
+        if warm and not await self.restore():
+            await self.refresh_due()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def stats(self):
+        """Per-dataset refresh status"""
+        return {
+            job['func'].__name__: {key: value for key, value in job.items() if key not in ('func', 'next_run')}
+            for job in self.jobs
+        }
+
+
+# Global scheduler instance
+refresh_scheduler = RefreshScheduler(cache_manager)
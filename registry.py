@@ -0,0 +1,154 @@
+# registry.py
+"""
+Function Registry
+=================
+
+Explicit catalogue of the functions the HTTP routes may call. Layer 2 functions register
+themselves with a decorator at import time, declaring:
+
+- params: parameter name -> type (str, int, float, bool) or a tuple of allowed string values.
+  Request parameters are validated and converted against it before the call.
+- kind: 'data' (returns a DataFrame, served by /data) or 'pdf' (returns bytes, /pdf_data)
+- cacheable / ttl_seconds: memoize through cache_manager, and for how long
+- cpu_heavy: synchronous functions with this flag run in a worker thread instead of on the
+  event loop (async ones offload their own heavy parts, e.g. to render_pool)
+- grid: column searched by the grid 'search' parameter; grid functions also accept paging,
+  sorting and column projection (see grid.py)
+
+Dispatch is then a dict lookup; nothing that is not registered can be called.
+"""
+
+import asyncio
+import inspect
+
+from cache import cache_manager
+
+# Memoized L2 results are also dropped as soon as the L1 data they were computed from changes
+L2_MEMO_TTL_SECONDS = 120
+
+class ParamError(ValueError):
+    """Request parameters that do not fit a function's declared schema"""
+
+def _convert(name, value, spec):
+    if isinstance(spec, (tuple, list)):
+        if value not in spec:
+            raise ParamError(f"Parameter '{name}' must be one of {', '.join(map(str, spec))}")
+        return value
+    if spec is bool:
+        if isinstance(value, bool):
+            return value
+        if str(value).lower() in ('true', '1', 'yes'):
+            return True
+        if str(value).lower() in ('false', '0', 'no'):
+            return False
+        raise ParamError(f"Parameter '{name}' must be a boolean")
+    if spec is str:
+        if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+            return str(value)
+        raise ParamError(f"Parameter '{name}' must be a string")
+    try:
+        return spec(value)
+    except (TypeError, ValueError):
+        raise ParamError(f"Parameter '{name}' must be of type {spec.__name__}")
+
+class FunctionRegistry:
+    def __init__(self, cache_manager, default_ttl_seconds=None):
+        self.cache_manager = cache_manager
+        self.default_ttl_seconds = default_ttl_seconds
+        self.entries = {}  # function name -> entry dict (see register)
+
+    def register(self, params=None, kind='data', cacheable=True, ttl_seconds=None, cpu_heavy=False, grid=None):
+        """
+        Decorator that registers a function and returns the callable to use from now on
+        (the memoized wrapper when cacheable), so direct internal callers share the cache.
+
+        Args:
+            params: Parameter name -> type or tuple of allowed values; every parameter of the
+                    function must be declared
+            kind: 'data' or 'pdf'
+            cacheable: Memoize results on their arguments through cache_manager
+            ttl_seconds: Max age of memoized results (default: the registry's default)
+            cpu_heavy: Run synchronous functions in a worker thread
+            grid: Name column searched by the grid parameters; None for functions without a grid
+        """
+        params = params or {}
+
+        def decorator(func):
+            name = func.__name__
+            signature = inspect.signature(func)
+            undeclared = set(signature.parameters) ^ set(params)
+            if undeclared:
+                raise ValueError(f"{name}: parameters {sorted(undeclared)} do not match the declared schema")
+
+            if cacheable and not inspect.iscoroutinefunction(func):
+                raise ValueError(f"{name}: only async functions can be memoized through cache_manager")
+
+            served = self.cache_manager.memoize(func) if cacheable else func
+            ttl = ttl_seconds if ttl_seconds is not None else self.default_ttl_seconds
+            if cacheable and ttl is not None:
+                self.cache_manager.set_max_age(name, ttl)
+
+            self.entries[name] = {
+                'name': name,
+                'func': served,
+                'params': params,
+                'required': [p.name for p in signature.parameters.values() if p.default is inspect.Parameter.empty],
+                'kind': kind,
+                'cacheable': cacheable,
+                'ttl_seconds': ttl if cacheable else None,
+                'cpu_heavy': cpu_heavy,
+                'grid': grid,
+                'is_async': inspect.iscoroutinefunction(func),
+            }
+            return served
+        return decorator
+
+    def get(self, name, kind='data'):
+        """Registered entry of that kind, or None"""
+        entry = self.entries.get(name)
+        if entry is None or entry['kind'] != kind:
+            return None
+        return entry
+
+    def bind(self, entry, params, user_id=None):
+        """
+        Validate request parameters against an entry's schema.
+
+        Args:
+            entry: Registry entry
+            params: Dict of request parameters
+            user_id: Caller's employee id (user_id header); passed on only to functions taking it
+
+        Returns:
+            Keyword arguments for the call
+
+        Raises:
+            ParamError: Unknown, missing or mistyped parameters
+        """
+        if not isinstance(params, dict):
+            raise ParamError("params must be an object of parameter names to values")
+        unknown = [name for name in params if name not in entry['params']]
+        if unknown:
+            raise ParamError(f"Unknown parameter(s) for {entry['name']}: {', '.join(map(str, unknown))}")
+
+        kwargs = {name: value if value is None else _convert(name, value, entry['params'][name])
+                  for name, value in params.items()}
+        if user_id and 'user_id' in entry['params']:
+            kwargs['user_id'] = user_id.upper()
+
+        missing = [name for name in entry['required'] if kwargs.get(name) is None]
+        if missing:
+            raise ParamError(f"Missing parameter(s) for {entry['name']}: {', '.join(missing)}")
+        return kwargs
+
+    async def call(self, entry, kwargs):
+        """Run a registered function with bound arguments"""
+        if entry['is_async']:
+            return await entry['func'](**kwargs)
+        if entry['cpu_heavy']:
+            return await asyncio.to_thread(entry['func'], **kwargs)
+        return entry['func'](**kwargs)
+
+
+# Global registry instance
+function_registry = FunctionRegistry(cache_manager, default_ttl_seconds=L2_MEMO_TTL_SECONDS)
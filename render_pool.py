@@ -0,0 +1,103 @@
+# render_pool.py
+"""
+Process Pool for CPU-Bound Rendering
+====================================
+
+ReportLab builds are pure CPU work; run inline they block the single event loop and
+every dashboard panel waits behind them. RenderPool runs such functions in a pool of
+spawned worker processes instead. Arguments and results cross the process boundary by
+pickling, so callers pass compact plain data (e.g. a formatted score matrix) and get
+bytes back.
+
+At most max_concurrency jobs are handed to the pool at once; further callers wait on
+a semaphore in the event loop, which is what the queue depth in stats() counts.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Every core but the ones running the web workers' event loops, split between the web workers (run.py)
+WEB_WORKERS = max(1, int(os.getenv('WEB_WORKERS', '1')))
+RENDER_WORKERS = max(1, ((os.cpu_count() or 2) - WEB_WORKERS) // WEB_WORKERS)
+
+class RenderPool:
+    def __init__(self, max_workers=RENDER_WORKERS, max_concurrency=None):
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency or max_workers
+        self.executor = None
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.render_stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'queued': 0,           # Waiting for a free slot
+            'running': 0,          # Handed to the pool
+            'max_queue_depth': 0,
+            'render_seconds_total': 0.0,
+            'wait_seconds_total': 0.0,
+        }
+
+    def start(self):
+        """Create the worker pool (spawned, so workers never inherit the event loop or DB pool)"""
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        return self.executor
+
+    async def run(self, func, *args):
+        """
+        Run func(*args) in a worker process and return its result.
+
+        Args:
+            func: Module-level (picklable) function
+            *args: Picklable arguments
+
+        Returns:
+            Whatever func returns
+        """
+        stats = self.render_stats
+        stats['submitted'] += 1
+        stats['queued'] += 1
+        stats['max_queue_depth'] = max(stats['max_queue_depth'], stats['queued'])
+        queued_at = time.monotonic()
+        try:
+            await self.semaphore.acquire()
+        finally:
+            stats['queued'] -= 1
+
+        started_at = time.monotonic()
+        stats['wait_seconds_total'] += started_at - queued_at
+        stats['running'] += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.start(), func, *args)
+        except Exception:
+            stats['failed'] += 1
+            raise
+        finally:
+            stats['running'] -= 1
+            stats['render_seconds_total'] += time.monotonic() - started_at
+            self.semaphore.release()
+
+        stats['completed'] += 1
+        return result
+
+    async def shutdown(self):
+        """Stop the workers (waits for running jobs)"""
+        if self.executor is not None:
+            executor, self.executor = self.executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+    def stats(self):
+        """Pool size, concurrency limit, queue depth and render counters"""
+        stats = dict(self.render_stats)
+        finished = stats['completed'] + stats['failed']
+        stats['render_seconds_avg'] = stats['render_seconds_total'] / finished if finished else 0.0
+        return {'max_workers': self.max_workers, 'max_concurrency': self.max_concurrency,
+                'started': self.executor is not None, **stats}
+
+
+# Global render pool instance
+render_pool = RenderPool()
@@ -1,15 +1,29 @@
 import asyncio
+import os
 from hypercorn.asyncio import serve
 from hypercorn.config import Config
+from hypercorn.run import run
+
+# Several workers share one copy of the L1 data through the snapshot tier (shared_cache.py):
+# one of them fetches from Postgres, the others map its snapshots
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', '1'))
+if WEB_WORKERS > 1:
+    os.environ.setdefault('SHARED_CACHE', '1')
+
 from flask_app import app
 
 config = Config()
 config.bind = ["0.0.0.0:3003"]
-config.workers = 1
+config.workers = WEB_WORKERS
 config.worker_class = "asyncio"
 
 if __name__ == "__main__":
-    asyncio.run(serve(app, config))
+    if config.workers > 1:
+        # Spawned worker processes import the app themselves
+        config.application_path = "flask_app:app"
+        run(config)
+    else:
+        asyncio.run(serve(app, config))
 
 # or run this 
 #hypercorn flask_app:app --bind 0.0.0.0:3005 --workers 1
\ No newline at end of file
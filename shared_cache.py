@@ -0,0 +1,357 @@
+# shared_cache.py
+"""
+Cross-Worker Snapshot Tier
+==========================
+
+With several Hypercorn workers (run.py, WEB_WORKERS) every process has its own
+cache_manager; uncoordinated, each would query Postgres and hold its own copy of every
+L1 frame. SharedSnapshotTier lets one worker fetch for all of them:
+
+- Leader election: the worker holding an exclusive flock on <dir>/leader.lock runs the
+  background refresher and publishes every refreshed L1 dataset as a snapshot.
+  The others (followers) retry the lock every ELECTION_INTERVAL_SECONDS and take over
+  when the leader exits - the OS drops the lock with the process.
+- Snapshots: one directory per dataset in /dev/shm (RAM backed), holding its latest
+  versions. A version is a JSON manifest plus an uncompressed Arrow IPC (Feather v2)
+  file per DataFrame or numpy array. Readers memory-map the files read-only; numeric
+  columns (float score columns keep NaN as a value) and arrays are used in place, so
+  they exist once per host, shared by all workers, while string columns are built in
+  each worker. Versions are renamed into place complete; a worker keeps its mapping of
+  an older version until it drops it.
+- The directory (<dir>, per user by default) must be owned by the server's user and
+  private (0700): snapshots are data only, but other users could still plant or alter
+  the L1 data every worker serves.
+- Followers fill the L1 cache entries from snapshots (cache_manager loaders) and poll the
+  snapshots every FOLLOW_INTERVAL_SECONDS. A new version is loaded through
+  cache_manager.refresh, so L2 results computed from the previous one are invalidated
+  just as on the leader.
+
+Enabled with SHARED_CACHE=1 (run.py sets it when WEB_WORKERS > 1).
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import shutil
+import stat
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from cache import cache_manager
+from refresher import refresh_scheduler
+
+SHARED_CACHE_ENABLED = os.getenv('SHARED_CACHE', '0') == '1'
+SHARED_CACHE_DIR = os.getenv('SHARED_CACHE_DIR', os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), f'volt_cache-{os.geteuid()}'))
+FOLLOW_INTERVAL_SECONDS = 1
+ELECTION_INTERVAL_SECONDS = 5
+# How long a read on a follower waits for a first usable snapshot before it fails
+SNAPSHOT_WAIT_SECONDS = 60
+
+SNAPSHOT_VERSIONS_KEPT = 2  # the latest version and the one readers may still be opening
+
+def ensure_private_directory(path):
+    """
+    Create path (mode 0700) if needed and check that only this user can use it.
+
+    Raises:
+        PermissionError: path is a symlink, not a directory, owned by another user, or
+            readable/writable by group or others (another user may have created it first)
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.geteuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{path} must be a directory owned by uid {os.geteuid()} with mode 0700")
+
+def _frame_table(df):
+    table = pa.Table.from_pandas(df)
+    # Float columns keep NaN as a value (no validity bitmap), so readers can use the
+    # mapped buffer as the column instead of filling in the nulls
+    for position, dtype in enumerate(df.dtypes):
+        if dtype == np.float64:
+            table = table.set_column(position, table.schema.field(position), pa.array(df.iloc[:, position].to_numpy()))
+    return table
+
+def _write_table(path, table):
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return os.path.getsize(path)
+
+def _encode(value, directory, parts):
+    """Manifest node of value; frames and arrays are written to part files of directory"""
+    if isinstance(value, pd.DataFrame) or isinstance(value, np.ndarray):
+        name = f'part-{len(parts)}.feather'
+        if isinstance(value, pd.DataFrame):
+            node = {'frame': name}
+            table = _frame_table(value)
+        else:
+            node = {'array': name, 'shape': list(value.shape)}
+            table = pa.table({'values': pa.array(np.ascontiguousarray(value).reshape(-1))})
+        parts.append(_write_table(os.path.join(directory, name), table))
+        return node
+    if isinstance(value, dict):
+        if not all(isinstance(key, str) for key in value):
+            raise TypeError("Snapshot dicts must have string keys")
+        return {'dict': {key: _encode(item, directory, parts) for key, item in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return {type(value).__name__: [_encode(item, directory, parts) for item in value]}
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return {'value': value}
+    raise TypeError(f"Cannot snapshot a {type(value).__name__}")
+
+def _decode(node, directory):
+    if 'frame' in node:
+        return _read_table(os.path.join(directory, node['frame'])).to_pandas(split_blocks=True)
+    if 'array' in node:
+        return _read_table(os.path.join(directory, node['array'])).column(0).to_numpy().reshape(node['shape'])
+    if 'dict' in node:
+        return {key: _decode(item, directory) for key, item in node['dict'].items()}
+    if 'list' in node:
+        return [_decode(item, directory) for item in node['list']]
+    if 'tuple' in node:
+        return tuple(_decode(item, directory) for item in node['tuple'])
+    return node['value']
+
+def _read_table(path):
+    # Buffers of the table point into the read-only mapping (no copy, no parsing)
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+def _latest_version(path):
+    """Name of the newest complete version directory of a snapshot"""
+    versions = sorted(entry for entry in os.listdir(path) if entry.startswith('v'))
+    if not versions:
+        raise FileNotFoundError(f"No snapshot in {path}")
+    return versions[-1]
+
+def write_snapshot(path, value, published_at=None):
+    """
+    Publish value as a new version of the snapshot at path.
+
+    A version is a directory of Arrow IPC (Feather v2, uncompressed) files - one per
+    DataFrame or numpy array in value - and a JSON manifest holding the rest of it
+    (dicts with string keys, lists, tuples, scalars). It is written under a temporary
+    name and renamed into place, then versions older than SNAPSHOT_VERSIONS_KEPT are
+    removed; nothing in it is ever unpickled or executed by the readers.
+
+    Args:
+        path: Snapshot directory, inside a directory checked by ensure_private_directory
+        value: DataFrames, numpy arrays and JSON scalars nested in dicts/lists/tuples
+        published_at: Timestamp recorded in the manifest (default: now)
+
+    Returns:
+        Size of the version's files in bytes
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    directory = tempfile.mkdtemp(dir=path, prefix='.tmp-')
+    try:
+        parts = []
+        manifest = {'published_at': published_at or time.time(), 'value': _encode(value, directory, parts)}
+        data = json.dumps(manifest).encode('utf-8')
+        with open(os.path.join(directory, 'manifest.json'), 'wb') as f:
+            f.write(data)
+        os.rename(directory, os.path.join(path, f'v{time.time_ns():020d}'))
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    versions = sorted(entry for entry in os.listdir(path) if entry.startswith('v'))
+    for version in versions[:-SNAPSHOT_VERSIONS_KEPT]:
+        # Readers that already mapped its files keep them until they drop the mapping
+        shutil.rmtree(os.path.join(path, version), ignore_errors=True)
+    return len(data) + sum(parts)
+
+def _read_manifest(directory):
+    with open(os.path.join(directory, 'manifest.json'), 'rb') as f:
+        return json.loads(f.read())
+
+def read_snapshot_header(path):
+    """published_at of the latest version of a snapshot, without loading it"""
+    return _read_manifest(os.path.join(path, _latest_version(path)))['published_at']
+
+def read_snapshot(path):
+    """
+    Map the latest version of a snapshot read-only and rebuild its value. Numeric
+    columns and arrays are read-only views of the mapped files, so every worker reading
+    the same version shares one copy of them; string columns are built per worker.
+
+    Returns:
+        (value, info) - info holds published_at, bytes and the identity (version name)
+    """
+    for attempt in range(3):
+        version = _latest_version(path)
+        directory = os.path.join(path, version)
+        try:
+            manifest = _read_manifest(directory)
+            value = _decode(manifest['value'], directory)
+        except FileNotFoundError:
+            # Removed by the writer between listing and opening: a newer version exists
+            if attempt == 2:
+                raise
+            continue
+        size = sum(entry.stat().st_size for entry in os.scandir(directory))
+        return value, {'published_at': manifest['published_at'], 'bytes': size, 'identity': version}
+
+class SharedSnapshotTier:
+    def __init__(self, cache_manager, refresh_scheduler, directory=SHARED_CACHE_DIR):
+        self.cache_manager = cache_manager
+        self.refresh_scheduler = refresh_scheduler
+        self.directory = directory
+        self.role = None       # 'leader' or 'follower' once started
+        self.lock_file = None
+        self.task = None
+        self.published = {}   # dataset name -> last published value (an unchanged object is not republished)
+        self.loaded = {}      # dataset name -> version of the snapshot it was loaded from
+        self.tier_stats = {
+            'elections_won': 0,
+            'published': 0,
+            'publish_seconds_total': 0.0,
+            'loaded': 0,
+            'load_seconds_total': 0.0,
+            'snapshot_bytes': {},
+        }
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _jobs(self):
+        return self.refresh_scheduler.jobs
+
+    def _try_lead(self):
+        """Take the leader lock without blocking; True if this process holds it"""
+        if self.lock_file is None:
+            ensure_private_directory(self.directory)
+            self.lock_file = open(os.path.join(self.directory, 'leader.lock'), 'a+')
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    async def start(self):
+        """
+        Become the leader (start the refresher, publish its datasets) or a follower (load
+        the leader's snapshots). Register the refresher's datasets before calling this.
+        """
+        if self._try_lead():
+            await self._lead(warm=True)
+            return
+
+        self.role = 'follower'
+        for job in self._jobs():
+            self.cache_manager.set_loader(job['func'], self._loader(job))
+        print(f"🔗 Worker {os.getpid()} following shared L1 snapshots in {self.directory}")
+        await self._load_changed()
+        self.task = asyncio.create_task(self._follow())
+
+    async def _lead(self, warm):
+        self.role = 'leader'
+        self.tier_stats['elections_won'] += 1
+        for job in self._jobs():
+            self.cache_manager.set_loader(job['func'], None)
+        self.refresh_scheduler.add_listener(self._publish)
+        print(f"👑 Worker {os.getpid()} leads: fetching L1 data and publishing snapshots to {self.directory}")
+        await self.refresh_scheduler.start(warm=warm)
+
+    async def _publish(self, fetch_func, data):
+        """Refresh listener on the leader: write the dataset's snapshot for the followers"""
+        name = fetch_func.__name__
+        if self.published.get(name) is data:
+            return
+        start = time.monotonic()
+        size = await asyncio.to_thread(write_snapshot, self._path(name), data)
+        self.published[name] = data
+        self.tier_stats['published'] += 1
+        self.tier_stats['publish_seconds_total'] += time.monotonic() - start
+        self.tier_stats['snapshot_bytes'][name] = size
+
+    def _loader(self, job):
+        """cache_manager loader of one dataset on a follower: its latest fresh snapshot"""
+        async def load():
+            return await self._load(job)
+        return load
+
+    def _is_fresh(self, job, published_at):
+        return time.time() - published_at < job['stale_after_seconds']
+
+    async def _load(self, job):
+        name = job['func'].__name__
+        path = self._path(name)
+        deadline = time.monotonic() + SNAPSHOT_WAIT_SECONDS
+        while True:
+            # Snapshots left over from an earlier run are older than the stale limit and ignored
+            try:
+                fresh = self._is_fresh(job, await asyncio.to_thread(read_snapshot_header, path))
+            except (OSError, ValueError, KeyError):
+                fresh = False
+            if fresh:
+                break
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"No fresh shared snapshot of {name} in {self.directory}")
+            await asyncio.sleep(FOLLOW_INTERVAL_SECONDS)
+
+        start = time.monotonic()
+        data, info = await asyncio.to_thread(read_snapshot, path)
+        self.loaded[name] = info['identity']
+        self.tier_stats['loaded'] += 1
+        self.tier_stats['load_seconds_total'] += time.monotonic() - start
+        self.tier_stats['snapshot_bytes'][name] = info['bytes']
+        return data
+
+    async def _load_changed(self):
+        """Load every dataset with a snapshot version newer than the one it was loaded from"""
+        for job in self._jobs():
+            name = job['func'].__name__
+            try:
+                if _latest_version(self._path(name)) == self.loaded.get(name):
+                    continue
+                if not self._is_fresh(job, read_snapshot_header(self._path(name))):
+                    continue
+                await self.cache_manager.refresh(job['func'])
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                print(f"❌ ERROR loading the shared snapshot of {name}: {e}")
+
+    async def _follow(self):
+        last_election = time.monotonic()
+        while True:
+            await asyncio.sleep(FOLLOW_INTERVAL_SECONDS)
+            if time.monotonic() - last_election >= ELECTION_INTERVAL_SECONDS:
+                last_election = time.monotonic()
+                if self._try_lead():
+                    # The previous leader is gone: refresh from Postgres from now on
+                    self.task = None
+                    await self._lead(warm=False)
+                    return
+            await self._load_changed()
+
+    async def stop(self):
+        """Stop following and give up the leader lock"""
+        if self.task is not None:
+            task, self.task = self.task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.refresh_scheduler.remove_listener(self._publish)
+        if self.lock_file is not None:
+            self.lock_file.close()  # Releases the flock
+            self.lock_file = None
+        self.role = None
+
+    def stats(self):
+        return {'enabled': SHARED_CACHE_ENABLED, 'role': self.role, 'directory': self.directory,
+                'pid': os.getpid(), **self.tier_stats}
+
+
+# Global snapshot tier instance
+shared_cache = SharedSnapshotTier(cache_manager, refresh_scheduler)